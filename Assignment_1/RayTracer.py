@@ -1,6 +1,13 @@
+import argparse
+import os
+import sys
 import numpy as np
 from PIL import Image
 
+# The scene loader is shared by the renderers through the repository's common/ package.
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+from common import scene_file
+
 CANVAS_WIDTH = 500
 CANVAS_HEIGHT = 500
 VIEWPORT_WIDTH = 1
@@ -70,18 +77,37 @@ def trace_ray(origin, direction, t_min, t_max, spheres):
         return BACKGROUND_COLOR
     return closest_sphere.color
 
-def render_scene():
+def load_scene(path):
+    # Spheres and camera position from a scene file; canvas settings it gives replace the defaults above.
+    global CANVAS_WIDTH, CANVAS_HEIGHT, VIEWPORT_WIDTH, VIEWPORT_HEIGHT, PROJECTION_PLANE_D, BACKGROUND_COLOR
+    scene = scene_file.load(path)
+    (CANVAS_WIDTH, CANVAS_HEIGHT, VIEWPORT_WIDTH, VIEWPORT_HEIGHT, PROJECTION_PLANE_D, BACKGROUND_COLOR,
+     position) = scene_file.whitted_view(scene, CANVAS_WIDTH, CANVAS_HEIGHT, BACKGROUND_COLOR)
+    spheres = []
+    for obj in scene_file.supported(scene, ("sphere",), "Assignment_1"):
+        color, specular, reflective = scene_file.whitted_material(obj["material"])
+        spheres.append(Sphere(Vector3(*obj["center"]), obj["radius"], color))
+    return spheres, Vector3(*position)
+
+def render_scene(scene_path=None):
+    if scene_path is not None:
+        spheres, origin = load_scene(scene_path)
+    else:
+        spheres, origin = default_scene()
+    render(spheres, origin)
+
+def default_scene():
     spheres = [
         Sphere(Vector3(0, -1, 3), 1, (255, 0, 0)),  # Red sphere
         Sphere(Vector3(2, 0, 4), 1, (0, 0, 255)),  # Blue sphere
         Sphere(Vector3(-2, 0, 4), 1, (0, 255, 0))   # Green sphere
     ]
+    return spheres, Vector3(0, 0, 0)
 
+def render(spheres, origin):
     image = Image.new("RGB", (CANVAS_WIDTH, CANVAS_HEIGHT), BACKGROUND_COLOR)
     pixels = image.load()
 
-    origin = Vector3(0, 0, 0)
-
     for x in range(-CANVAS_WIDTH // 2, CANVAS_WIDTH // 2):
         for y in range(-CANVAS_HEIGHT // 2, CANVAS_HEIGHT // 2):
             direction = canvas_to_viewport(x, y)
@@ -93,4 +119,7 @@ def render_scene():
     image.save("raytraced_scene.png")
 
 if __name__ == "__main__":
-    render_scene()
+    parser = argparse.ArgumentParser(description="Render the three-sphere scene.")
+    parser.add_argument("--scene", default=None, help="render a scene file (see scenes/) instead of the built-in scene")
+    args = parser.parse_args()
+    render_scene(args.scene)
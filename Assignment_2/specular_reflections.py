@@ -1,6 +1,13 @@
+import argparse
+import os
+import sys
 import numpy as np
 from PIL import Image
 
+# The scene loader is shared by the renderers through the repository's common/ package.
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+from common import scene_file
+
 CANVAS_WIDTH = 1500
 CANVAS_HEIGHT = 1500
 VIEWPORT_WIDTH = 1
@@ -132,8 +139,34 @@ def computeLighting(P, N, V, s, lights):
 
 
 
-def render_scene():
-
+def load_scene(path):
+    # Spheres, lights and camera position from a scene file; canvas settings it gives replace the defaults above.
+    global CANVAS_WIDTH, CANVAS_HEIGHT, VIEWPORT_WIDTH, VIEWPORT_HEIGHT, PROJECTION_PLANE_D, BACKGROUND_COLOR
+    scene = scene_file.load(path)
+    (CANVAS_WIDTH, CANVAS_HEIGHT, VIEWPORT_WIDTH, VIEWPORT_HEIGHT, PROJECTION_PLANE_D, BACKGROUND_COLOR,
+     position) = scene_file.whitted_view(scene, CANVAS_WIDTH, CANVAS_HEIGHT, BACKGROUND_COLOR)
+    spheres = []
+    for obj in scene_file.supported(scene, ("sphere",), "Assignment_2"):
+        color, specular, reflective = scene_file.whitted_material(obj["material"])
+        spheres.append(Sphere(Vector3(*obj["center"]), obj["radius"], color, specular))
+    return spheres, load_lights(scene), Vector3(*position)
+
+def load_lights(scene):
+    lights = []
+    for light in scene["lights"]:
+        position = Vector3(*light["position"]) if "position" in light else None
+        direction = Vector3(*light["direction"]) if "direction" in light else None
+        lights.append(Light(light["type"], light["intensity"], position, direction))
+    return lights
+
+def render_scene(scene_path=None):
+    if scene_path is not None:
+        spheres, lights, origin = load_scene(scene_path)
+    else:
+        spheres, lights, origin = default_scene()
+    render(spheres, lights, origin)
+
+def default_scene():
     lights = [
         Light("ambient", 0.2),
         Light("point", 0.6, Vector3(2, 1, 0)),
@@ -147,12 +180,12 @@ def render_scene():
         Sphere(Vector3(-2, 0, 4), 1, (0, 255, 0), 10),   # Green sphere
         Sphere(Vector3(0, -5001, 0), 5000, (255, 255, 0), 1000) # Yellow Sphere 
     ]
+    return spheres, lights, Vector3(0, 0, 0)
 
+def render(spheres, lights, origin):
     image = Image.new("RGB", (CANVAS_WIDTH, CANVAS_HEIGHT), BACKGROUND_COLOR)
     pixels = image.load()
 
-    origin = Vector3(0, 0, 0)
-
     for x in range(-CANVAS_WIDTH // 2, CANVAS_WIDTH // 2):
         for y in range(-CANVAS_HEIGHT // 2, CANVAS_HEIGHT // 2):
             direction = canvas_to_viewport(x, y)
@@ -164,4 +197,7 @@ def render_scene():
     image.save("raytraced_scene.png")
 
 if __name__ == "__main__":
-    render_scene()
+    parser = argparse.ArgumentParser(description="Render the specular reflection scene.")
+    parser.add_argument("--scene", default=None, help="render a scene file (see scenes/) instead of the built-in scene")
+    args = parser.parse_args()
+    render_scene(args.scene)
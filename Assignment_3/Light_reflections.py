@@ -1,6 +1,13 @@
+import argparse
+import os
+import sys
 import numpy as np
 from PIL import Image
 
+# The scene loader is shared by the renderers through the repository's common/ package.
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+from common import scene_file
+
 CANVAS_WIDTH = 1000
 CANVAS_HEIGHT = 1000
 VIEWPORT_WIDTH = 1
@@ -14,6 +21,8 @@ class Light:
         self.intensity = intensity
         self.position = position
         self.direction = direction
+        # The sphere that last blocked a shadow ray towards this light; see occluded.
+        self.last_occluder = None
 
 class Vector3:
     def __init__(self, x, y, z):
@@ -98,8 +107,7 @@ def computeLighting(P, N, V, s, lights, spheres):
             t_max = np.inf
 
         if L is not None:
-            shadow_sphere, shadow_t = ClosestIntersection(P, L, 0.001, t_max, spheres)
-            if shadow_sphere is not None:
+            if occluded(P, L, t_max, spheres, light):
                 continue
 
             L = L.normalize()
@@ -116,6 +124,37 @@ def computeLighting(P, N, V, s, lights, spheres):
 
     return i
 
+def occludes_sphere(origin, direction, sphere, t_min, t_max):
+    # Whether either root of intersect_ray_sphere lies in [t_min > 0, t_max], in the same arithmetic.
+    # A sphere behind an origin outside it (both roots negative) needs no square root.
+    CO = origin - sphere.center
+    a = direction.dot(direction)
+    b = 2 * CO.dot(direction)
+    c = CO.dot(CO) - sphere.radius ** 2
+    if b > 0 and c > 0:
+        return False
+    discriminant = b ** 2 - 4 * a * c
+    if discriminant < 0:
+        return False
+    root = np.sqrt(discriminant)
+    if t_min <= (-b - root) / (2 * a) <= t_max:
+        return True
+    return t_min <= (-b + root) / (2 * a) <= t_max
+
+def occluded(P, L, t_max, spheres, light=None):
+    # Whether any sphere meets the shadow ray P + t L for t in [0.001, t_max]. Unlike
+    # ClosestIntersection it stops at the first sphere found, and it tries the sphere that last
+    # shadowed `light` first, since neighbouring points are usually shadowed by the same one.
+    last = light.last_occluder if light is not None else None
+    if last is not None and occludes_sphere(P, L, last, 0.001, t_max):
+        return True
+    for sphere in spheres:
+        if sphere is not last and occludes_sphere(P, L, sphere, 0.001, t_max):
+            if light is not None:
+                light.last_occluder = sphere
+            return True
+    return False
+
 def ClosestIntersection(origin, direction, t_min, t_max, spheres):
     closest_t = np.inf
     closest_sphere = None
@@ -159,7 +198,34 @@ def trace_ray(origin, direction, t_min, t_max, spheres, lights, recursion_depth)
     return final_color
 
 
-def render_scene():
+def load_scene(path):
+    # Spheres, lights and camera position from a scene file; canvas settings it gives replace the defaults above.
+    global CANVAS_WIDTH, CANVAS_HEIGHT, VIEWPORT_WIDTH, VIEWPORT_HEIGHT, PROJECTION_PLANE_D, BACKGROUND_COLOR
+    scene = scene_file.load(path)
+    (CANVAS_WIDTH, CANVAS_HEIGHT, VIEWPORT_WIDTH, VIEWPORT_HEIGHT, PROJECTION_PLANE_D, BACKGROUND_COLOR,
+     position) = scene_file.whitted_view(scene, CANVAS_WIDTH, CANVAS_HEIGHT, BACKGROUND_COLOR)
+    spheres = []
+    for obj in scene_file.supported(scene, ("sphere",), "Assignment_3"):
+        color, specular, reflective = scene_file.whitted_material(obj["material"])
+        spheres.append(Sphere(Vector3(*obj["center"]), obj["radius"], color, specular, reflective))
+    return spheres, load_lights(scene), Vector3(*position)
+
+def load_lights(scene):
+    lights = []
+    for light in scene["lights"]:
+        position = Vector3(*light["position"]) if "position" in light else None
+        direction = Vector3(*light["direction"]) if "direction" in light else None
+        lights.append(Light(light["type"], light["intensity"], position, direction))
+    return lights
+
+def render_scene(scene_path=None):
+    if scene_path is not None:
+        spheres, lights, origin = load_scene(scene_path)
+    else:
+        spheres, lights, origin = default_scene()
+    render(spheres, lights, origin)
+
+def default_scene():
     lights = [
         Light("ambient", 0.2),
         Light("point", 0.6, position=Vector3(2, 1, 0)),
@@ -172,12 +238,12 @@ def render_scene():
         Sphere(Vector3(-2, 0, 4), 1, (0, 255, 0), 10, 0.2),   # Green sphere
         Sphere(Vector3(0, -5001, 0), 5000, (255, 255, 0), 1000, 0)  # Yellow Sphere
     ]
+    return spheres, lights, Vector3(0, 0, 0)
 
+def render(spheres, lights, origin):
     image = Image.new("RGB", (CANVAS_WIDTH, CANVAS_HEIGHT), BACKGROUND_COLOR)
     pixels = image.load()
 
-    origin = Vector3(0, 0, 0)
-
     for x in range(-CANVAS_WIDTH // 2, CANVAS_WIDTH // 2):
         for y in range(-CANVAS_HEIGHT // 2, CANVAS_HEIGHT // 2):
             direction = canvas_to_viewport(x, y)
@@ -189,4 +255,7 @@ def render_scene():
     image.save("raytraced_scene.png")
 
 if __name__ == "__main__":
-    render_scene()
+    parser = argparse.ArgumentParser(description="Render the shadows and reflections scene.")
+    parser.add_argument("--scene", default=None, help="render a scene file (see scenes/) instead of the built-in scene")
+    args = parser.parse_args()
+    render_scene(args.scene)
@@ -1,6 +1,20 @@
+import argparse
+import functools
+import os
+import queue
+import sys
 import numpy as np
-from PIL import Image
 import multiprocessing as mp
+import multiprocessing.pool
+from multiprocessing import shared_memory
+
+# Scene loading, profiling and PNG output are shared by the renderers through the
+# repository's common/ package.
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+from common import instrument, png_stream, scene_file
+import jit
+import mesh_bvh
+import obj_loader
 
 CANVAS_WIDTH = 1500
 CANVAS_HEIGHT = 1500
@@ -8,6 +22,7 @@ VIEWPORT_WIDTH = 1
 VIEWPORT_HEIGHT = 1
 PROJECTION_PLANE_D = 1
 BACKGROUND_COLOR = (0, 0, 0)
+RECURSION_DEPTH = 1
 
 class Light:
     def __init__(self, type, intensity, position=None, direction=None):
@@ -15,6 +30,8 @@ class Light:
         self.intensity = intensity
         self.position = position
         self.direction = direction
+        # The object that last blocked a shadow ray towards this light; see occluded.
+        self.last_occluder = None
 
 class Vector3:
     def __init__(self, x, y, z):
@@ -67,11 +84,255 @@ class Cylinder:
         self.reflective = reflective
 
 class Triangle:
-    def __init__(self, v0, v1, v2, color):
+    def __init__(self, v0, v1, v2, color, specular=-1, reflective=0):
         self.v0 = v0
         self.v1 = v1
         self.v2 = v2
         self.color = color
+        self.specular = specular
+        self.reflective = reflective
+
+class TriangleMesh:
+    # An indexed triangle mesh tested as one object: vertices (n, 3) and faces (t, 3) rows of
+    # vertex indices. Edges and face normals are computed once, here. With smooth, the normal at
+    # a hit is interpolated from corner_normals (t, 3, 3): the OBJ's vn normals, or by default
+    # the area-weighted average of the faces around each vertex. A MeshBVH over the faces (index,
+    # or one built here with leaf_size) limits every ray to the triangles of the leaves it crosses.
+    # Rays per batch in intersect.
+    BATCH_RAYS = 1 << 14
+
+    def __init__(self, vertices, faces, color, specular=-1, reflective=0, corner_normals=None, smooth=False,
+                 index=None, leaf_size=mesh_bvh.LEAF_SIZE):
+        self.vertices = np.asarray(vertices, dtype=np.float64)
+        self.faces = np.asarray(faces, dtype=np.int64)
+        self.color = color
+        self.specular = specular
+        self.reflective = reflective
+        self.smooth = smooth
+        v0, v1, v2 = (self.vertices[self.faces[:, k]] for k in range(3))
+        # (3, t) rows, so every component is one contiguous array.
+        self.v0 = np.ascontiguousarray(v0.T)
+        self.edge1 = np.ascontiguousarray((v1 - v0).T)
+        self.edge2 = np.ascontiguousarray((v2 - v0).T)
+        e1x, e1y, e1z = self.edge1
+        e2x, e2y, e2z = self.edge2
+        cross = np.stack([e1y * e2z - e1z * e2y, e1z * e2x - e1x * e2z, e1x * e2y - e1y * e2x], axis=1)
+        self.face_normals = normalize_rows(cross)
+        self.corner_normals = None
+        if smooth:
+            if corner_normals is None:
+                # Unnormalized cross products weight every face by its area.
+                vertex_normals = np.zeros_like(self.vertices)
+                for k in range(3):
+                    np.add.at(vertex_normals, self.faces[:, k], cross)
+                corner_normals = normalize_rows(vertex_normals)[self.faces]
+            self.corner_normals = np.asarray(corner_normals, dtype=np.float64)
+        lo, hi = mesh_bvh.triangle_bounds(self.vertices, self.faces)
+        self.index = index if index is not None else mesh_bvh.build(lo, hi, leaf_size)
+        self.node_bounds = mesh_bvh.refit(self.index, lo, hi)
+        # The tree and triangles as Python lists for hit, made on its first call.
+        self.lists = None
+
+    def intersect(self, origins, directions, t_min_val, t_max):
+        # Moller-Trumbore for rays (n, 3), in the same arithmetic as intersect_ray_triangle.
+        # Returns the nearest t in [t_min_val, t_max] of every ray (inf on a miss), the triangle
+        # hit (-1 on a miss) and its barycentric u and v. The rays walk the tree a level at a
+        # time, as arrays of (ray, node) pairs: every step box-tests all pairs at once, moves the
+        # survivors at interior nodes to both children and tests those at leaves against every
+        # triangle of their leaf.
+        n = len(origins)
+        best_t = np.full(n, np.inf)
+        best = np.full(n, -1)
+        best_u = np.zeros(n)
+        best_v = np.zeros(n)
+        with np.errstate(divide="ignore"):
+            # A huge finite value instead of inf avoids 0 * inf = nan in the slab test.
+            inverse = np.where(directions != 0, 1.0 / directions, 1e300)
+        index = self.index
+        leaves = index.node_right == 0
+        leaf_size = int((index.node_end - index.node_start)[leaves].max()) if leaves.any() else 0
+        tested = visited = 0
+        for r0 in range(0, n if len(self.node_bounds) else 0, self.BATCH_RAYS):
+            rays = np.arange(r0, min(r0 + self.BATCH_RAYS, n))
+            nodes = np.zeros(len(rays), dtype=np.int64)
+            while len(rays):
+                visited += len(rays)
+                box = self.node_bounds[nodes]
+                t0 = (box[:, :3] - origins[rays]) * inverse[rays]
+                t1 = (box[:, 3:] - origins[rays]) * inverse[rays]
+                near = np.maximum(np.minimum(t0, t1).max(axis=1), t_min_val)
+                far = np.minimum(np.maximum(t0, t1).min(axis=1), np.minimum(best_t[rays], t_max))
+                rays, nodes = rays[near <= far], nodes[near <= far]
+                right = index.node_right[nodes]
+                leaf = right == 0
+                pair_rays, slots = rays[leaf], index.node_start[nodes[leaf]]
+                ends = index.node_end[nodes[leaf]]
+                # Every pair at a leaf against the leaf's k-th triangle, for every k.
+                pair_rays = np.repeat(pair_rays, leaf_size)
+                slots = (slots[:, None] + np.arange(leaf_size)).ravel()
+                inside = slots < np.repeat(ends, leaf_size)
+                pair_rays, faces = pair_rays[inside], index.order[slots[inside]]
+                tested += len(faces)
+                t, u, v = moller_trumbore_pairs(origins[pair_rays], directions[pair_rays], self.v0[:, faces],
+                                                self.edge1[:, faces], self.edge2[:, faces], t_min_val, t_max)
+                # The nearest hit of every ray in this step, the lowest face of equal hits, as in
+                # the per-object loop; it replaces the ray's best unless that is nearer.
+                first = np.lexsort((faces, t, pair_rays))
+                first = first[np.isfinite(t[first])]
+                hit_rays = pair_rays[first]
+                lowest = np.ones(len(first), dtype=bool)
+                lowest[1:] = hit_rays[1:] != hit_rays[:-1]
+                first, hit_rays = first[lowest], hit_rays[lowest]
+                better = (t[first] < best_t[hit_rays]) | ((t[first] == best_t[hit_rays])
+                                                         & (faces[first] < best[hit_rays]))
+                first, hit_rays = first[better], hit_rays[better]
+                best_t[hit_rays] = t[first]
+                best[hit_rays] = faces[first]
+                best_u[hit_rays] = u[first]
+                best_v[hit_rays] = v[first]
+                rays = np.repeat(rays[~leaf], 2)
+                nodes = np.stack([nodes[~leaf] + 1, right[~leaf]], axis=1).ravel()
+        if instrument.ENABLED:
+            instrument.count("ray-triangle tests", tested)
+            instrument.count("mesh BVH node tests", visited)
+        return best_t, best, best_u, best_v
+
+    def normal(self, index, u, v):
+        if not self.smooth:
+            return Vector3(*self.face_normals[index].tolist())
+        n0, n1, n2 = self.corner_normals[index].tolist()
+        w = 1.0 - u - v
+        return Vector3(*(w * a + u * b + v * c for a, b, c in zip(n0, n1, n2))).normalize()
+
+    def make_lists(self):
+        # Node arrays and the triangles in leaf order, as lists of Python floats and ints.
+        order = self.index.order
+        triangles = [row[order].tolist() for row in (*self.v0, *self.edge1, *self.edge2)]
+        return (self.node_bounds.ravel().tolist(), self.index.node_start.tolist(), self.index.node_end.tolist(),
+                self.index.node_right.tolist(), self.index.node_axis.tolist(), order.tolist(), *triangles)
+
+    def hit(self, origin, direction, t_min_val, t_max, any_hit=False):
+        # (t, normal) of the nearest hit of one ray, or (inf, None): intersect for a single ray,
+        # in plain Python floats, as a NumPy call costs more than a leaf's triangle tests. The
+        # nearer child is visited first, as in Project 1's BVH.hit. With any_hit, the first
+        # triangle found in range ends the walk and no normal is computed, which is all a
+        # shadow ray needs.
+        if self.lists is None:
+            self.lists = self.make_lists()
+        (bounds, node_start, node_end, node_right, node_axis, faces,
+         v0x, v0y, v0z, e1x, e1y, e1z, e2x, e2y, e2z) = self.lists
+        EPSILON = 1e-6
+        ox, oy, oz = origin.x, origin.y, origin.z
+        dx, dy, dz = direction.x, direction.y, direction.z
+        ix = 1.0 / dx if dx != 0 else 1e300
+        iy = 1.0 / dy if dy != 0 else 1e300
+        iz = 1.0 / dz if dz != 0 else 1e300
+        # Offsets (0 = min, 3 = max) of the near slab per axis.
+        nx = 3 if ix < 0 else 0
+        ny = 4 if iy < 0 else 1
+        nz = 5 if iz < 0 else 2
+        fx, fy, fz = 3 - nx, 5 - ny, 7 - nz
+        negative = (ix < 0, iy < 0, iz < 0)
+        best_t = float('inf')
+        best = -1
+        best_u = best_v = 0.0
+        closest = t_max
+        nodes = tested = 0
+        stack = [0] if bounds else []
+        while stack:
+            node = stack.pop()
+            nodes += 1
+            b = node * 6
+            t0 = (bounds[b + nx] - ox) * ix
+            t1 = (bounds[b + fx] - ox) * ix
+            ty0 = (bounds[b + ny] - oy) * iy
+            ty1 = (bounds[b + fy] - oy) * iy
+            if ty0 > t0: t0 = ty0
+            if ty1 < t1: t1 = ty1
+            tz0 = (bounds[b + nz] - oz) * iz
+            tz1 = (bounds[b + fz] - oz) * iz
+            if tz0 > t0: t0 = tz0
+            if tz1 < t1: t1 = tz1
+            if t0 < t_min_val: t0 = t_min_val
+            if t1 > closest: t1 = closest
+            if t0 > t1:
+                continue
+            right = node_right[node]
+            if right:
+                # Push the far child first so the near child is visited first.
+                if negative[node_axis[node]]:
+                    stack.append(node + 1)
+                    stack.append(right)
+                else:
+                    stack.append(right)
+                    stack.append(node + 1)
+                continue
+            tested += node_end[node] - node_start[node]
+            for k in range(node_start[node], node_end[node]):
+                hx = dy * e2z[k] - dz * e2y[k]
+                hy = dz * e2x[k] - dx * e2z[k]
+                hz = dx * e2y[k] - dy * e2x[k]
+                a = e1x[k] * hx + e1y[k] * hy + e1z[k] * hz
+                if abs(a) < EPSILON:
+                    continue
+                f = 1.0 / a
+                sx, sy, sz = ox - v0x[k], oy - v0y[k], oz - v0z[k]
+                u = f * (sx * hx + sy * hy + sz * hz)
+                if u < 0.0 or u > 1.0:
+                    continue
+                qx = sy * e1z[k] - sz * e1y[k]
+                qy = sz * e1x[k] - sx * e1z[k]
+                qz = sx * e1y[k] - sy * e1x[k]
+                v = f * (dx * qx + dy * qy + dz * qz)
+                if v < 0.0 or u + v > 1.0:
+                    continue
+                t = f * (e2x[k] * qx + e2y[k] * qy + e2z[k] * qz)
+                if t > EPSILON and t_min_val <= t <= closest and (t < best_t or faces[k] < best):
+                    best_t, best, best_u, best_v = t, faces[k], u, v
+                    closest = t
+                    if any_hit:
+                        stack.clear()
+                        break
+        if instrument.ENABLED:
+            instrument.count("ray-triangle tests", tested)
+            instrument.count("mesh BVH node tests", nodes)
+        if best < 0:
+            return float('inf'), None
+        if any_hit:
+            return best_t, None
+        return best_t, self.normal(best, best_u, best_v)
+
+def moller_trumbore_pairs(origins, directions, v0, edge1, edge2, t_min_val, t_max):
+    # (t, u, v) of rays (k, 3) against triangles given as (3, k) component rows, pair by pair;
+    # t is inf where the ray misses its triangle or the hit is outside [t_min_val, t_max].
+    EPSILON = 1e-6
+    ox, oy, oz = origins.T
+    dx, dy, dz = directions.T
+    v0x, v0y, v0z = v0
+    e1x, e1y, e1z = edge1
+    e2x, e2y, e2z = edge2
+    hx = dy * e2z - dz * e2y
+    hy = dz * e2x - dx * e2z
+    hz = dx * e2y - dy * e2x
+    a = e1x * hx + e1y * hy + e1z * hz
+    with np.errstate(divide="ignore", invalid="ignore"):
+        f = 1.0 / a
+        sx, sy, sz = ox - v0x, oy - v0y, oz - v0z
+        u = f * (sx * hx + sy * hy + sz * hz)
+        qx = sy * e1z - sz * e1y
+        qy = sz * e1x - sx * e1z
+        qz = sx * e1y - sy * e1x
+        v = f * (dx * qx + dy * qy + dz * qz)
+        t = f * (e2x * qx + e2y * qy + e2z * qz)
+        hit = ((np.abs(a) >= EPSILON) & (u >= 0.0) & (u <= 1.0) & (v >= 0.0) & (u + v <= 1.0)
+               & (t > EPSILON) & (t >= t_min_val) & (t <= t_max))
+    return np.where(hit, t, np.inf), u, v
+
+def normalize_rows(vectors):
+    # Vector3.normalize for every row: unit length, zero rows stay zero.
+    length = np.sqrt(vectors[:, 0] ** 2 + vectors[:, 1] ** 2 + vectors[:, 2] ** 2)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.where(length[:, None] > 0, vectors / length[:, None], 0.0)
 
 def canvas_to_viewport(x, y):
     return Vector3(x * VIEWPORT_WIDTH / CANVAS_WIDTH,
@@ -150,6 +411,77 @@ def intersect_ray_triangle(origin, direction, triangle):
         return t
     return float('inf')
 
+def occludes_sphere(origin, direction, sphere, t_min_val, t_max):
+    # Whether either root of intersect_ray_sphere lies in [t_min_val > 0, t_max], in the same
+    # arithmetic. A sphere behind an origin outside it (both roots negative) needs no square root.
+    CO = origin - sphere.center
+    a = direction.dot(direction)
+    b = 2 * CO.dot(direction)
+    c = CO.dot(CO) - sphere.radius ** 2
+    if b > 0 and c > 0:
+        return False
+    discriminant = b ** 2 - 4 * a * c
+    if discriminant < 0:
+        return False
+    root = np.sqrt(discriminant)
+    if t_min_val <= (-b - root) / (2 * a) <= t_max:
+        return True
+    return t_min_val <= (-b + root) / (2 * a) <= t_max
+
+def occludes_cylinder(origin, direction, cylinder, t_min_val, t_max):
+    # intersect_ray_cylinder without its normals: whether the nearest surface point ahead of the
+    # origin lies in [t_min_val, t_max]. As in ClosestIntersection, only the nearest point counts,
+    # so a hit closer than t_min_val (the surface the ray starts on) hides the farther ones.
+    Ox, Oy, Oz = origin.x, origin.y, origin.z
+    Dx, Dy, Dz = direction.x, direction.y, direction.z
+    Cx, Cy, Cz = cylinder.center.x, cylinder.center.y, cylinder.center.z
+    r = cylinder.radius
+    h = cylinder.height
+    nearest = np.inf
+    A = Dx**2 + Dz**2
+    B = 2 * ((Ox - Cx) * Dx + (Oz - Cz) * Dz)
+    C_val = (Ox - Cx)**2 + (Oz - Cz)**2 - r**2
+    discriminant = B**2 - 4 * A * C_val
+    if A != 0 and discriminant >= 0:
+        sqrt_disc = np.sqrt(discriminant)
+        for t in ((-B - sqrt_disc) / (2 * A), (-B + sqrt_disc) / (2 * A)):
+            if 0 < t < nearest and Cy - h/2 <= Oy + Dy * t <= Cy + h/2:
+                nearest = t
+    if Dy != 0:
+        for cap_y in (Cy + h/2, Cy - h/2):
+            t_cap = (cap_y - Oy) / Dy
+            if 0 < t_cap < nearest and (Ox + Dx * t_cap - Cx)**2 + (Oz + Dz * t_cap - Cz)**2 <= r**2:
+                nearest = t_cap
+    # A miss leaves nearest at inf, which ClosestIntersection never takes even when t_max is inf.
+    return t_min_val <= nearest <= t_max and nearest < np.inf
+
+def occludes(obj, origin, direction, t_min_val, t_max):
+    # The any-hit test of one object: whether ClosestIntersection would find it in range.
+    if isinstance(obj, Sphere):
+        return occludes_sphere(origin, direction, obj, t_min_val, t_max)
+    if isinstance(obj, Cylinder):
+        return occludes_cylinder(origin, direction, obj, t_min_val, t_max)
+    if isinstance(obj, TriangleMesh):
+        return obj.hit(origin, direction, t_min_val, t_max, any_hit=True)[0] < np.inf
+    t = intersect_ray_triangle(origin, direction, obj)
+    return t_min_val <= t <= t_max and t < np.inf
+
+def occluded(P, L, t_max, objects, light=None):
+    # Whether any object meets the shadow ray P + t L for t in [0.001, t_max]. Unlike
+    # ClosestIntersection it stops at the first object found, and it tries the object that last
+    # shadowed `light` first, since neighbouring points are usually shadowed by the same one.
+    last = light.last_occluder if light is not None else None
+    if last is not None and occludes(last, P, L, 0.001, t_max):
+        if instrument.ENABLED:
+            instrument.count("occluder cache hits")
+        return True
+    for obj in objects:
+        if obj is not last and occludes(obj, P, L, 0.001, t_max):
+            if light is not None:
+                light.last_occluder = obj
+            return True
+    return False
+
 def ClosestIntersection(origin, direction, t_min_val, t_max, objects):
     closest_t = np.inf
     closest_obj = None
@@ -179,6 +511,12 @@ def ClosestIntersection(origin, direction, t_min_val, t_max, objects):
                 edge1 = obj.v1 - obj.v0
                 edge2 = obj.v2 - obj.v0
                 closest_normal = edge1.cross(edge2).normalize()
+        elif isinstance(obj, TriangleMesh):
+            t, normal = obj.hit(origin, direction, t_min_val, t_max)
+            if t < closest_t:
+                closest_t = t
+                closest_obj = obj
+                closest_normal = normal
     return closest_obj, closest_t, closest_normal
 
 def reflect_ray(R, N):
@@ -198,8 +536,9 @@ def computeLighting(P, N, V, s, lights, objects):
             L = light.direction
             t_max = np.inf
         if L is not None:
-            shadow_obj, shadow_t, _ = ClosestIntersection(P, L, 0.001, t_max, objects)
-            if shadow_obj is not None:
+            if instrument.ENABLED:
+                instrument.count("shadow rays")
+            if occluded(P, L, t_max, objects, light):
                 continue
             L = L.normalize()
             n_dot_l = N.dot(L)
@@ -214,6 +553,8 @@ def computeLighting(P, N, V, s, lights, objects):
     return i
 
 def trace_ray(origin, direction, t_min_val, t_max, objects, lights, recursion_depth):
+    if instrument.ENABLED:
+        instrument.count(f"rays at depth {RECURSION_DEPTH - recursion_depth}")
     closest_obj, t, normal = ClosestIntersection(origin, direction, t_min_val, t_max, objects)
     if closest_obj is None:
         return BACKGROUND_COLOR
@@ -222,7 +563,7 @@ def trace_ray(origin, direction, t_min_val, t_max, objects, lights, recursion_de
         N = (P - closest_obj.center).normalize()
     elif isinstance(closest_obj, Cylinder):
         N = normal
-    elif isinstance(closest_obj, Triangle):
+    elif isinstance(closest_obj, (Triangle, TriangleMesh)):
         N = normal
     else:
         N = Vector3(0, 0, 0)
@@ -276,36 +617,201 @@ def draw_filled_triangle(tri, canvas):
         for x in range(x_l, x_r + 1):
             canvas.putpixel((x, y), tri.color)
 
-def load_obj(filename, color, specular, reflective, scale=1.0, offset=None):
+def load_obj(filename, color, specular, reflective, scale=1.0, offset=None, use_cache=True, smooth=False,
+             leaf_size=mesh_bvh.LEAF_SIZE):
+    # The model as one TriangleMesh (n-gons fan-split). The indexed mesh comes from obj_loader and
+    # its BVH from mesh_bvh, both cached next to the OBJ file; smooth shading uses its vn normals
+    # when every corner has one.
     if offset is None:
         offset = Vector3(0, 0, 0)
-    vertices = []
-    triangles = []
-    with open(filename, 'r') as f:
-        for line in f:
-            if line.startswith('v '):
-                parts = line.strip().split()
-                x, y, z = map(float, parts[1:4])
-                vertex = Vector3(x * scale + offset.x, y * scale + offset.y, z * scale + offset.z)
-                vertices.append(vertex)
-            elif line.startswith('f '):
-                parts = line.strip().split()
-                indices = []
-                for part in parts[1:]:
-                    idx = int(part.split('/')[0]) - 1
-                    indices.append(idx)
-                for i in range(1, len(indices) - 1):
-                    tri = Triangle(vertices[indices[0]], vertices[indices[i]], vertices[indices[i+1]], color)
-                    triangles.append(tri)
-    return triangles
-
-def compute_pixel(args):
-    x, y, origin, objects, lights = args
-    d = canvas_to_viewport(x, y)
-    col = trace_ray(origin, d, 1, float('inf'), objects, lights, recursion_depth=1)
-    return (x, y, col)
-
-def render_scene():
+    mesh = obj_loader.load(filename, use_cache)
+    index = mesh_bvh.load(filename, mesh, leaf_size, use_cache)
+    corner_normals = None
+    if smooth and len(mesh.faces) and (mesh.face_normals >= 0).all():
+        corner_normals = normalize_rows(mesh.normals)[mesh.face_normals]
+    return TriangleMesh(mesh.vertices * scale + offset.to_tuple(), mesh.faces, color, specular, reflective,
+                        corner_normals, smooth, index)
+
+def render_row(row, origin, objects, lights):
+    # One canvas row (0 at the top) as packed RGB bytes.
+    y = CANVAS_HEIGHT // 2 - 1 - row
+    colors = bytearray(3 * CANVAS_WIDTH)
+    for x in range(-CANVAS_WIDTH // 2, CANVAS_WIDTH // 2):
+        d = canvas_to_viewport(x, y)
+        # On odd canvases the leftmost x wraps round to the last column, as it always has.
+        canvas_x = (x + CANVAS_WIDTH // 2) % CANVAS_WIDTH
+        colors[3 * canvas_x:3 * canvas_x + 3] = trace_ray(origin, d, 1, float('inf'), objects, lights,
+                                                          recursion_depth=RECURSION_DEPTH)
+    return colors
+
+# === SHARED SCENE AND FRAMEBUFFER (for the process pool) ===
+# The parent packs the scene once into shared memory tables, and every pool worker
+# rebuilds its objects from them once, in init_worker, instead of receiving a pickled
+# copy with each task. Workers render bands of BAND_ROWS rows straight into a shared
+# ring of band slots; the parent streams finished bands to the PNG in order and
+# reuses their slots, so only the bands in flight are ever held in memory.
+BAND_ROWS = png_stream.BAND_ROWS
+# Band slots per CPU: enough to keep every worker busy while earlier bands wait for a slow one.
+SLOTS_PER_CPU = 4
+# Object table: kind, geometry (sphere: center, radius; cylinder: center, radius, height;
+# triangle: v0, v1, v2; mesh: first vertex, vertex count, first face, face count, smooth,
+# first corner normal row, first BVH node, node count, leaf size), color, specular and
+# reflective. Meshes keep their vertices, faces, corner normals, BVH nodes (start, end,
+# right child, axis) and leaf orders in five more tables; workers refit the node bounds
+# from the vertices. Light table: kind, intensity and position or direction (NaN when the
+# light has none).
+OBJECT_COLUMNS = 15
+LIGHT_COLUMNS = 5
+LIGHT_TYPES = ("ambient", "point", "directional")
+MESH = 3
+
+def pack_scene(objects, lights):
+    # Returns the object and light tables, then the mesh vertex, face, corner normal, BVH node
+    # and leaf order tables.
+    table = np.zeros((len(objects), OBJECT_COLUMNS))
+    meshes = []
+    vertex_count = face_count = normal_count = node_count = 0
+    for k, obj in enumerate(objects):
+        if isinstance(obj, Sphere):
+            table[k, :5] = (jit.SPHERE,) + obj.center.to_tuple() + (obj.radius,)
+        elif isinstance(obj, Cylinder):
+            table[k, :6] = (jit.CYLINDER,) + obj.center.to_tuple() + (obj.radius, obj.height)
+        elif isinstance(obj, TriangleMesh):
+            nodes = len(obj.index.node_start)
+            table[k, :10] = (MESH, vertex_count, len(obj.vertices), face_count, len(obj.faces), obj.smooth,
+                             normal_count, node_count, nodes, obj.index.leaf_size)
+            meshes.append(obj)
+            vertex_count += len(obj.vertices)
+            face_count += len(obj.faces)
+            normal_count += len(obj.faces) if obj.smooth else 0
+            node_count += nodes
+        else:
+            table[k, :10] = (jit.TRIANGLE,) + obj.v0.to_tuple() + obj.v1.to_tuple() + obj.v2.to_tuple()
+        table[k, 10:] = tuple(obj.color) + (obj.specular, obj.reflective)
+    mesh_vertices = np.concatenate([m.vertices for m in meshes] or [np.empty((0, 3))])
+    mesh_faces = np.concatenate([m.faces for m in meshes] or [np.empty((0, 3), dtype=np.int64)])
+    mesh_normals = np.concatenate([m.corner_normals for m in meshes if m.smooth] or [np.empty((0, 3, 3))])
+    mesh_nodes = np.concatenate([np.stack([m.index.node_start, m.index.node_end, m.index.node_right,
+                                           m.index.node_axis], axis=1) for m in meshes]
+                                or [np.empty((0, 4), dtype=np.int64)])
+    mesh_order = np.concatenate([m.index.order for m in meshes] or [np.empty(0, dtype=np.int64)])
+    light_table = np.full((len(lights), LIGHT_COLUMNS), np.nan)
+    for k, light in enumerate(lights):
+        vector = light.position if light.type == "point" else light.direction
+        light_table[k, :2] = LIGHT_TYPES.index(light.type), light.intensity
+        if vector is not None:
+            light_table[k, 2:] = vector.to_tuple()
+    return table, light_table, mesh_vertices, mesh_faces, mesh_normals, mesh_nodes, mesh_order
+
+def unpack_scene(table, light_table, mesh_vertices, mesh_faces, mesh_normals, mesh_nodes, mesh_order):
+    # The objects and lights packed by pack_scene, as plain Python floats.
+    objects = []
+    for row in table.tolist():
+        kind, g, color, specular, reflective = row[0], row[1:10], tuple(row[10:13]), row[13], row[14]
+        if kind == MESH:
+            first_vertex, vertices, first_face, faces, smooth, first_normal, first_node, nodes, leaf_size = (
+                int(x) for x in g)
+            index = mesh_bvh.MeshBVH(*mesh_nodes[first_node:first_node + nodes].T,
+                                     mesh_order[first_face:first_face + faces], leaf_size)
+            objects.append(TriangleMesh(mesh_vertices[first_vertex:first_vertex + vertices],
+                                        mesh_faces[first_face:first_face + faces], color, specular, reflective,
+                                        mesh_normals[first_normal:first_normal + faces] if smooth else None,
+                                        bool(smooth), index))
+        elif kind == jit.SPHERE:
+            objects.append(Sphere(Vector3(*g[:3]), g[3], color, specular, reflective))
+        elif kind == jit.CYLINDER:
+            objects.append(Cylinder(Vector3(*g[:3]), g[3], g[4], color, specular, reflective))
+        else:
+            objects.append(Triangle(Vector3(*g[:3]), Vector3(*g[3:6]), Vector3(*g[6:]), color, specular, reflective))
+    lights = []
+    for kind, intensity, x, y, z in light_table.tolist():
+        light_type = LIGHT_TYPES[int(kind)]
+        vector = None if np.isnan(x) else Vector3(x, y, z)
+        lights.append(Light(light_type, intensity, position=vector if light_type == "point" else None,
+                            direction=vector if light_type == "directional" else None))
+    return objects, lights
+
+def create_shared(shape, dtype):
+    # A new shared memory block and an array over it; blocks cannot be empty.
+    shm = shared_memory.SharedMemory(create=True, size=max(1, int(np.prod(shape)) * np.dtype(dtype).itemsize))
+    return shm, np.ndarray(shape, dtype=dtype, buffer=shm.buf)
+
+def attach_shared(name, shape, dtype):
+    shm = shared_memory.SharedMemory(name=name)
+    return shm, np.ndarray(shape, dtype=dtype, buffer=shm.buf)
+
+# Per-worker render state: objects, lights, origin and the band ring, filled by init_worker
+# in pool processes or by render_scene itself for the thread backend.
+_worker = {}
+
+def init_worker(blocks, origin, view):
+    # blocks: (name, shape, dtype) of the pack_scene tables and the band ring. The view
+    # settings come along too, so spawned workers match the parent's scene file.
+    global CANVAS_WIDTH, CANVAS_HEIGHT, VIEWPORT_WIDTH, VIEWPORT_HEIGHT, PROJECTION_PLANE_D, BACKGROUND_COLOR
+    CANVAS_WIDTH, CANVAS_HEIGHT, VIEWPORT_WIDTH, VIEWPORT_HEIGHT, PROJECTION_PLANE_D, BACKGROUND_COLOR = view
+    shared = [attach_shared(*b) for b in blocks]
+    objects, lights = unpack_scene(*[array for _, array in shared[:-1]])
+    # Meshes keep views of their shared tables, so the blocks stay open for the worker's lifetime.
+    _worker.update(objects=objects, lights=lights, origin=Vector3(*origin), ring=shared[-1][1],
+                   shm=[shm for shm, _ in shared])
+
+def compute_band(band):
+    # Renders canvas rows [band * BAND_ROWS, ...) into the band's ring slot and returns the band.
+    st = _worker
+    slot = st["ring"][band % len(st["ring"])]
+    first = band * BAND_ROWS
+    for row in range(first, min(first + BAND_ROWS, CANVAS_HEIGHT)):
+        colors = render_row(row, st["origin"], st["objects"], st["lights"])
+        slot[row - first] = np.frombuffer(colors, dtype=np.uint8).reshape(CANVAS_WIDTH, 3)
+    return band
+
+# Wrapped only once instrument.enable() is called (--profile); see instrument.py.
+_module = sys.modules[__name__]
+instrument.register(_module, "intersect_ray_sphere", counter="ray-sphere tests")
+instrument.register(_module, "intersect_ray_cylinder", counter="ray-cylinder tests")
+instrument.register(_module, "intersect_ray_triangle", counter="ray-triangle tests")
+instrument.register(_module, "occludes_sphere", counter="ray-sphere tests")
+instrument.register(_module, "occludes_cylinder", counter="ray-cylinder tests")
+instrument.register(_module, "ClosestIntersection", stage="ClosestIntersection")
+instrument.register(_module, "computeLighting", stage="computeLighting")
+
+def load_scene(path, use_cache=True):
+    # Objects, lights and camera position from a scene file; canvas settings it gives replace
+    # the defaults above. The objects, including parsed OBJ models, come from the scene's
+    # binary sidecar cache when neither the scene, its models nor this file have changed.
+    global CANVAS_WIDTH, CANVAS_HEIGHT, VIEWPORT_WIDTH, VIEWPORT_HEIGHT, PROJECTION_PLANE_D, BACKGROUND_COLOR
+    here = os.path.dirname(os.path.abspath(__file__))
+    scene, objects = scene_file.cached(path, "inclass1", functools.partial(build_objects, use_cache=use_cache),
+                                       sources=[os.path.join(here, name) for name in ("RayTracer.py", "obj_loader.py", "mesh_bvh.py")],
+                                       use_cache=use_cache)
+    (CANVAS_WIDTH, CANVAS_HEIGHT, VIEWPORT_WIDTH, VIEWPORT_HEIGHT, PROJECTION_PLANE_D, BACKGROUND_COLOR,
+     position) = scene_file.whitted_view(scene, CANVAS_WIDTH, CANVAS_HEIGHT, BACKGROUND_COLOR)
+    return objects, load_lights(scene), Vector3(*position)
+
+def build_objects(scene, use_cache=True):
+    objects = []
+    for obj in scene_file.supported(scene, ("sphere", "cylinder", "obj"), "InClass_challenge_1"):
+        color, specular, reflective = scene_file.whitted_material(obj["material"])
+        if obj["type"] == "sphere":
+            objects.append(Sphere(Vector3(*obj["center"]), obj["radius"], color, specular, reflective))
+        elif obj["type"] == "cylinder":
+            objects.append(Cylinder(Vector3(*obj["center"]), obj["radius"], obj["height"], color, specular,
+                                    reflective))
+        else:
+            objects.append(load_obj(obj["path"], color, specular, reflective, obj.get("scale", 1.0),
+                                    Vector3(*obj.get("offset", [0, 0, 0])), use_cache, obj.get("smooth", False),
+                                    obj.get("leaf_size", mesh_bvh.LEAF_SIZE)))
+    return objects
+
+def load_lights(scene):
+    lights = []
+    for light in scene["lights"]:
+        position = Vector3(*light["position"]) if "position" in light else None
+        direction = Vector3(*light["direction"]) if "direction" in light else None
+        lights.append(Light(light["type"], light["intensity"], position, direction))
+    return lights
+
+def default_scene():
     lights = [
         Light("ambient", 0.2),
         Light("point", 0.6, position=Vector3(1.6, 1, 0)),
@@ -316,22 +822,114 @@ def render_scene():
         Sphere(Vector3(0, -5001, 0), 5000, (255, 255, 0), 1000, 0),
         Cylinder(Vector3(1, 0, 4), 1, 2, (255, 0, 0), 60, 0.4)
     ]
-    image = Image.new("RGB", (CANVAS_WIDTH, CANVAS_HEIGHT), BACKGROUND_COLOR)
-    pixels = image.load()
-    origin = Vector3(0, 0, 0)
-    args_list = []
-    for x in range(-CANVAS_WIDTH // 2, CANVAS_WIDTH // 2):
-        for y in range(-CANVAS_HEIGHT // 2, CANVAS_HEIGHT // 2):
-            args_list.append((x, y, origin, objects, lights))
-    pool = mp.Pool()
-    results = pool.map(compute_pixel, args_list)
-    pool.close()
-    pool.join()
-    for (x, y, col) in results:
-        canvas_x = x + CANVAS_WIDTH // 2
-        canvas_y = CANVAS_HEIGHT // 2 - y - 1
-        pixels[canvas_x, canvas_y] = col
-    image.save("raytraced_scene.png")
+    return objects, lights, Vector3(0, 0, 0)
+
+def render_scene(profile=None, scene_path=None, use_cache=True, use_jit=False, backend="processes"):
+    if scene_path is not None:
+        objects, lights, origin = load_scene(scene_path, use_cache)
+    else:
+        objects, lights, origin = default_scene()
+    if use_jit and jit.AVAILABLE:
+        if not any(isinstance(obj, TriangleMesh) and obj.smooth for obj in objects):
+            render_scene_jit(objects, lights, origin)
+            return
+        print("The compiled kernels only shade flat triangles; rendering with the process pool.", file=sys.stderr)
+    # Bands are rendered out of order but written to the PNG top to bottom as soon as every
+    # band above them is done (see SHARED SCENE AND FRAMEBUFFER).
+    # backend "threads" renders the bands on a thread pool instead: every thread reads the parent's
+    # own objects and ring, so nothing is shared or pickled, but the bands only trace in parallel
+    # on a free-threaded Python build.
+    bands = -(-CANVAS_HEIGHT // BAND_ROWS)
+    ring_shape = (min(bands, SLOTS_PER_CPU * (os.cpu_count() or 1)), BAND_ROWS, CANVAS_WIDTH, 3)
+    if profile is None:
+        compute = compute_band
+    else:
+        # One instrumented task per band, so each reports its worker's counters.
+        instrument.enable()
+        compute = functools.partial(instrument.task, compute_band)
+    blocks = []
+    shared = ring = None
+    try:
+        if backend == "threads":
+            ring = np.empty(ring_shape, dtype=np.uint8)
+            _worker.update(objects=objects, lights=lights, origin=origin, ring=ring)
+            pool = mp.pool.ThreadPool()
+        else:
+            tables = pack_scene(objects, lights)
+            shared = [create_shared(a.shape, a.dtype) for a in tables] + [create_shared(ring_shape, np.uint8)]
+            blocks = [shm for shm, _ in shared]
+            for table, (_, array) in zip(tables, shared):
+                array[:] = table
+            ring = shared[-1][1]
+            view = (CANVAS_WIDTH, CANVAS_HEIGHT, VIEWPORT_WIDTH, VIEWPORT_HEIGHT, PROJECTION_PLANE_D, BACKGROUND_COLOR)
+            pool = mp.Pool(initializer=init_worker,
+                           initargs=([(shm.name, a.shape, a.dtype.str) for shm, a in shared], origin.to_tuple(),
+                                     view))
+        results = queue.Queue()
+        submitted = written = 0
+        finished = set()
+        with pool, png_stream.PNGStreamWriter("raytraced_scene.png", CANVAS_WIDTH, CANVAS_HEIGHT) as out:
+            while written < bands:
+                # A band's slot is free once the band a whole ring earlier is in the PNG.
+                while submitted < bands and submitted - written < len(ring):
+                    pool.apply_async(compute, (submitted,), callback=results.put, error_callback=results.put)
+                    submitted += 1
+                result = results.get()
+                if isinstance(result, BaseException):
+                    raise result
+                finished.add(result if profile is None else profile.add(*result))
+                while written in finished:
+                    finished.remove(written)
+                    out.write_rows(ring[written % len(ring), :min(BAND_ROWS, CANVAS_HEIGHT - written * BAND_ROWS)])
+                    written += 1
+    finally:
+        # The arrays over the shared blocks have to go before the blocks can be closed.
+        _worker.clear()
+        shared = ring = None
+        for shm in blocks:
+            shm.close()
+            shm.unlink()
+
+def render_scene_jit(objects, lights, origin):
+    # The same image from the compiled kernels in jit.py, one thread per canvas column.
+    jit.warm_up()
+    packed_objects, packed_lights = jit.pack(objects, lights, Sphere, Cylinder, TriangleMesh)
+    pixels = jit.render(packed_objects, packed_lights, float(origin.x), float(origin.y), float(origin.z),
+                        CANVAS_WIDTH, CANVAS_HEIGHT, float(VIEWPORT_WIDTH), float(VIEWPORT_HEIGHT),
+                        float(PROJECTION_PLANE_D), np.array(BACKGROUND_COLOR, dtype=np.float64), RECURSION_DEPTH)
+    with png_stream.PNGStreamWriter("raytraced_scene.png", CANVAS_WIDTH, CANVAS_HEIGHT) as out:
+        out.write_rows(pixels)
+
+def main():
+    parser = argparse.ArgumentParser(description="Render the spheres and cylinder scene.")
+    parser.add_argument("--profile", default=None, metavar="TRACE_JSON",
+                        help="count ray tests and time the hot stages, print a summary and write a Chrome trace")
+    parser.add_argument("--scene", default=None, help="render a scene file (see scenes/) instead of the built-in scene")
+    parser.add_argument("--no-scene-cache", action="store_true",
+                        help="always parse the scene and its models instead of using the sidecar cache")
+    parser.add_argument("--jit", action="store_true",
+                        help="render with the Numba-compiled kernels (falls back to the process pool without Numba)")
+    parser.add_argument("--backend", choices=["processes", "threads"], default="processes",
+                        help="render the rows with a process pool, or with a thread pool sharing one scene")
+    args = parser.parse_args()
+    if args.jit and args.profile:
+        parser.error("--profile instruments the Python kernels; drop --jit")
+    if args.backend == "threads" and (args.jit or args.profile):
+        parser.error("--backend threads cannot be combined with --jit (already threaded) or --profile")
+    if args.jit:
+        if jit.AVAILABLE:
+            print(f"JIT kernels ready in {jit.warm_up():.2f}s")
+        else:
+            print("Numba is not available; --jit renders with the process pool.", file=sys.stderr)
+    profile = instrument.Profile() if args.profile else None
+    render_scene(profile, args.scene, not args.no_scene_cache, args.jit, args.backend)
+    if profile is not None:
+        profile.finish()
+        print(profile.summary())
+        profile.write_chrome_trace(args.profile)
 
 if __name__ == "__main__":
-    render_scene()
+    # Run from the importable module, so pickled objects (the scene sidecar cache) always name
+    # RayTracer.* classes, whether the cache was written here or by an import such as the benchmarks.
+    import RayTracer
+    RayTracer.main()
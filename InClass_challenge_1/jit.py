@@ -0,0 +1,299 @@
+import math
+import os
+import time
+import numpy as np
+
+try:
+    import numba
+except ImportError:
+    numba = None
+
+# === OPTIONAL JIT-COMPILED RENDERER ===
+# intersect_ray_sphere/cylinder/triangle, ClosestIntersection, computeLighting and
+# trace_ray rewritten as scalar float code over packed object and light tables,
+# plus the per-pixel loop, compiled with Numba and run in parallel over canvas
+# columns. Every operation happens in the same order as the Vector3 code, so the
+# image is pixel-for-pixel the same. Compiled code is cached on disk
+# (__pycache__, or $NUMBA_CACHE_DIR). Without Numba (or with RAYTRACER_NO_JIT
+# set) AVAILABLE is False and render_scene keeps using the process pool.
+
+AVAILABLE = numba is not None and not os.environ.get("RAYTRACER_NO_JIT")
+
+def njit(fn=None, parallel=False):
+    if fn is None:
+        return lambda f: njit(f, parallel)
+    if numba is None:
+        return fn
+    return numba.njit(cache=True, parallel=parallel)(fn)
+
+prange = numba.prange if numba is not None else range
+
+SPHERE = 0
+CYLINDER = 1
+TRIANGLE = 2
+AMBIENT = 0
+POINT = 1
+DIRECTIONAL = 2
+# Lights without a position or direction only count when ambient.
+UNUSED = -1
+
+# === PACKING ===
+def pack(objects, lights, sphere_type, cylinder_type, mesh_type=None):
+    # Object table: kind, geometry (sphere: center, radius; cylinder: center, radius, height;
+    # triangle: v0, v1 - v0, v2 - v0), color, specular and reflective; a mesh adds one triangle
+    # row per face, with its precomputed edges. Light table: kind, intensity and position or direction.
+    sizes = [len(obj.faces) if mesh_type is not None and isinstance(obj, mesh_type) else 1 for obj in objects]
+    n = sum(sizes)
+    kinds = np.empty(n, dtype=np.int64)
+    geometry = np.zeros((n, 9))
+    colors = np.empty((n, 3))
+    specular = np.empty(n)
+    reflective = np.empty(n)
+    k = 0
+    for obj, size in zip(objects, sizes):
+        if isinstance(obj, sphere_type):
+            kinds[k] = SPHERE
+            geometry[k, :4] = obj.center.to_tuple() + (obj.radius,)
+        elif isinstance(obj, cylinder_type):
+            kinds[k] = CYLINDER
+            geometry[k, :5] = obj.center.to_tuple() + (obj.radius, obj.height)
+        elif mesh_type is not None and isinstance(obj, mesh_type):
+            kinds[k:k + size] = TRIANGLE
+            geometry[k:k + size] = np.concatenate([obj.v0, obj.edge1, obj.edge2]).T
+        else:
+            kinds[k] = TRIANGLE
+            geometry[k] = obj.v0.to_tuple() + (obj.v1 - obj.v0).to_tuple() + (obj.v2 - obj.v0).to_tuple()
+        colors[k:k + size] = obj.color
+        specular[k:k + size] = obj.specular
+        reflective[k:k + size] = obj.reflective
+        k += size
+    light_kinds = np.empty(len(lights), dtype=np.int64)
+    intensities = np.empty(len(lights))
+    vectors = np.zeros((len(lights), 3))
+    for k, light in enumerate(lights):
+        intensities[k] = light.intensity
+        light_kinds[k] = UNUSED
+        if light.type == "ambient":
+            light_kinds[k] = AMBIENT
+        elif light.type == "point" and light.position is not None:
+            light_kinds[k] = POINT
+            vectors[k] = light.position.to_tuple()
+        elif light.type == "directional" and light.direction is not None:
+            light_kinds[k] = DIRECTIONAL
+            vectors[k] = light.direction.to_tuple()
+    return (kinds, geometry, colors, specular, reflective), (light_kinds, intensities, vectors)
+
+# === INTERSECTION KERNELS ===
+@njit
+def normalize(x, y, z):
+    length = np.sqrt(x ** 2 + y ** 2 + z ** 2)
+    if length == 0:
+        return 0.0, 0.0, 0.0
+    return x / length, y / length, z / length
+
+@njit
+def intersect_ray_sphere(ox, oy, oz, dx, dy, dz, g):
+    cox, coy, coz = ox - g[0], oy - g[1], oz - g[2]
+    a = dx * dx + dy * dy + dz * dz
+    b = 2 * (cox * dx + coy * dy + coz * dz)
+    c = cox * cox + coy * coy + coz * coz - g[3] ** 2
+    discriminant = b ** 2 - 4 * a * c
+    if discriminant < 0:
+        return math.inf, math.inf
+    return (-b + np.sqrt(discriminant)) / (2 * a), (-b - np.sqrt(discriminant)) / (2 * a)
+
+@njit
+def intersect_ray_cylinder(ox, oy, oz, dx, dy, dz, g):
+    # Returns (t, normal); the normal is only meaningful when t is finite.
+    cx, cy, cz, r, h = g[0], g[1], g[2], g[3], g[4]
+    t_min = math.inf
+    nx, ny, nz = 0.0, 0.0, 0.0
+    A = dx ** 2 + dz ** 2
+    B = 2 * ((ox - cx) * dx + (oz - cz) * dz)
+    C_val = (ox - cx) ** 2 + (oz - cz) ** 2 - r ** 2
+    discriminant = B ** 2 - 4 * A * C_val
+    if A != 0 and discriminant >= 0:
+        sqrt_disc = np.sqrt(discriminant)
+        for t in ((-B - sqrt_disc) / (2 * A), (-B + sqrt_disc) / (2 * A)):
+            if t > 0:
+                py = oy + dy * t
+                if cy - h / 2 <= py <= cy + h / 2 and t < t_min:
+                    t_min = t
+                    nx, ny, nz = normalize(ox + dx * t - cx, 0.0, oz + dz * t - cz)
+    for cap_y, cap_ny in ((cy + h / 2, 1.0), (cy - h / 2, -1.0)):
+        if dy != 0:
+            t_cap = (cap_y - oy) / dy
+            if t_cap > 0:
+                px, pz = ox + dx * t_cap, oz + dz * t_cap
+                if (px - cx) ** 2 + (pz - cz) ** 2 <= r ** 2 and t_cap < t_min:
+                    t_min = t_cap
+                    nx, ny, nz = 0.0, cap_ny, 0.0
+    return t_min, nx, ny, nz
+
+@njit
+def intersect_ray_triangle(ox, oy, oz, dx, dy, dz, g):
+    # Moller-Trumbore with the edges precomputed by pack().
+    EPSILON = 1e-6
+    e1x, e1y, e1z, e2x, e2y, e2z = g[3], g[4], g[5], g[6], g[7], g[8]
+    hx, hy, hz = dy * e2z - dz * e2y, dz * e2x - dx * e2z, dx * e2y - dy * e2x
+    a = e1x * hx + e1y * hy + e1z * hz
+    if abs(a) < EPSILON:
+        return math.inf
+    f = 1.0 / a
+    sx, sy, sz = ox - g[0], oy - g[1], oz - g[2]
+    u = f * (sx * hx + sy * hy + sz * hz)
+    if u < 0.0 or u > 1.0:
+        return math.inf
+    qx, qy, qz = sy * e1z - sz * e1y, sz * e1x - sx * e1z, sx * e1y - sy * e1x
+    v = f * (dx * qx + dy * qy + dz * qz)
+    if v < 0.0 or u + v > 1.0:
+        return math.inf
+    t = f * (e2x * qx + e2y * qy + e2z * qz)
+    if t > EPSILON:
+        return t
+    return math.inf
+
+@njit
+def closest_intersection(objects, ox, oy, oz, dx, dy, dz, t_min_val, t_max, any_hit):
+    # ClosestIntersection: (object index or -1, t, normal). The normal is computed here for
+    # cylinders and triangles and by the caller for spheres. With any_hit, the first object
+    # hit in range is returned, which is all a shadow ray needs.
+    kinds, geometry = objects[0], objects[1]
+    closest_t = math.inf
+    closest = -1
+    nx, ny, nz = 0.0, 0.0, 0.0
+    for k in range(len(kinds)):
+        g = geometry[k]
+        if kinds[k] == SPHERE:
+            t1, t2 = intersect_ray_sphere(ox, oy, oz, dx, dy, dz, g)
+            if t_min_val <= t1 <= t_max and t1 < closest_t:
+                closest_t, closest = t1, k
+            if t_min_val <= t2 <= t_max and t2 < closest_t:
+                closest_t, closest = t2, k
+        elif kinds[k] == CYLINDER:
+            t, cnx, cny, cnz = intersect_ray_cylinder(ox, oy, oz, dx, dy, dz, g)
+            if t_min_val <= t <= t_max and t < closest_t:
+                closest_t, closest = t, k
+                nx, ny, nz = cnx, cny, cnz
+        else:
+            t = intersect_ray_triangle(ox, oy, oz, dx, dy, dz, g)
+            if t_min_val <= t <= t_max and t < closest_t:
+                closest_t, closest = t, k
+                nx, ny, nz = normalize(g[4] * g[8] - g[5] * g[7], g[5] * g[6] - g[3] * g[8],
+                                       g[3] * g[7] - g[4] * g[6])
+        if any_hit and closest >= 0:
+            break
+    return closest, closest_t, nx, ny, nz
+
+# === SHADING ===
+@njit
+def channel(value):
+    # min(255, int(value)) for value >= 0, clamped before the conversion: the unnormalized view
+    # vector can push the specular term far past the int64 range that Python's int never has.
+    return int(min(value, 255.0))
+
+@njit
+def compute_lighting(objects, lights, px, py, pz, nx, ny, nz, vx, vy, vz, s):
+    light_kinds, intensities, vectors = lights
+    i = 0.0
+    for k in range(len(light_kinds)):
+        kind = light_kinds[k]
+        if kind == AMBIENT:
+            i += intensities[k]
+            continue
+        if kind == POINT:
+            lx, ly, lz = vectors[k, 0] - px, vectors[k, 1] - py, vectors[k, 2] - pz
+            t_max = 1.0
+        elif kind == DIRECTIONAL:
+            lx, ly, lz = vectors[k, 0], vectors[k, 1], vectors[k, 2]
+            t_max = math.inf
+        else:
+            continue
+        if closest_intersection(objects, px, py, pz, lx, ly, lz, 0.001, t_max, True)[0] >= 0:
+            continue
+        lx, ly, lz = normalize(lx, ly, lz)
+        n_dot_l = nx * lx + ny * ly + nz * lz
+        if n_dot_l > 0:
+            i += intensities[k] * n_dot_l
+        if s != -1:
+            scale = 2 * (nx * lx + ny * ly + nz * lz)
+            rx, ry, rz = normalize(nx * scale - lx, ny * scale - ly, nz * scale - lz)
+            r_dot_v = rx * vx + ry * vy + rz * vz
+            if r_dot_v > 0:
+                i += intensities[k] * (r_dot_v ** s)
+    return i
+
+@njit
+def trace_ray(objects, lights, ox, oy, oz, dx, dy, dz, t_min_val, recursion_depth, background, levels):
+    # Iterative trace_ray: each level's local colour and reflectivity go into levels (one row
+    # per bounce), then the reflections are blended back from the deepest level up.
+    kinds, geometry, colors, specular, reflective = objects
+    depth = 0
+    while True:
+        k, t, nx, ny, nz = closest_intersection(objects, ox, oy, oz, dx, dy, dz, t_min_val, math.inf, False)
+        if k < 0:
+            cr, cg, cb = background[0], background[1], background[2]
+            break
+        px, py, pz = ox + dx * t, oy + dy * t, oz + dz * t
+        if kinds[k] == SPHERE:
+            nx, ny, nz = normalize(px - geometry[k, 0], py - geometry[k, 1], pz - geometry[k, 2])
+        lighting = compute_lighting(objects, lights, px, py, pz, nx, ny, nz, -dx, -dy, -dz, specular[k])
+        cr = channel(colors[k, 0] * lighting)
+        cg = channel(colors[k, 1] * lighting)
+        cb = channel(colors[k, 2] * lighting)
+        r = reflective[k]
+        if depth >= recursion_depth or r <= 0:
+            break
+        levels[depth, 0], levels[depth, 1], levels[depth, 2], levels[depth, 3] = cr, cg, cb, r
+        # reflect_ray(-direction, N)
+        scale = 2 * (nx * -dx + ny * -dy + nz * -dz)
+        ox, oy, oz = px, py, pz
+        dx, dy, dz = nx * scale - -dx, ny * scale - -dy, nz * scale - -dz
+        t_min_val = 0.001
+        depth += 1
+    for level in range(depth - 1, -1, -1):
+        r = levels[level, 3]
+        cr = channel(levels[level, 0] * (1 - r) + cr * r)
+        cg = channel(levels[level, 1] * (1 - r) + cg * r)
+        cb = channel(levels[level, 2] * (1 - r) + cb * r)
+    return cr, cg, cb
+
+# === PER-PIXEL LOOP ===
+@njit(parallel=True)
+def render(objects, lights, ox, oy, oz, canvas_width, canvas_height, viewport_width, viewport_height,
+           projection_plane_d, background, recursion_depth):
+    # The whole canvas as an (height, width, 3) uint8 array, columns rendered in parallel.
+    image = np.empty((canvas_height, canvas_width, 3), dtype=np.uint8)
+    x_first = -canvas_width // 2
+    for column in prange(canvas_width // 2 - x_first):
+        x = x_first + column
+        levels = np.empty((recursion_depth + 1, 4))
+        for y in range(-canvas_height // 2, canvas_height // 2):
+            dx = x * viewport_width / canvas_width
+            dy = y * viewport_height / canvas_height
+            color = trace_ray(objects, lights, ox, oy, oz, dx, dy, projection_plane_d, 1, recursion_depth,
+                              background, levels)
+            pixel = image[canvas_height // 2 - y - 1, x + canvas_width // 2]
+            pixel[0], pixel[1], pixel[2] = color
+    return image
+
+# === WARM-UP ===
+_warm = False
+
+def warm_up():
+    # Loads (or, on the first run, compiles and caches) the kernels by rendering a 2x2 canvas
+    # with one object of every kind; returns the seconds it took.
+    global _warm
+    if _warm or not AVAILABLE:
+        return 0.0
+    start = time.perf_counter()
+    geometry = np.zeros((3, 9))
+    geometry[:, 2] = 3.0
+    geometry[:, 3] = 1.0
+    geometry[1, 4] = 1.0
+    objects = (np.array([SPHERE, CYLINDER, TRIANGLE], dtype=np.int64), geometry, np.full((3, 3), 255.0),
+               np.array([10.0, -1.0, 10.0]), np.full(3, 0.5))
+    lights = (np.array([AMBIENT, POINT, DIRECTIONAL], dtype=np.int64), np.full(3, 0.3), np.ones((3, 3)))
+    render(objects, lights, 0.0, 0.0, 0.0, 2, 2, 1.0, 1.0, 1.0, np.zeros(3), 1)
+    _warm = True
+    return time.perf_counter() - start
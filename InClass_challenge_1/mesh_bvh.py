@@ -0,0 +1,169 @@
+import os
+import numpy as np
+import obj_loader
+
+# === MESH BVH ===
+# A bounding volume hierarchy over the triangles of one mesh, so a ray only tests
+# the triangles in the few leaves its path crosses. Nodes are flattened in
+# depth-first order like Project 1's BVH: the left child of an interior node is
+# node + 1 and node_right holds the right child (0 for a leaf). Every node covers a
+# contiguous run [node_start, node_end) of `order`, the mesh's faces sorted into
+# leaf order, so the tree itself holds no coordinates: refit() computes the node
+# bounds from whichever copy of the vertices the mesh has. The tree of an OBJ model
+# is built on its unscaled vertices and cached next to the model (<path>.bvh.npz),
+# where any scale and offset of the same model can reuse it.
+
+INDEX_VERSION = 1
+CACHE_SUFFIX = ".bvh.npz"
+# Most triangles in a leaf; nodes with more are always split.
+LEAF_SIZE = 4
+# Centroid bins per axis for the SAH split search.
+BINS = 16
+# Subtrees with fewer triangles are split at the median centroid of their longest
+# axis, which costs a fraction of the binned search and is nearly as good that deep
+# in the tree.
+SAH_MIN_FACES = 64
+# Node boxes are grown by this fraction of the mesh's largest coordinate, so neither
+# rounding in the slab test nor a ray running along a box face misses a triangle on it.
+BOX_PAD = 1e-9
+ARRAYS = ("node_start", "node_end", "node_right", "node_axis", "order")
+
+class MeshBVH:
+    def __init__(self, node_start, node_end, node_right, node_axis, order, leaf_size=LEAF_SIZE):
+        self.node_start = np.asarray(node_start, dtype=np.int64)
+        self.node_end = np.asarray(node_end, dtype=np.int64)
+        self.node_right = np.asarray(node_right, dtype=np.int64)
+        self.node_axis = np.asarray(node_axis, dtype=np.int64)
+        self.order = np.asarray(order, dtype=np.int64)
+        self.leaf_size = leaf_size
+
+def triangle_bounds(vertices, faces):
+    # (lo, hi): the (t, 3) corners of every face's bounding box.
+    corners = vertices[faces]
+    return corners.min(axis=1), corners.max(axis=1)
+
+def surface_area(box_min, box_max):
+    # Half the surface area of boxes given as (..., 3) arrays, as in Project 1's BVH.
+    e = np.maximum(box_max - box_min, 0.0)
+    return e[..., 0] * e[..., 1] + e[..., 1] * e[..., 2] + e[..., 2] * e[..., 0]
+
+def split(lo, hi, centroids):
+    # The SAH-best (axis, mask of the left side) over BINS centroid bins per axis,
+    # or (longest axis, None) when every centroid falls in one bin.
+    c_min, c_max = centroids.min(axis=0), centroids.max(axis=0)
+    extent = c_max - c_min
+    best_cost, best = np.inf, (int(extent.argmax()), None)
+    for axis in range(3):
+        if extent[axis] <= 0:
+            continue
+        bins = np.minimum(((centroids[:, axis] - c_min[axis]) * (BINS / extent[axis])).astype(np.int64), BINS - 1)
+        counts = np.bincount(bins, minlength=BINS)
+        bin_lo = np.full((BINS, 3), np.inf)
+        bin_hi = np.full((BINS, 3), -np.inf)
+        np.minimum.at(bin_lo, bins, lo)
+        np.maximum.at(bin_hi, bins, hi)
+        left_count = np.cumsum(counts)[:-1]
+        left_area = surface_area(np.minimum.accumulate(bin_lo), np.maximum.accumulate(bin_hi))[:-1]
+        right_area = surface_area(np.minimum.accumulate(bin_lo[::-1])[::-1],
+                                  np.maximum.accumulate(bin_hi[::-1])[::-1])[1:]
+        costs = left_area * left_count + right_area * (len(bins) - left_count)
+        # Splits with an empty side separate nothing.
+        costs[(left_count == 0) | (left_count == len(bins))] = np.inf
+        k = int(costs.argmin())
+        if costs[k] < best_cost:
+            best_cost, best = costs[k], (axis, bins <= k)
+    return best
+
+def build(lo, hi, leaf_size=LEAF_SIZE):
+    # The tree over triangles with the given bounds; leaves hold at most leaf_size triangles.
+    leaf_size = max(1, int(leaf_size))
+    centroids = (lo + hi) * 0.5
+    node_start, node_end, node_right, node_axis = [], [], [], []
+    order = np.empty(len(lo), dtype=np.int64)
+    placed = 0
+    # (faces, parent whose right child this is); popping the left child right after its
+    # parent keeps it at parent + 1.
+    stack = [(np.arange(len(lo)), -1)] if len(lo) else []
+    while stack:
+        faces, parent = stack.pop()
+        if parent >= 0:
+            node_right[parent] = len(node_start)
+        if len(faces) < SAH_MIN_FACES:
+            # Sorted once along the longest axis, the rest of the subtree is plain halving of
+            # index runs, with no NumPy call per node.
+            c = centroids[faces]
+            axis = int((c.max(axis=0) - c.min(axis=0)).argmax())
+            order[placed:placed + len(faces)] = faces[np.argsort(c[:, axis], kind="stable")]
+            runs = [(placed, placed + len(faces), -1)]
+            placed += len(faces)
+            while runs:
+                start, end, run_parent = runs.pop()
+                node = len(node_start)
+                if run_parent >= 0:
+                    node_right[run_parent] = node
+                node_start.append(start)
+                node_end.append(end)
+                node_right.append(0)
+                node_axis.append(axis)
+                if end - start > leaf_size:
+                    middle = (start + end) // 2
+                    runs.append((middle, end, node))
+                    runs.append((start, middle, -1))
+            continue
+        node = len(node_start)
+        node_start.append(placed)
+        node_end.append(placed + len(faces))
+        node_right.append(0)
+        axis, left = split(lo[faces], hi[faces], centroids[faces])
+        if left is None:
+            # Every centroid in one bin: halve the list at the median instead.
+            faces = faces[np.argsort(centroids[faces, axis], kind="stable")]
+            left = np.arange(len(faces)) < len(faces) // 2
+        node_axis.append(axis)
+        stack.append((faces[~left], node))
+        stack.append((faces[left], -1))
+    return MeshBVH(node_start, node_end, node_right, node_axis, order, leaf_size)
+
+def refit(index, lo, hi):
+    # (nodes, 6) bounds, min x/y/z then max x/y/z, of the triangles under every node, padded.
+    if not len(index.node_start):
+        return np.empty((0, 6))
+    # A pair of reduceat indices per node reduces its run; the extra row keeps the
+    # last run's end index in range, and the runs between pairs are dropped.
+    ranges = np.stack([index.node_start, index.node_end], axis=1).ravel()
+    node_lo = np.minimum.reduceat(np.concatenate([lo[index.order], lo[:1]]), ranges)[::2]
+    node_hi = np.maximum.reduceat(np.concatenate([hi[index.order], hi[:1]]), ranges)[::2]
+    pad = BOX_PAD * max(np.abs(node_lo[0]).max(), np.abs(node_hi[0]).max())
+    return np.concatenate([node_lo - pad, node_hi + pad], axis=1)
+
+# === CACHE ===
+def read_cache(filename, key):
+    try:
+        with np.load(filename) as data:
+            if not np.array_equal(data["key"], key):
+                return None
+            return MeshBVH(*(data[name] for name in ARRAYS), leaf_size=int(key[-1]))
+    except (OSError, KeyError, ValueError):
+        return None
+
+def write_cache(filename, key, index):
+    tmp = f"{filename}.{os.getpid()}.tmp"
+    with open(tmp, "wb") as f:
+        np.savez(f, key=key, **{name: getattr(index, name) for name in ARRAYS})
+    os.replace(tmp, filename)
+
+def load(path, mesh, leaf_size=LEAF_SIZE, use_cache=True):
+    # The tree over an ObjMesh loaded from path, from <path>.bvh.npz when it matches
+    # the model file and leaf size.
+    if not use_cache:
+        return build(*triangle_bounds(mesh.vertices, mesh.faces), leaf_size)
+    key = np.concatenate([obj_loader.cache_key(path), [INDEX_VERSION, leaf_size]])
+    filename = path + CACHE_SUFFIX
+    index = read_cache(filename, key)
+    if index is None:
+        index = build(*triangle_bounds(mesh.vertices, mesh.faces), leaf_size)
+        try:
+            write_cache(filename, key, index)
+        except OSError:
+            pass
+    return index
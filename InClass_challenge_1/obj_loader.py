@@ -0,0 +1,225 @@
+import itertools
+import os
+import numpy as np
+
+# === INDEXED OBJ LOADER ===
+# Parses Wavefront OBJ geometry into NumPy arrays: vertex positions, texture
+# coordinates and normals, and a triangle table indexing into each (fan-split
+# n-gons, `v`, `v/vt`, `v//vn` and `v/vt/vn` corners, 1-based and negative
+# indices). The file is read in blocks and every block's lines are converted in
+# bulk, so memory stays at one block on top of the arrays being built. The
+# result is cached in an uncompressed .npz next to the OBJ (<path>.mesh.npz),
+# keyed by the file's size and modification time, so later loads skip parsing.
+
+LOADER_VERSION = 1
+CACHE_SUFFIX = ".mesh.npz"
+# Bytes read per block; lines split across blocks are carried over.
+BLOCK_BYTES = 1 << 24
+ARRAYS = ("vertices", "texcoords", "normals", "faces", "face_texcoords", "face_normals")
+
+class ObjMesh:
+    # vertices (n, 3), texcoords (m, 2) and normals (k, 3) are float64; faces, face_texcoords and
+    # face_normals are (t, 3) int64 rows into them, -1 where a corner gives no texcoord or normal.
+    def __init__(self, vertices, texcoords, normals, faces, face_texcoords, face_normals):
+        self.vertices = vertices
+        self.texcoords = texcoords
+        self.normals = normals
+        self.faces = faces
+        self.face_texcoords = face_texcoords
+        self.face_normals = face_normals
+
+# === PARSING ===
+def parse_floats(lines, width):
+    # The first `width` numbers of every line, in one conversion when every line has exactly that many.
+    tokens = b" ".join(lines).split()
+    if len(tokens) == width * len(lines):
+        return np.array(tokens, dtype=np.float64).reshape(-1, width)
+    return np.array([line.split()[:width] for line in lines], dtype=np.float64).reshape(-1, width)
+
+def parse_corners(lines):
+    # (corner indices (c, 3) as written, 0 where missing; corners per face) for the face lines.
+    tokens = b" ".join(lines).split()
+    sizes = np.fromiter(map(len, map(bytes.split, lines)), dtype=np.int64, count=len(lines))
+    slashes = set(map(bytes.count, tokens, itertools.repeat(b"/")))
+    if len(slashes) == 1 and slashes <= {0, 1, 2}:
+        # Every corner has the same form: one bulk conversion.
+        fields = slashes.pop() + 1
+        text = b" ".join(tokens).replace(b"//", b"/0/").replace(b"/", b" ")
+        corners = np.zeros((len(tokens), 3), dtype=np.int64)
+        corners[:, :fields] = np.array(text.split(), dtype=np.int64).reshape(-1, fields)
+        return corners, sizes
+    corners = np.zeros((len(tokens), 3), dtype=np.int64)
+    for k, token in enumerate(tokens):
+        for field, value in enumerate(token.split(b"/")[:3]):
+            if value:
+                corners[k, field] = int(value)
+    return corners, sizes
+
+def resolve(indices, before):
+    # 1-based and negative OBJ indices to 0-based rows; `before` counts the elements defined
+    # ahead of each corner's face line, which negative indices are relative to. 0 becomes -1.
+    return np.where(indices > 0, indices - 1, np.where(indices < 0, before + indices, -1))
+
+def fan(corners, sizes):
+    # Splits faces of sizes[f] corners into (first, k, k + 1) triangles; returns (t, 3) rows of corners.
+    # Faces with fewer than three corners give none.
+    starts = np.cumsum(sizes) - sizes
+    per_face = np.maximum(sizes - 2, 0)
+    face = np.repeat(np.arange(len(sizes)), per_face)
+    k = np.arange(len(face)) - np.repeat(np.cumsum(per_face) - per_face, per_face) + 1
+    first = starts[face]
+    return corners[np.stack([first, first + k, first + k + 1], axis=1)]
+
+SPACE, TAB, CR, NEWLINE, SLASH = b" \t\r\n/"
+# Line kind codes; the prefix of each kind is blanked before its numbers are parsed.
+KINDS = ((b"v", 1), (b"vt", 2), (b"vn", 3), (b"f", 4))
+VERTEX, TEXCOORD, NORMAL, FACE = 1, 2, 3, 4
+
+def is_space(data):
+    return (data == SPACE) | (data == TAB) | (data == CR) | (data == NEWLINE)
+
+def parse_block(block, counts, parts):
+    # Converts one block of whole lines; counts holds the vertices, texcoords and normals seen so
+    # far. Lines are classified on the raw bytes and every kind is parsed in one np.fromstring
+    # call; blocks with irregular lines (vertex colours, mixed corner forms) go line by line.
+    if not block.endswith(b"\n"):
+        block += b"\n"
+    # Padded so the first three bytes of the last line can always be read.
+    padded = np.frombuffer(block + b"\n\n", dtype=np.uint8)
+    data = padded[:len(block)].copy()
+    ends = np.flatnonzero(data == NEWLINE) + 1
+    starts = np.concatenate(([0], ends[:-1]))
+    first, second, third = padded[starts], padded[starts + 1], padded[starts + 2]
+    kind = np.zeros(len(starts), dtype=np.int8)
+    kind[(first == ord("v")) & is_space(second)] = VERTEX
+    kind[(first == ord("v")) & (second == ord("t")) & is_space(third)] = TEXCOORD
+    kind[(first == ord("v")) & (second == ord("n")) & is_space(third)] = NORMAL
+    kind[(first == ord("f")) & is_space(second)] = FACE
+    for prefix, code in KINDS:
+        for offset in range(len(prefix)):
+            data[starts[kind == code] + offset] = SPACE
+    lengths = ends - starts
+
+    def text(code):
+        # The lines of one kind with their prefixes blanked, as one string.
+        return data[np.repeat(kind == code, lengths)].tobytes()
+
+    def lines(code):
+        return [block[a:b] for a, b in zip(starts[kind == code].tolist(), ends[kind == code].tolist())]
+    for name, code, width in (("vertices", VERTEX, 3), ("texcoords", TEXCOORD, 2), ("normals", NORMAL, 3)):
+        n = int((kind == code).sum())
+        if n:
+            values = np.fromstring(text(code), sep=" ")
+            if len(values) == width * n:
+                parts[name].append(values.reshape(-1, width))
+            else:
+                parts[name].append(parse_floats([line[len(KINDS[code - 1][0]):] for line in lines(code)], width))
+    at_face = kind == FACE
+    if at_face.any():
+        corners, sizes = parse_faces(data[np.repeat(at_face, lengths)], int(at_face.sum()))
+        if corners is None:
+            corners, sizes = parse_corners([line[1:] for line in lines(FACE)])
+        # Elements defined ahead of every face line, which negative indices are relative to.
+        before = np.stack([counts[f] + np.cumsum(kind == f + 1)[at_face] for f in range(3)], axis=1)
+        before = np.repeat(before, sizes, axis=0)
+        corners = np.stack([resolve(corners[:, f], before[:, f]) for f in range(3)], axis=1)
+        triangles = fan(corners, sizes)
+        parts["faces"].append(triangles[:, :, 0])
+        parts["face_texcoords"].append(triangles[:, :, 1])
+        parts["face_normals"].append(triangles[:, :, 2])
+    for f, code in enumerate((VERTEX, TEXCOORD, NORMAL)):
+        counts[f] += int((kind == code).sum())
+
+def parse_faces(data, face_count):
+    # Bulk version of parse_corners for face lines (prefixes blanked) whose corners all have
+    # the same form; returns (None, None) otherwise.
+    space = is_space(data)
+    token_start = ~space & np.concatenate(([True], space[:-1]))
+    line_start = np.concatenate(([0], np.flatnonzero(data == NEWLINE)[:-1] + 1))
+    sizes = np.add.reduceat(token_start.astype(np.int64), line_start)
+    tokens = int(sizes.sum())
+    slash = data == SLASH
+    token = np.cumsum(token_start) - 1
+    slashes = np.bincount(token[slash], minlength=tokens)
+    per_token = slashes[0] if tokens else 0
+    if len(sizes) != face_count or (slashes != per_token).any() or per_token > 2:
+        return None, None
+    doubled = int((slash[:-1] & slash[1:]).sum())
+    # v, v/vt and v/vt/vn give 1, 2 and 3 numbers per corner; v//vn gives 2, the vertex and normal.
+    if per_token == 2 and doubled not in (0, tokens):
+        return None, None
+    fields = (0, 2) if per_token == 2 and doubled else tuple(range(per_token + 1))
+    data = data.copy()
+    data[slash] = SPACE
+    values = np.fromstring(data.tobytes(), dtype=np.int64, sep=" ")
+    if len(values) != len(fields) * tokens:
+        return None, None
+    corners = np.zeros((tokens, 3), dtype=np.int64)
+    corners[:, fields] = values.reshape(-1, len(fields))
+    return corners, sizes
+
+def parse_obj(path, block_bytes=BLOCK_BYTES):
+    parts = {name: [] for name in ARRAYS}
+    counts = [0, 0, 0]
+    tail = b""
+    with open(path, "rb") as f:
+        while True:
+            block = f.read(block_bytes)
+            if not block:
+                break
+            block = tail + block
+            cut = block.rfind(b"\n") + 1
+            tail = block[cut:]
+            if cut:
+                parse_block(block[:cut], counts, parts)
+    if tail:
+        parse_block(tail, counts, parts)
+    widths = dict(vertices=3, texcoords=2, normals=3, faces=3, face_texcoords=3, face_normals=3)
+    arrays = {}
+    for name in ARRAYS:
+        dtype = np.float64 if name in ("vertices", "texcoords", "normals") else np.int64
+        arrays[name] = np.concatenate(parts[name]) if parts[name] else np.empty((0, widths[name]), dtype=dtype)
+    # Every corner needs a vertex; -1 only marks a texcoord or normal the corner does not give.
+    for name, limit, lowest, label in (("faces", counts[0], 0, "vertex"),
+                                       ("face_texcoords", counts[1], -1, "texture coordinate"),
+                                       ("face_normals", counts[2], -1, "normal")):
+        if len(arrays[name]) and (arrays[name].max() >= limit or arrays[name].min() < lowest):
+            raise ValueError(f"{path}: a face refers to a missing {label}")
+    return ObjMesh(**arrays)
+
+# === CACHE ===
+def cache_key(path):
+    stat = os.stat(path)
+    return np.array([LOADER_VERSION, stat.st_size, stat.st_mtime_ns], dtype=np.int64)
+
+def read_cache(filename, key):
+    # Returns the cached mesh, or None if the cache is missing, stale or unreadable.
+    try:
+        with np.load(filename) as data:
+            if not np.array_equal(data["key"], key):
+                return None
+            return ObjMesh(**{name: data[name] for name in ARRAYS})
+    except (OSError, KeyError, ValueError):
+        return None
+
+def write_cache(filename, key, mesh):
+    # Written to a temporary file first so a crash never leaves a torn cache.
+    tmp = f"{filename}.{os.getpid()}.tmp"
+    with open(tmp, "wb") as f:
+        np.savez(f, key=key, **{name: getattr(mesh, name) for name in ARRAYS})
+    os.replace(tmp, filename)
+
+def load(path, use_cache=True):
+    if not use_cache:
+        return parse_obj(path)
+    key = cache_key(path)
+    filename = path + CACHE_SUFFIX
+    mesh = read_cache(filename, key)
+    if mesh is None:
+        mesh = parse_obj(path)
+        try:
+            write_cache(filename, key, mesh)
+        except OSError:
+            # A read-only model directory only costs the parse next time.
+            pass
+    return mesh
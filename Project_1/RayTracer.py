@@ -1,6 +1,20 @@
-import math, random, time, concurrent.futures, sys
+import math, random, time, concurrent.futures, sys, argparse, os, pickle, threading
+from collections import deque
+from multiprocessing import shared_memory
+import numpy as np
 from PIL import Image
 
+# Scene loading, profiling and PNG output are shared by the renderers through the
+# repository's common/ package.
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+from common import instrument, png_stream, scene_file
+import wavefront
+import adaptive
+import samplers
+import shading
+import denoise
+import jit
+
 # === VECTOR / COLOR CLASS ===
 class Vector3:
     def __init__(self, x, y, z):
@@ -70,20 +84,32 @@ def degrees_to_radians(degrees):
     return degrees * math.pi / 180
 
 # === RANDOM SAMPLING FUNCTIONS ===
+# Per-sample randomness (pixel jitter, lens, scatter) comes from the active
+# sampler (see samplers.py); scene construction keeps using random_double.
+# Samplers carry per-pixel state, so each thread has its own: set_sampler only
+# replaces the calling thread's (see the thread backend of the tile scheduler).
+class _ActiveSampler(threading.local):
+    sampler = samplers.RandomSampler()
+
+_active = _ActiveSampler()
+
+def set_sampler(sampler):
+    _active.sampler = sampler
+
+def get_sampler():
+    return _active.sampler
+
 def random_in_unit_sphere():
-    while True:
-        p = Vector3.random(-1, 1)
-        if p.length_squared() < 1:
-            return p
+    x, y, z = samplers.uniform_sphere(*_active.sampler.get_2d())
+    r = _active.sampler.get_1d() ** (1 / 3)
+    return Vector3(x * r, y * r, z * r)
 
 def random_unit_vector():
-    return random_in_unit_sphere().normalize()
+    return Vector3(*samplers.uniform_sphere(*_active.sampler.get_2d()))
 
 def random_in_unit_disk():
-    while True:
-        p = Vector3(random.uniform(-1,1), random.uniform(-1,1), 0)
-        if p.length_squared() < 1:
-            return p
+    x, y = samplers.concentric_disk(*_active.sampler.get_2d())
+    return Vector3(x, y, 0)
 
 def random_double(min_val=0.0, max_val=1.0):
     return random.uniform(min_val, max_val)
@@ -104,6 +130,12 @@ def refract(uv, n, etai_over_etat):
     r_out_parallel = n * (-math.sqrt(abs(1.0 - r_out_perp.length_squared())))
     return r_out_perp + r_out_parallel
 
+# Schlick's approximation for reflectance.
+def schlick_reflectance(cosine, ref_idx):
+    r0 = (1 - ref_idx) / (1 + ref_idx)
+    r0 = r0 * r0
+    return r0 + (1 - r0) * ((1 - cosine) ** 5)
+
 # === RAY CLASS ===
 class Ray:
     def __init__(self, origin, direction):
@@ -128,6 +160,9 @@ class Hittable:
     def hit(self, ray, t_min, t_max, rec):
         # Returns True if the ray hits the object and sets rec.
         pass
+    def bounding_box(self):
+        # Returns (min_x, min_y, min_z, max_x, max_y, max_z), or None if unbounded.
+        return None
 
 # === SPHERE (a Hittable) ===
 class Sphere(Hittable):
@@ -156,6 +191,10 @@ class Sphere(Hittable):
         rec.set_face_normal(ray, outward_normal)
         rec.material = self.material
         return True
+    def bounding_box(self):
+        c = self.center
+        r = abs(self.radius)
+        return (c.x - r, c.y - r, c.z - r, c.x + r, c.y + r, c.z + r)
 
 # === HITTABLE LIST ===
 class HittableList(Hittable):
@@ -178,6 +217,295 @@ class HittableList(Hittable):
                 rec.material = temp_rec.material
         return hit_anything
 
+# === STRUCT-OF-ARRAYS SPHERE STORE (a drop-in for HittableList) ===
+class SphereStore(Hittable):
+    # Spheres live in contiguous float64 arrays and refer to their material by
+    # id into a shared material table, instead of one Sphere object each.
+    def __init__(self, capacity=16):
+        self.count = 0
+        self._centers = np.empty((capacity, 3))
+        self._radii = np.empty(capacity)
+        self._radii_sq = np.empty(capacity)
+        self._material_ids = np.empty(capacity, dtype=np.int64)
+        self.materials = []
+        self._material_index = {}
+
+    @classmethod
+    def from_objects(cls, objects):
+        store = cls(max(len(objects), 1))
+        for obj in objects:
+            store.add(obj)
+        return store
+
+    @property
+    def centers(self):
+        return self._centers[:self.count]
+    @property
+    def radii(self):
+        return self._radii[:self.count]
+    @property
+    def material_ids(self):
+        return self._material_ids[:self.count]
+
+    def material_id(self, material):
+        key = id(material)
+        if key not in self._material_index:
+            self._material_index[key] = len(self.materials)
+            self.materials.append(material)
+        return self._material_index[key]
+
+    def add(self, obj):
+        # Accepts a Sphere so scene-building code works with either container.
+        self.add_sphere(obj.center, obj.radius, obj.material)
+
+    def add_sphere(self, center, radius, material):
+        n = self.count
+        if n == len(self._radii):
+            # Grow geometrically so building large scenes stays linear.
+            capacity = max(2 * n, 16)
+            self._centers = np.resize(self._centers, (capacity, 3))
+            self._radii = np.resize(self._radii, capacity)
+            self._radii_sq = np.resize(self._radii_sq, capacity)
+            self._material_ids = np.resize(self._material_ids, capacity)
+        self._centers[n] = center.to_tuple()
+        self._radii[n] = radius
+        self._radii_sq[n] = radius * radius
+        self._material_ids[n] = self.material_id(material)
+        self.count = n + 1
+
+    @property
+    def objects(self):
+        # Sphere views, for code that walks world.objects (e.g. BVH construction).
+        return [Sphere(Point3(*self._centers[k]), float(self._radii[k]), self.materials[self._material_ids[k]])
+                for k in range(self.count)]
+
+    def __getstate__(self):
+        # Pickle only the live part of the arrays; material ids are rebuilt on load.
+        n = self.count
+        return {"centers": self._centers[:n].copy(), "radii": self._radii[:n].copy(),
+                "material_ids": self._material_ids[:n].copy(), "materials": self.materials}
+
+    def __setstate__(self, state):
+        self._centers = state["centers"]
+        self._radii = state["radii"]
+        self._radii_sq = self._radii * self._radii
+        self._material_ids = state["material_ids"]
+        self.materials = state["materials"]
+        self.count = len(self._radii)
+        self._material_index = {id(m): k for k, m in enumerate(self.materials)}
+
+    def closest(self, ray, t_min, t_max):
+        # Tests all spheres at once; returns (index, t) of the nearest hit, or (-1, t_max).
+        n = self.count
+        if n == 0:
+            return -1, t_max
+        o = ray.origin
+        d = ray.direction
+        dvec = np.array((d.x, d.y, d.z))
+        oc = np.array((o.x, o.y, o.z)) - self._centers[:n]
+        a = d.length_squared()
+        half_b = oc @ dvec
+        c = np.einsum('ij,ij->i', oc, oc) - self._radii_sq[:n]
+        discriminant = half_b * half_b - a * c
+        # Only the few spheres whose discriminant is non-negative need roots.
+        candidates = np.flatnonzero(discriminant >= 0)
+        if len(candidates) == 0:
+            return -1, t_max
+        half_b = half_b[candidates]
+        sqrtd = np.sqrt(discriminant[candidates])
+        # Find the nearest root in the acceptable range.
+        root = (-half_b - sqrtd) / a
+        far = (root < t_min) | (root > t_max)
+        root = np.where(far, (-half_b + sqrtd) / a, root)
+        root[(root < t_min) | (root > t_max)] = np.inf
+        best = int(root.argmin())
+        t = float(root[best])
+        if t == math.inf:
+            return -1, t_max
+        return int(candidates[best]), t
+
+    def hit(self, ray, t_min, t_max, rec):
+        index, t = self.closest(ray, t_min, t_max)
+        if index < 0:
+            return False
+        # The hit record is filled once per ray, for the winning sphere only.
+        cx, cy, cz = self._centers[index].tolist()
+        radius = float(self._radii[index])
+        rec.t = t
+        rec.p = ray.at(t)
+        outward_normal = Vector3((rec.p.x - cx) / radius, (rec.p.y - cy) / radius, (rec.p.z - cz) / radius)
+        rec.set_face_normal(ray, outward_normal)
+        rec.material = self.materials[self._material_ids[index]]
+        return True
+
+    def bounding_box(self):
+        if self.count == 0:
+            return None
+        r = np.abs(self.radii)[:, None]
+        return tuple((self.centers - r).min(axis=0).tolist() + (self.centers + r).max(axis=0).tolist())
+
+# === BOUNDING VOLUME HIERARCHY (a drop-in for HittableList) ===
+def surface_area(box_min, box_max):
+    # Half the surface area of boxes given as (..., 3) arrays; the factor 2 cancels in SAH ratios.
+    e = np.maximum(box_max - box_min, 0.0)
+    return e[..., 0] * e[..., 1] + e[..., 1] * e[..., 2] + e[..., 2] * e[..., 0]
+
+class BVH(Hittable):
+    # Nodes are stored flattened in depth-first order: the left child of an interior
+    # node is always node + 1, so only the right child index needs to be stored.
+    TRAVERSAL_COST = 1.0
+    INTERSECT_COST = 1.0
+
+    def __init__(self, objects, max_leaf_size=4):
+        boxes = [obj.bounding_box() for obj in objects]
+        if any(box is None for box in boxes):
+            raise ValueError("BVH needs bounded objects")
+        self.max_leaf_size = max_leaf_size
+        box_array = np.array(boxes, dtype=np.float64).reshape(-1, 6)
+        self.node_bounds = []   # 6 floats per node: min x/y/z, max x/y/z
+        self.node_offset = []   # leaf: first object index; interior: right child index
+        self.node_count = []    # leaf: number of objects; interior: 0
+        self.node_axis = []     # interior: split axis, used for front-to-back ordering
+        order = []
+        if len(objects) > 0:
+            self._build(box_array, np.arange(len(objects)), order)
+        self.objects = [objects[i] for i in order]
+
+    def add(self, obj):
+        raise TypeError("BVH is immutable; build a new one from the full object list")
+
+    def _new_node(self, boxes):
+        node = len(self.node_count)
+        self.node_bounds.extend(boxes[:, :3].min(axis=0).tolist())
+        self.node_bounds.extend(boxes[:, 3:].max(axis=0).tolist())
+        self.node_offset.append(0)
+        self.node_count.append(0)
+        self.node_axis.append(0)
+        return node
+
+    def _make_leaf(self, node, indices, order):
+        self.node_offset[node] = len(order)
+        self.node_count[node] = len(indices)
+        order.extend(indices.tolist())
+
+    def _build(self, box_array, indices, order):
+        boxes = box_array[indices]
+        node = self._new_node(boxes)
+        n = len(indices)
+        if n == 1:
+            self._make_leaf(node, indices, order)
+            return node
+
+        # Full-sweep SAH: sort the centroids along each axis, then evaluate every
+        # split position using prefix/suffix bounds.
+        centroids = (boxes[:, :3] + boxes[:, 3:]) * 0.5
+        if np.all(centroids.max(axis=0) == centroids.min(axis=0)):
+            # Coincident centroids: no split separates them, so halve the list.
+            if n <= self.max_leaf_size:
+                self._make_leaf(node, indices, order)
+                return node
+            self._build(box_array, indices[:n // 2], order)
+            self.node_offset[node] = self._build(box_array, indices[n // 2:], order)
+            return node
+
+        best_cost, best_axis, best_split, best_perm = math.inf, -1, 0, None
+        for axis in range(3):
+            perm = np.argsort(centroids[:, axis], kind="stable")
+            lo = boxes[perm, :3]
+            hi = boxes[perm, 3:]
+            left_area = surface_area(np.minimum.accumulate(lo), np.maximum.accumulate(hi))[:-1]
+            right_area = surface_area(np.minimum.accumulate(lo[::-1])[::-1],
+                                      np.maximum.accumulate(hi[::-1])[::-1])[1:]
+            counts = np.arange(1, n)
+            costs = left_area * counts + right_area * (n - counts)
+            split = int(np.argmin(costs))
+            if costs[split] < best_cost:
+                best_cost, best_axis, best_split, best_perm = costs[split], axis, split + 1, perm
+
+        parent_area = surface_area(boxes[:, :3].min(axis=0), boxes[:, 3:].max(axis=0))
+        if parent_area > 0:
+            split_cost = self.TRAVERSAL_COST + self.INTERSECT_COST * best_cost / parent_area
+        else:
+            split_cost = math.inf
+        leaf_cost = self.INTERSECT_COST * n
+        if n <= self.max_leaf_size and leaf_cost <= split_cost:
+            self._make_leaf(node, indices, order)
+            return node
+
+        self.node_axis[node] = best_axis
+        sorted_indices = indices[best_perm]
+        self._build(box_array, sorted_indices[:best_split], order)
+        self.node_offset[node] = self._build(box_array, sorted_indices[best_split:], order)
+        return node
+
+    def bounding_box(self):
+        if not self.node_count:
+            return None
+        return tuple(self.node_bounds[:6])
+
+    def hit(self, ray, t_min, t_max, rec):
+        if not self.node_count:
+            return False
+        o = ray.origin
+        d = ray.direction
+        ox, oy, oz = o.x, o.y, o.z
+        # A huge finite value instead of inf avoids 0 * inf = nan in the slab test.
+        ix = 1.0 / d.x if d.x != 0 else 1e300
+        iy = 1.0 / d.y if d.y != 0 else 1e300
+        iz = 1.0 / d.z if d.z != 0 else 1e300
+        # Offsets (0 = min, 3 = max) of the near slab per axis.
+        nx = 3 if ix < 0 else 0
+        ny = 4 if iy < 0 else 1
+        nz = 5 if iz < 0 else 2
+        fx, fy, fz = 3 - nx, 5 - ny, 7 - nz
+        negative = (ix < 0, iy < 0, iz < 0)
+
+        bounds = self.node_bounds
+        offsets = self.node_offset
+        counts = self.node_count
+        axes = self.node_axis
+        objects = self.objects
+
+        hit_anything = False
+        closest_so_far = t_max
+        stack = [0]
+        while stack:
+            node = stack.pop()
+            b = node * 6
+            # Slab test, clipped to the current [t_min, closest_so_far] interval.
+            t0 = (bounds[b + nx] - ox) * ix
+            t1 = (bounds[b + fx] - ox) * ix
+            ty0 = (bounds[b + ny] - oy) * iy
+            ty1 = (bounds[b + fy] - oy) * iy
+            if ty0 > t0: t0 = ty0
+            if ty1 < t1: t1 = ty1
+            tz0 = (bounds[b + nz] - oz) * iz
+            tz1 = (bounds[b + fz] - oz) * iz
+            if tz0 > t0: t0 = tz0
+            if tz1 < t1: t1 = tz1
+            if t0 < t_min: t0 = t_min
+            if t1 > closest_so_far: t1 = closest_so_far
+            if t0 > t1:
+                continue
+
+            count = counts[node]
+            if count:
+                first = offsets[node]
+                for k in range(first, first + count):
+                    # A hit inside [t_min, closest_so_far] is always the new closest,
+                    # so the object can write straight into rec.
+                    if objects[k].hit(ray, t_min, closest_so_far, rec):
+                        hit_anything = True
+                        closest_so_far = rec.t
+            elif negative[axes[node]]:
+                # Push the far child first so the near child is visited first.
+                stack.append(node + 1)
+                stack.append(offsets[node])
+            else:
+                stack.append(offsets[node])
+                stack.append(node + 1)
+        return hit_anything
+
 # === MATERIALS ===
 class Material:
     # The scatter function returns a tuple: (bool, scattered_ray, attenuation)
@@ -219,14 +547,7 @@ class Dielectric(Material):
         cos_theta = min((-unit_direction).dot(rec.normal), 1.0)
         sin_theta = math.sqrt(1.0 - cos_theta * cos_theta)
         cannot_refract = etai_over_etat * sin_theta > 1.0
-
-        # Schlick's approximation for reflectance.
-        def reflectance(cosine, ref_idx):
-            r0 = (1 - ref_idx) / (1 + ref_idx)
-            r0 = r0 * r0
-            return r0 + (1 - r0) * ((1 - cosine) ** 5)
-
-        if cannot_refract or reflectance(cos_theta, etai_over_etat) > random.random():
+        if cannot_refract or schlick_reflectance(cos_theta, etai_over_etat) > _active.sampler.get_1d():
             direction = reflect(unit_direction, rec.normal)
         else:
             direction = refract(unit_direction, rec.normal, etai_over_etat)
@@ -261,6 +582,40 @@ class Camera:
         direction = self.lower_left_corner + self.horizontal * s + self.vertical * t - self.origin - offset
         return Ray(self.origin + offset, direction)
 
+    def pixel_basis(self, image_width, image_height):
+        # Precomputed parts of the primary ray directions for one image size: pixel (i, j)
+        # looks along columns[i] + rows[j], and a jitter of (du, dv) pixels adds du * step_u + dv * step_v.
+        # Kept separable so it costs O(width + height), not a vector per pixel.
+        basis = getattr(self, "_basis", None)
+        if basis is None or basis[0] != (image_width, image_height):
+            step_u = np.array(self.horizontal.to_tuple()) / (image_width - 1)
+            step_v = np.array(self.vertical.to_tuple()) / (image_height - 1)
+            corner = np.array((self.lower_left_corner - self.origin).to_tuple())
+            basis = ((image_width, image_height), corner + np.outer(np.arange(image_width), step_u),
+                     np.outer(np.arange(image_height), step_v), step_u, step_v)
+            self._basis = basis
+        return basis[1:]
+
+    def get_rays(self, i, j, du, dv, lens_u, lens_v, image_width, image_height):
+        # get_ray for a batch of samples: pixels (i, j) jittered by (du, dv), lens samples
+        # (lens_u, lens_v) in [0, 1)^2. Returns (n, 3) origins and unnormalized directions.
+        columns, rows, step_u, step_v = self.pixel_basis(image_width, image_height)
+        dx, dy = samplers.concentric_disks(lens_u, lens_v)
+        offset = (np.outer(dx * self.lens_radius, self.u.to_tuple())
+                  + np.outer(dy * self.lens_radius, self.v.to_tuple()))
+        directions = columns[i] + rows[j] + np.outer(du, step_u) + np.outer(dv, step_v) - offset
+        return np.array(self.origin.to_tuple()) + offset, directions
+
+def primary_rays(cam, i, j, index, image_width, image_height):
+    # Camera rays for one sample per (i, j, index) entry, generated together from the active
+    # sampler's pixel and lens dimensions, as lists of Rays for the scalar tracer. Each sample's
+    # remaining dimensions start at wavefront.CAMERA_DIMENSIONS (see start_pixel_sample).
+    keys = wavefront.path_keys(i, j, index)
+    du, dv = _active.sampler.sample_2d(*keys, 0)
+    lens_u, lens_v = _active.sampler.sample_2d(*keys, 2)
+    origins, directions = cam.get_rays(i, j, du, dv, lens_u, lens_v, image_width, image_height)
+    return [Ray(Vector3(*o), Vector3(*d)) for o, d in zip(origins.tolist(), directions.tolist())]
+
 # === RAY COLOR FUNCTION ===
 def ray_color(ray, world, depth):
     if depth <= 0:
@@ -278,6 +633,49 @@ def ray_color(ray, world, depth):
     # Linear blend: white to blue
     return Color(1.0, 1.0, 1.0) * (1.0 - t) + Color(0.5, 0.7, 1.0) * t
 
+# === ITERATIVE PATH INTEGRATOR ===
+WHITE = Color(1.0, 1.0, 1.0)
+
+def trace_path(ray, world, max_depth, rr_depth=0, aov=None):
+    # Iterative form of ray_color that carries the path throughput explicitly.
+    # From bounce rr_depth on (0 disables it), Russian roulette ends the path with
+    # probability 1 - p, where p is the largest throughput component, and divides
+    # surviving paths by p, so the expected result is unchanged.
+    # If aov is a list, it receives the first hit's albedo, normal and distance (7 floats).
+    tr, tg, tb = 1.0, 1.0, 1.0
+    rec = HitRecord()
+    for depth in range(max_depth):
+        if instrument.ENABLED:
+            instrument.count(f"rays at depth {depth}")
+        if not world.hit(ray, 0.001, float('inf'), rec):
+            unit_direction = ray.direction.normalize()
+            t = 0.5 * (unit_direction.y + 1.0)
+            # Linear blend: white to blue
+            sr, sg = 1.0 - 0.5 * t, 1.0 - 0.3 * t
+            if aov is not None and depth == 0:
+                # Misses see the sky: its colour is their albedo; normal and distance stay zero.
+                aov[:] = (sr, sg, 1.0, 0.0, 0.0, 0.0, 0.0)
+            return Color(tr * sr, tg * sg, tb)
+        if aov is not None and depth == 0:
+            albedo = getattr(rec.material, "albedo", WHITE)
+            n = rec.normal
+            aov[:] = (albedo.x, albedo.y, albedo.z, n.x, n.y, n.z, rec.t * ray.direction.length())
+        scattered_ok, scattered, attenuation = rec.material.scatter(ray, rec)
+        if not scattered_ok:
+            return Color(0, 0, 0)
+        tr *= attenuation.x
+        tg *= attenuation.y
+        tb *= attenuation.z
+        if rr_depth and depth + 1 >= rr_depth:
+            p = min(max(tr, tg, tb), 0.95)
+            if random.random() >= p:
+                return Color(0, 0, 0)
+            tr /= p
+            tg /= p
+            tb /= p
+        ray = scattered
+    return Color(0, 0, 0)
+
 # === COLOR OUTPUT (with gamma correction) ===
 def write_color(pixel_color, samples_per_pixel):
     scale = 1.0 / samples_per_pixel
@@ -291,38 +689,496 @@ def write_color(pixel_color, samples_per_pixel):
     return (ir, ig, ib)
 
 # === SCANLINE RENDERING FUNCTION (for the process pool) ===
-def compute_scanline(j, image_width, image_height, samples_per_pixel, cam, world, max_depth):
+def compute_scanline(j, image_width, image_height, samples_per_pixel, cam, world, max_depth, rr_depth=0, sampler=None):
+    if sampler is not None:
+        if isinstance(sampler, samplers.RandomSampler):
+            # Every task gets a copy of the same rng; a stream per row keeps the rows' jitter independent.
+            sampler = sampler.spawn(j)
+        set_sampler(sampler)
     scanline = []
     for i in range(image_width):
         pixel_color = Color(0, 0, 0)
-        for s in range(samples_per_pixel):
-            u = (i + random_double()) / (image_width - 1)
-            v = (j + random_double()) / (image_height - 1)
-            r = cam.get_ray(u, v)
-            pixel_color += ray_color(r, world, max_depth)
+        rays = primary_rays(cam, np.full(samples_per_pixel, i), np.full(samples_per_pixel, j),
+                            np.arange(samples_per_pixel), image_width, image_height)
+        for s, r in enumerate(rays):
+            _active.sampler.start_pixel_sample(i, j, s, wavefront.CAMERA_DIMENSIONS)
+            pixel_color += trace_path(r, world, max_depth, rr_depth)
         scanline.append(write_color(pixel_color, samples_per_pixel))
     return j, scanline
 
-# === MAIN FUNCTION: SETUP THE SCENE AND RENDER ===
-def main():
-    # Image settings.
-    aspect_ratio = 2.0
-    image_width = 400
-    image_height = 200
+# === WAVEFRONT RENDERING (for the process pool) ===
+def pack_world(world):
+    # Flatten the world into the array layout used by wavefront.py.
+    store = world if isinstance(world, SphereStore) else SphereStore.from_objects(world.objects)
+    table = shading.MaterialTable()
+    for mat in store.materials:
+        if isinstance(mat, Lambertian):
+            table.add_lambertian(mat.albedo.to_tuple())
+        elif isinstance(mat, Metal):
+            table.add_metal(mat.albedo.to_tuple(), mat.fuzz)
+        elif isinstance(mat, Dielectric):
+            table.add_dielectric(mat.ref_idx)
+        else:
+            raise TypeError(f"wavefront mode does not support {type(mat).__name__}")
+    return wavefront.PackedScene(store.centers, store.radii, store.material_ids, table.freeze())
+
+def compute_band_wavefront(j0, j1, image_width, image_height, samples_per_pixel, cam, scene, max_depth, rr_depth=0, sampler=None):
+    accum = wavefront.render_tile(scene, cam, 0, j0, image_width, j1, image_width, image_height,
+                                  samples_per_pixel, max_depth, rr_depth=rr_depth, sampler=sampler)
+    return j0, j1, accum
+
+# === INSTRUMENTATION ===
+# Wrapped only once instrument.enable() is called (--profile); see instrument.py.
+instrument.register(Sphere, "hit", counter="ray-sphere tests")
+instrument.register(SphereStore, "closest", counter="ray-sphere tests", weight=lambda store, *args: store.count)
+instrument.register(HittableList, "hit", stage="HittableList.hit")
+instrument.register(SphereStore, "hit", stage="SphereStore.hit")
+instrument.register(BVH, "hit", stage="BVH.hit")
+for _material in (Lambertian, Metal, Dielectric):
+    instrument.register(_material, "scatter", stage="Material.scatter")
+instrument.register(wavefront, "intersect", stage="wavefront.intersect")
+instrument.register(shading, "shade", stage="shading.shade")
+instrument.register(wavefront, "draw_2d", stage="wavefront.draw_2d")
+
+def submit(executor, profile, fn, *args):
+    # Submits fn(*args); when profiling, the task also reports its worker's counters.
+    if profile is None:
+        return executor.submit(fn, *args)
+    return executor.submit(instrument.task, fn, *args)
+
+def collect(future, profile):
+    if profile is None:
+        return future.result()
+    return profile.add(*future.result())
+
+# === RENDER SETTINGS ===
+class RenderSettings:
+    def __init__(self, image_width, image_height, samples_per_pixel, max_depth, mode="scanline",
+                 adaptive=False, min_spp=16, max_spp=None, noise_target=0.02, rr_depth=0,
+                 sampler="random", sampler_seed=0, aovs=False):
+        self.image_width = image_width
+        self.image_height = image_height
+        self.samples_per_pixel = samples_per_pixel
+        self.max_depth = max_depth
+        self.mode = mode
+        # Adaptive sampling: samples_per_pixel becomes the average budget per pixel.
+        self.adaptive = adaptive
+        self.min_spp = min_spp
+        self.max_spp = max_spp if max_spp is not None else 4 * samples_per_pixel
+        self.noise_target = noise_target
+        # Russian roulette starts at this bounce; 0 disables it.
+        self.rr_depth = rr_depth
+        # Name of a sampler in samplers.SAMPLERS.
+        self.sampler = sampler
+        self.sampler_seed = sampler_seed
+        # Accumulate first-hit albedo, normal and distance next to the colour.
+        self.aovs = aovs
+
+# === FRAMEBUFFER LAYOUT ===
+# Channels of the shared framebuffer; everything but the count is a sum over samples.
+AOV_CHANNELS = wavefront.AOV_CHANNELS
+FB_COLOR = slice(0, 3)
+FB_COUNT = 3
+FB_AOV = slice(4, 4 + AOV_CHANNELS)
+FB_ALBEDO = slice(4, 7)
+FB_NORMAL = slice(7, 10)
+FB_DEPTH = 10
+FB_CHANNELS = 4 + AOV_CHANNELS
+
+# === TILE SCHEDULER (for the process pool) ===
+# Per-process render state, filled once by init_tile_worker so the scene is
+# pickled once per worker instead of once per task. The thread backend fills
+# it once in the rendering process and every thread reads the same scene.
+_tile_state = {}
+
+def uses_jit(settings):
+    # The compiled tracer needs Numba and the random sampler; otherwise jit mode runs the scalar tracer.
+    return settings.mode == "jit" and jit.AVAILABLE and settings.sampler == "random"
+
+def init_tile_state(cam, world, settings):
+    # Fills _tile_state for render_tile; also used by render_farm workers, which have no framebuffer.
+    if uses_jit(settings):
+        jit.warm_up()
+    _tile_state.update(
+        cam=cam, world=world, settings=settings,
+        scene=pack_world(world) if settings.mode == "wavefront" else None,
+        jit_scene=jit.pack(pack_world(world), world if isinstance(world, BVH) else None)
+        if uses_jit(settings) else None,
+        jit_camera=jit.pack_camera(cam) if uses_jit(settings) else None,
+        # The wavefront tracer draws its own vectorized uniforms when the sampler is purely random.
+        sampler=None if settings.sampler == "random" else samplers.make_sampler(
+            settings.sampler, settings.samples_per_pixel, settings.sampler_seed))
+    set_sampler(samplers.make_sampler(settings.sampler, settings.samples_per_pixel, settings.sampler_seed))
+    return _tile_state
+
+def init_tile_worker(cam, world, shm_name, settings, framebuffer_path=None):
+    # The framebuffer is either a shared memory block or, with framebuffer_path, a .npy file
+    # mapped by every worker together with its tile ledger (see CHECKPOINTS).
+    init_tile_state(cam, world, settings)
+    if framebuffer_path is not None:
+        _tile_state.update(framebuffer=np.load(framebuffer_path, mmap_mode="r+"),
+                           ledger=np.load(checkpoint_paths(framebuffer_path)[0], mmap_mode="r+"))
+        return
+    shm = shared_memory.SharedMemory(name=shm_name)
+    _tile_state.update(
+        shm=shm, ledger=None,
+        framebuffer=np.ndarray((settings.image_height, settings.image_width, FB_CHANNELS), dtype=np.float64,
+                               buffer=shm.buf))
+
+def init_tile_thread(settings):
+    # Thread backend: the threads share the parent's _tile_state (scene, framebuffer) and
+    # only need a sampler of their own.
+    set_sampler(samplers.make_sampler(settings.sampler, settings.samples_per_pixel, settings.sampler_seed))
+
+def sample_pixels(cam, world, i, j, index, image_width, image_height, max_depth, rr_depth=0, aovs=False):
+    # One trace_path sample per (i, j) entry, as an (n, 3) array, or (n, 10) with the
+    # first-hit AOVs appended; index is the entry's sample number within its pixel.
+    out = np.empty((len(i), 3 + AOV_CHANNELS if aovs else 3))
+    aov = [0.0] * AOV_CHANNELS if aovs else None
+    rays = primary_rays(cam, i, j, index, image_width, image_height)
+    for k, (x, y, s) in enumerate(zip(i.tolist(), j.tolist(), index.tolist())):
+        _active.sampler.start_pixel_sample(x, y, s, wavefront.CAMERA_DIMENSIONS)
+        out[k, :3] = trace_path(rays[k], world, max_depth, rr_depth, aov).to_tuple()
+        if aovs:
+            out[k, 3:] = aov
+    return out
+
+def render_tile_scalar(cam, world, x0, y0, x1, y1, image_width, image_height, samples_per_pixel, max_depth, rr_depth=0,
+                       aovs=False, first_sample=0):
+    # Summed radiance of pixels [x0, x1) x [y0, y1), traced one sample at a time with
+    # trace_path; with aovs the summed first-hit AOVs follow the colour channels.
+    # Sample numbers start at first_sample, so separate passes draw distinct samples.
+    accum = np.empty((y1 - y0, x1 - x0, 3 + AOV_CHANNELS if aovs else 3))
+    aov = [0.0] * AOV_CHANNELS if aovs else None
+    aov_sum = [0.0] * AOV_CHANNELS
+    samples = np.arange(first_sample, first_sample + samples_per_pixel)
+    for j in range(y0, y1):
+        # All primary rays of the row at once; the loop below only traces them.
+        columns = np.repeat(np.arange(x0, x1), samples_per_pixel)
+        rays = primary_rays(cam, columns, np.full(len(columns), j), np.tile(samples, x1 - x0),
+                            image_width, image_height)
+        for i in range(x0, x1):
+            pixel_color = Color(0, 0, 0)
+            if aovs:
+                aov_sum = [0.0] * AOV_CHANNELS
+            for k, s in enumerate(range(first_sample, first_sample + samples_per_pixel)):
+                _active.sampler.start_pixel_sample(i, j, s, wavefront.CAMERA_DIMENSIONS)
+                r = rays[(i - x0) * samples_per_pixel + k]
+                pixel_color += trace_path(r, world, max_depth, rr_depth, aov)
+                if aovs:
+                    aov_sum = [a + b for a, b in zip(aov_sum, aov)]
+            accum[j - y0, i - x0, :3] = pixel_color.to_tuple()
+            if aovs:
+                accum[j - y0, i - x0, 3:] = aov_sum
+    return accum
+
+def render_tile(st, x0, y0, x1, y1, first_sample=0, samples_per_pixel=None):
+    # Returns (summed samples, sample counts) for one tile; the samples carry the
+    # AOV channels after the colour when settings.aovs is set. Without adaptive
+    # sampling, a tile may be rendered as several passes of samples_per_pixel
+    # samples starting at first_sample (the whole budget by default).
+    settings = st["settings"]
+    if samples_per_pixel is None:
+        samples_per_pixel = settings.samples_per_pixel
+    cam, world = st["cam"], st["world"]
+    w, h = settings.image_width, settings.image_height
+    channels = 3 + AOV_CHANNELS if settings.aovs else 3
+    if settings.adaptive:
+        if settings.mode == "wavefront":
+            def sample_fn(i, j, index):
+                return wavefront.render_samples(st["scene"], cam, i, j, w, h, settings.max_depth,
+                                                rr_depth=settings.rr_depth, sampler=st["sampler"], index=index,
+                                                aovs=settings.aovs)
+        elif st["jit_scene"] is not None:
+            def sample_fn(i, j, index):
+                return jit.render_samples(st["jit_scene"], st["jit_camera"], i, j, w, h, settings.max_depth,
+                                          settings.rr_depth, channels, jit.new_seed())
+        else:
+            def sample_fn(i, j, index):
+                return sample_pixels(cam, world, i, j, index, w, h, settings.max_depth, settings.rr_depth,
+                                     settings.aovs)
+        return adaptive.render_tile_adaptive(sample_fn, x0, y0, x1, y1, settings.samples_per_pixel,
+                                             settings.min_spp, settings.max_spp, settings.noise_target,
+                                             channels=channels)
+    if settings.mode == "wavefront":
+        accum = wavefront.render_tile(st["scene"], cam, x0, y0, x1, y1, w, h,
+                                      samples_per_pixel, settings.max_depth, rr_depth=settings.rr_depth,
+                                      sampler=st["sampler"], aovs=settings.aovs, first_sample=first_sample)
+    elif st["jit_scene"] is not None:
+        accum = jit.render_tile(st["jit_scene"], st["jit_camera"], x0, y0, x1, y1, w, h, samples_per_pixel,
+                                settings.max_depth, settings.rr_depth, channels, jit.new_seed())
+    else:
+        accum = render_tile_scalar(cam, world, x0, y0, x1, y1, w, h,
+                                   samples_per_pixel, settings.max_depth, settings.rr_depth, settings.aovs,
+                                   first_sample)
+    return accum, samples_per_pixel
+
+def accumulate_tile(framebuffer, x0, y0, x1, y1, accum, counts):
+    # Adds a tile's sample sums and counts into the framebuffer, so several
+    # passes over the same tile merge into one estimate.
+    fb = framebuffer[y0:y1, x0:x1]
+    fb[:, :, FB_COLOR] += accum[:, :, :3]
+    fb[:, :, FB_COUNT] += counts
+    if accum.shape[2] > 3:
+        fb[:, :, FB_AOV] += accum[:, :, 3:]
+
+def compute_tiles(units):
+    # Renders a batch of work units straight into the shared framebuffer; only the count goes back.
+    # A unit is (tile index, tile, first sample, samples per pixel, passes the tile has finished after it).
+    st = _tile_state
+    for index, (x0, y0, x1, y1), first_sample, samples_per_pixel, passes in units:
+        accum, counts = render_tile(st, x0, y0, x1, y1, first_sample, samples_per_pixel)
+        accumulate_tile(st["framebuffer"], x0, y0, x1, y1, accum, counts)
+        if st["ledger"] is not None:
+            st["ledger"][index] = passes
+    return len(units)
+
+def make_tiles(image_width, image_height, tile_size):
+    return [(x0, y0, min(x0 + tile_size, image_width), min(y0 + tile_size, image_height))
+            for y0 in range(0, image_height, tile_size)
+            for x0 in range(0, image_width, tile_size)]
+
+def run_units(executor, units, workers, profile=None, checkpoint=None, deadline=None):
+    # Feeds work units (see compute_tiles) to the pool and returns how many finished.
+    # checkpoint holds the (framebuffer, ledger) memmaps to sync every CHECKPOINT_SECONDS.
+    # Past the deadline no new unit starts and queued ones are cancelled; running ones finish.
+    pending = deque(units)
+    completed = 0
+    last_checkpoint = start_time = time.time()
+    in_flight = set()
+    while pending or in_flight:
+        if deadline is not None and time.time() >= deadline:
+            pending.clear()
+            for future in in_flight:
+                future.cancel()
+        # Keep every worker busy with a couple of queued batches. Batches follow
+        # guided self-scheduling: big while much work remains, single tiles near the
+        # end so no worker is left with a long tail. Against a deadline every batch is
+        # a single tile, so the render stops within a tile of it.
+        while pending and len(in_flight) < 2 * workers:
+            chunk = 1 if deadline is not None else min(len(pending), max(1, len(pending) // (4 * workers)))
+            batch = [pending.popleft() for _ in range(chunk)]
+            in_flight.add(submit(executor, profile, compute_tiles, batch))
+        timeout = max(0.0, deadline - time.time()) if deadline is not None and pending else None
+        done, in_flight = concurrent.futures.wait(in_flight, timeout=timeout,
+                                                  return_when=concurrent.futures.FIRST_COMPLETED)
+        for future in done:
+            if not future.cancelled():
+                completed += collect(future, profile)
+        print_progress(completed, len(units), start_time)
+        if checkpoint is not None and time.time() - last_checkpoint > CHECKPOINT_SECONDS:
+            # The workers' writes are already in the page cache; this also gets them onto the disk.
+            for memmap in checkpoint:
+                memmap.flush()
+            last_checkpoint = time.time()
+    return completed
+
+def render_tiles(cam, world, settings, tile_size=16, workers=None, profile=None, framebuffer_path=None,
+                 resume_passes=None, time_budget=None, on_pass=None, backend="processes"):
+    # Returns the framebuffer (see FB_*), top row first like the image: a copy of the shared
+    # memory block, or with framebuffer_path a flipped view of the .npy file the workers
+    # accumulated into, so the image never has to fit in memory. The file is also a
+    # checkpoint; resume_passes continues the one already there (see CHECKPOINTS).
+    # With time_budget (seconds) the render is progressive: full-frame passes of
+    # samples_per_pixel samples each, until the next pass would overrun the budget;
+    # on_pass(framebuffer, passes) is called after each one.
+    # backend "threads" renders with a thread pool in this process instead: the threads share
+    # one scene and accumulate straight into one framebuffer, so nothing is pickled. It only
+    # runs in parallel where the tracer releases the GIL (the jit kernels, NumPy in wavefront
+    # mode) or on a free-threaded Python build.
+    workers = workers or os.cpu_count() or 1
+    image_width, image_height = settings.image_width, settings.image_height
+    shape = (image_height, image_width, FB_CHANNELS)
+    tiles = make_tiles(image_width, image_height, tile_size)
+    passes = list(resume_passes or [(0, settings.samples_per_pixel)])
+
+    def save_state():
+        save_checkpoint_state(framebuffer_path, dict(version=CHECKPOINT_VERSION, cam=cam, world=world,
+                                                     settings=settings, tile_size=tile_size, passes=passes))
+    shm = checkpoint = None
+    if framebuffer_path is not None:
+        checkpoint = framebuffer, ledger = open_checkpoint(framebuffer_path, shape, len(tiles),
+                                                           resume_passes is not None)
+        save_state()
+    elif backend == "threads":
+        framebuffer = np.zeros(shape)
+    else:
+        shm = shared_memory.SharedMemory(create=True, size=image_height * image_width * FB_CHANNELS * 8)
+    try:
+        if shm is not None:
+            framebuffer = np.ndarray(shape, dtype=np.float64, buffer=shm.buf)
+            framebuffer[:] = 0.0
+        # Passes are contiguous runs of sample numbers, so whatever a tile still lacks is one unit.
+        units = []
+        for index, tile in enumerate(tiles):
+            finished = int(ledger[index]) if checkpoint is not None else 0
+            if finished < len(passes):
+                first_sample = passes[finished][0]
+                units.append((index, tile, first_sample, sum(n for _, n in passes) - first_sample, len(passes)))
+        start_time = time.time()
+        if uses_jit(settings):
+            # Compile or load the cached kernels once here, so the workers only load them.
+            jit.warm_up()
+
+        if backend == "threads":
+            init_tile_state(cam, world, settings)
+            _tile_state.update(framebuffer=framebuffer, ledger=ledger if checkpoint is not None else None)
+            executor = concurrent.futures.ThreadPoolExecutor(max_workers=workers, initializer=init_tile_thread,
+                                                             initargs=(settings,))
+        else:
+            executor = concurrent.futures.ProcessPoolExecutor(
+                max_workers=workers, initializer=init_tile_worker,
+                initargs=(cam, world, shm and shm.name, settings, framebuffer_path))
+        with executor:
+            if time_budget is None:
+                run_units(executor, units, workers, profile, checkpoint)
+            else:
+                deadline = start_time + time_budget
+                while True:
+                    pass_start = time.time()
+                    # The first pass always completes so every pixel has samples. Later passes cut
+                    # short by the deadline still count: the means use per-pixel sample counts.
+                    if run_units(executor, units, workers, profile, checkpoint,
+                                 deadline if len(passes) > 1 else None) < len(units):
+                        break
+                    if on_pass is not None:
+                        on_pass(framebuffer[::-1], len(passes))
+                    # The last pass is the best estimate of the next; the first one also paid for start-up.
+                    now = time.time()
+                    if now + (now - pass_start) > deadline:
+                        break
+                    passes.append((sum(n for _, n in passes), settings.samples_per_pixel))
+                    if checkpoint is not None:
+                        save_state()
+                    units = [(index, tile) + passes[-1] + (len(passes),) for index, tile in enumerate(tiles)]
+
+        # Rows are accumulated bottom-up (j = 0 is the bottom of the image).
+        if shm is None:
+            if checkpoint is not None:
+                for memmap in checkpoint:
+                    memmap.flush()
+            return framebuffer[::-1]
+        result = framebuffer[::-1].copy()
+        del framebuffer
+    finally:
+        if shm is not None:
+            shm.close()
+            shm.unlink()
+    return result
+
+# === CHECKPOINTS ===
+# A render into a framebuffer file can be stopped at any point and resumed. Next to fb.npy,
+# fb.npy.tiles.npy counts the passes each tile has finished; a worker bumps it right after
+# adding the tile into the framebuffer. fb.npy.state pickles the camera, world, settings,
+# tile size and the passes, each a (first sample, samples per pixel) run of sample numbers.
+# The sample number is all the hash-based samplers key their sequences on, so a resumed tile
+# continues exactly where it stopped; the random sampler draws fresh entropy in every process.
+CHECKPOINT_VERSION = 1
+# How often the parent syncs the framebuffer file to disk while rendering.
+CHECKPOINT_SECONDS = 30
+
+def checkpoint_paths(framebuffer_path):
+    return framebuffer_path + ".tiles.npy", framebuffer_path + ".state"
 
-    samples_per_pixel = 200
-    max_depth = 20
+def open_checkpoint(framebuffer_path, shape, tile_count, resume=False):
+    # Returns the (framebuffer, tile ledger) memmaps; new files are sparse and read back as zeros.
+    ledger_path = checkpoint_paths(framebuffer_path)[0]
+    if not resume:
+        return (np.lib.format.open_memmap(framebuffer_path, mode="w+", dtype=np.float64, shape=shape),
+                np.lib.format.open_memmap(ledger_path, mode="w+", dtype=np.int32, shape=(tile_count,)))
+    framebuffer = np.load(framebuffer_path, mmap_mode="r+")
+    ledger = np.load(ledger_path, mmap_mode="r+")
+    if framebuffer.shape != shape or ledger.shape != (tile_count,):
+        raise ValueError(f"{framebuffer_path} does not match its checkpoint state")
+    return framebuffer, ledger
 
-    # World (a list of hittable objects)
-    world = HittableList()
+def save_checkpoint_state(framebuffer_path, state):
+    # Written to a temporary file first so a crash never leaves a torn state file.
+    state_path = checkpoint_paths(framebuffer_path)[1]
+    tmp = f"{state_path}.{os.getpid()}.tmp"
+    with open(tmp, "wb") as f:
+        pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp, state_path)
+
+def load_checkpoint_state(framebuffer_path):
+    with open(checkpoint_paths(framebuffer_path)[1], "rb") as f:
+        state = pickle.load(f)
+    if state.get("version") != CHECKPOINT_VERSION:
+        raise ValueError(f"{framebuffer_path}: unsupported checkpoint version {state.get('version')}")
+    return state
+
+def framebuffer_means(framebuffer):
+    # Per-pixel means of the colour and AOV channels.
+    counts = np.maximum(framebuffer[:, :, FB_COUNT], 1)[:, :, None]
+    return framebuffer / counts
+
+def framebuffer_to_image(framebuffer, denoised=False):
+    means = framebuffer_means(framebuffer)
+    color = means[:, :, FB_COLOR]
+    if denoised:
+        color = denoise.denoise(color, means[:, :, FB_ALBEDO], means[:, :, FB_NORMAL], means[:, :, FB_DEPTH])
+    return Image.fromarray(wavefront.to_rgb8(color, 1), "RGB")
+
+def save_framebuffer_image(framebuffer, output, denoised=False, band_rows=64):
+    # Writes the image a band of rows at a time, so only one band of pixel means is ever
+    # in memory. The denoiser filters across bands and needs the whole image at once.
+    height, width = framebuffer.shape[:2]
+    if denoised or not output.lower().endswith(".png"):
+        framebuffer_to_image(framebuffer, denoised).save(output)
+        return
+    with png_stream.PNGStreamWriter(output, width, height) as out:
+        for r0 in range(0, height, band_rows):
+            means = framebuffer_means(framebuffer[r0:r0 + band_rows])
+            out.write_rows(wavefront.to_rgb8(means[:, :, FB_COLOR], 1))
+
+def save_aovs(framebuffer, output):
+    # Writes <stem>_albedo.png, <stem>_normal.png and <stem>_depth.png next to the output image.
+    stem = os.path.splitext(output)[0]
+    means = framebuffer_means(framebuffer)
+    Image.fromarray(wavefront.to_rgb8(means[:, :, FB_ALBEDO], 1), "RGB").save(stem + "_albedo.png")
+    normal = (np.clip(means[:, :, FB_NORMAL], -1, 1) + 1) * 127.5
+    Image.fromarray(normal.astype(np.uint8), "RGB").save(stem + "_normal.png")
+    depth = means[:, :, FB_DEPTH]
+    far = max(float(depth.max()), 1e-9)
+    # Near surfaces are bright; misses (depth 0) stay black.
+    shade = np.where(depth > 0, 255 * (1 - 0.8 * depth / far), 0)
+    Image.fromarray(shade.astype(np.uint8), "L").save(stem + "_depth.png")
+
+def save_sample_map(counts, path):
+    # .npy keeps the raw counts; any other extension is written as a grayscale image scaled to the maximum.
+    if path.endswith(".npy"):
+        np.save(path, counts.astype(np.int64))
+        return
+    peak = max(float(counts.max()), 1.0)
+    Image.fromarray((255 * counts / peak).astype(np.uint8), "L").save(path)
+
+# === PROGRESS BAR ===
+def print_progress(completed, total, start_time, bar_length=50):
+    # Calculate progress and estimated remaining time.
+    elapsed = time.time() - start_time
+    progress = completed / total
+    estimated_total = elapsed / progress if progress > 0 else 0
+    remaining = estimated_total - elapsed
+
+    # Build progress bar string.
+    num_hashes = int(progress * bar_length)
+    progress_bar = '[' + '#' * num_hashes + '-' * (bar_length - num_hashes) + ']'
+    sys.stdout.write(f"\rProgress: {progress_bar} {progress*100:5.1f}%  Elapsed: {elapsed:5.1f}s  ETA: {remaining:5.1f}s")
+    sys.stdout.flush()
+
+# === SCENE SETUP ===
+def build_world(grid=11, world=None):
+    # World (a list of hittable objects, or any container with add(sphere))
+    if world is None:
+        world = HittableList()
 
     # Ground: a large sphere.
     ground_material = Lambertian(Color(0.5, 0.5, 0.5))
     world.add(Sphere(Point3(0, -1000, 0), 1000, ground_material))
 
     # Random small spheres.
-    for a in range(-11, 11):
-        for b in range(-11, 11):
+    for a in range(-grid, grid):
+        for b in range(-grid, grid):
             choose_mat = random_double()
             center = Point3(a + 0.9 * random_double(), 0.2, b + 0.9 * random_double())
             if (center - Point3(4, 0.2, 0)).length() > 0.9:
@@ -349,7 +1205,9 @@ def main():
     world.add(Sphere(Point3(-4, 1, 0), 1.0, material2))
     material3 = Metal(Color(0.7, 0.6, 0.5), 0.0)
     world.add(Sphere(Point3(4, 1, 0), 1.0, material3))
+    return world
 
+def build_camera(aspect_ratio):
     # Camera parameters.
     lookfrom = Point3(13, 2, 3)
     lookat = Point3(0, 0, 0)
@@ -357,47 +1215,259 @@ def main():
     vfov = 20  # vertical field-of-view in degrees.
     focus_dist = 10.0
     aperture = 0.0  # aperture=0 means no defocus blur.
+    return Camera(lookfrom, lookat, vup, vfov, aspect_ratio, aperture, focus_dist)
 
-    cam = Camera(lookfrom, lookat, vup, vfov, aspect_ratio, aperture, focus_dist)
+# === SCENE FILES ===
+def build_scene_world(scene, accel="list"):
+    # The scene's spheres as a world for the given --accel; other object types are skipped.
+    world = SphereStore() if accel == "soa" else HittableList()
+    materials = {}
+    for obj in scene_file.supported(scene, ("sphere",), "Project_1"):
+        # Spheres naming the same material share one Material object.
+        key = id(obj["material"])
+        if key not in materials:
+            kind, params = scene_file.path_material(obj["material"])
+            if kind == "metal":
+                materials[key] = Metal(Color(*params["albedo"]), params["fuzz"])
+            elif kind == "dielectric":
+                materials[key] = Dielectric(params["ref_idx"])
+            else:
+                materials[key] = Lambertian(Color(*params["albedo"]))
+        world.add(Sphere(Point3(*obj["center"]), obj["radius"], materials[key]))
+    if accel == "bvh":
+        world = BVH(world.objects)
+    return world
 
-    # Create image.
-    image = Image.new("RGB", (image_width, image_height))
-    pixels = image.load()
+def load_scene(path, accel="list", use_cache=True):
+    # Returns (world, camera settings). The built world comes from the scene's binary
+    # sidecar cache when neither the scene nor this file has changed since it was written.
+    scene, world = scene_file.cached(path, "project1-" + accel, lambda s: build_scene_world(s, accel),
+                                     sources=[os.path.abspath(__file__)], use_cache=use_cache)
+    return world, scene["camera"]
 
-    print("Rendering...")
+def scene_camera(spec):
+    # Returns (camera, aspect ratio). Scenes written for the Whitted renderers only give a
+    # position and viewport, which become a camera looking down +z with the same field of view.
+    if "lookfrom" in spec:
+        aspect_ratio = spec.get("aspect_ratio", 2.0)
+        cam = Camera(Point3(*spec["lookfrom"]), Point3(*spec.get("lookat", [0, 0, 0])),
+                     Vector3(*spec.get("vup", [0, 1, 0])), spec.get("vfov", 20), aspect_ratio,
+                     spec.get("aperture", 0.0), spec.get("focus_dist", 10.0))
+        return cam, aspect_ratio
+    position = Point3(*spec.get("position", [0, 0, 0]))
+    viewport_width, viewport_height = spec.get("viewport", [1, 1])
+    distance = spec.get("projection_plane_d", 1)
+    vfov = math.degrees(2 * math.atan(viewport_height / (2 * distance)))
+    aspect_ratio = viewport_width / viewport_height
+    cam = Camera(position, position + Vector3(0, 0, 1), Vector3(0, 1, 0), vfov, aspect_ratio, 0.0, distance)
+    return cam, aspect_ratio
 
-    start_time = time.time()  # Start timer
-    total_scanlines = image_height
+# === RENDER LOOPS ===
+def render_scanlines(image, cam, world, image_width, image_height, samples_per_pixel, max_depth, rr_depth=0, sampler=None,
+                     profile=None):
+    pixels = image.load()
+    start_time = time.time()
     completed_scanlines = 0
-    bar_length = 50  # length of progress bar
 
     # Use ProcessPoolExecutor for parallelism.
     with concurrent.futures.ProcessPoolExecutor() as executor:
         # Submit one task per scanline (j goes from image_height-1 down to 0).
-        futures = {executor.submit(compute_scanline, j, image_width, image_height, samples_per_pixel, cam, world, max_depth): j
+        futures = {submit(executor, profile, compute_scanline, j, image_width, image_height, samples_per_pixel, cam, world, max_depth, rr_depth, sampler): j
                    for j in range(image_height - 1, -1, -1)}
         for future in concurrent.futures.as_completed(futures):
-            j, scanline = future.result()
+            j, scanline = collect(future, profile)
             row = image_height - j - 1
             for i, pixel in enumerate(scanline):
                 pixels[i, row] = pixel
             completed_scanlines += 1
+            print_progress(completed_scanlines, image_height, start_time)
 
-            # Calculate progress and estimated remaining time.
-            elapsed = time.time() - start_time
-            progress = completed_scanlines / total_scanlines
-            estimated_total = elapsed / progress if progress > 0 else 0
-            remaining = estimated_total - elapsed
+def render_wavefront(image, cam, world, image_width, image_height, samples_per_pixel, max_depth, rr_depth=0, sampler=None,
+                     band_height=8, profile=None):
+    scene = pack_world(world)
+    accum = np.zeros((image_height, image_width, 3))
+    start_time = time.time()
+    bands = [(j0, min(j0 + band_height, image_height)) for j0 in range(0, image_height, band_height)]
+    completed_bands = 0
 
-            # Build progress bar string.
-            num_hashes = int(progress * bar_length)
-            progress_bar = '[' + '#' * num_hashes + '-' * (bar_length - num_hashes) + ']'
-            sys.stdout.write(f"\rProgress: {progress_bar} {progress*100:5.1f}%  Elapsed: {elapsed:5.1f}s  ETA: {remaining:5.1f}s")
-            sys.stdout.flush()
+    with concurrent.futures.ProcessPoolExecutor() as executor:
+        futures = [submit(executor, profile, compute_band_wavefront, j0, j1, image_width, image_height, samples_per_pixel, cam, scene, max_depth, rr_depth, sampler)
+                   for j0, j1 in bands]
+        for future in concurrent.futures.as_completed(futures):
+            j0, j1, band = collect(future, profile)
+            accum[j0:j1] = band
+            completed_bands += 1
+            print_progress(completed_bands, len(bands), start_time)
 
-    end_time = time.time()  # End timer
-    image.save("final_scene.png")
+    # Rows are accumulated bottom-up (j = 0 is the bottom of the image).
+    image.paste(Image.fromarray(wavefront.to_rgb8(accum[::-1], samples_per_pixel), "RGB"))
+
+# === MAIN FUNCTION: SETUP THE SCENE AND RENDER ===
+def main():
+    parser = argparse.ArgumentParser(description="Render the Project 1 random-sphere scene.")
+    parser.add_argument("--mode", choices=["scanline", "wavefront", "jit"], default="scanline",
+                        help="scanline: recursive per-sample tracer; wavefront: batched NumPy path tracer; "
+                             "jit: the per-sample tracer compiled with Numba (scanline without it)")
+    parser.add_argument("--width", type=int, default=400)
+    parser.add_argument("--spp", type=int, default=200, help="samples per pixel")
+    parser.add_argument("--max-depth", type=int, default=20)
+    parser.add_argument("--output", default="final_scene.png")
+    parser.add_argument("--rr-depth", type=int, default=0,
+                        help="start Russian roulette path termination at this bounce (0 disables it)")
+    parser.add_argument("--scheduler", choices=["tiles", "rows"], default="tiles",
+                        help="tiles: dynamically scheduled tiles in a shared framebuffer; rows: one task per scanline/band")
+    parser.add_argument("--tile-size", type=int, default=16)
+    parser.add_argument("--workers", type=int, default=None, help="worker processes or threads (default: all cores)")
+    parser.add_argument("--backend", choices=["processes", "threads"], default="processes",
+                        help="tiles: render with a process pool, or with a thread pool sharing one scene and "
+                             "framebuffer (parallel for --mode jit/wavefront, or on a free-threaded Python)")
+    parser.add_argument("--sampler", choices=sorted(samplers.SAMPLERS), default="random",
+                        help="pixel/lens/bounce sample sequence: random, stratified (correlated multi-jittered), "
+                             "sobol (Owen-scrambled) or bluenoise")
+    parser.add_argument("--adaptive", action="store_true",
+                        help="variance-driven adaptive sampling; --spp becomes the average budget per pixel")
+    parser.add_argument("--min-spp", type=int, default=16, help="adaptive: warm-up samples for every pixel")
+    parser.add_argument("--max-spp", type=int, default=None, help="adaptive: cap per pixel (default: 4 * --spp)")
+    parser.add_argument("--noise-target", type=float, default=0.02,
+                        help="adaptive: stop a pixel once its 95%% confidence half-width is below this fraction of its mean")
+    parser.add_argument("--sample-map", default=None,
+                        help="write the per-pixel sample counts to this path (.npy or an image format)")
+    parser.add_argument("--aovs", action="store_true",
+                        help="also write first-hit albedo, normal and depth images next to the output")
+    parser.add_argument("--denoise", action="store_true",
+                        help="denoise the colour with an edge-avoiding a-trous filter guided by the AOVs")
+    parser.add_argument("--accel", choices=["list", "bvh", "soa"], default="list",
+                        help="list: test every object per ray; bvh: SAH bounding volume hierarchy; "
+                             "soa: struct-of-arrays sphere store tested with NumPy")
+    parser.add_argument("--grid", type=int, default=11,
+                        help="the random small spheres cover a (2*grid) x (2*grid) field")
+    parser.add_argument("--scene", default=None,
+                        help="render a scene file (see scenes/) instead of the random sphere field")
+    parser.add_argument("--no-scene-cache", action="store_true",
+                        help="always rebuild the scene instead of using its sidecar cache")
+    parser.add_argument("--profile", default=None, metavar="TRACE_JSON",
+                        help="count rays and time the hot stages, print a summary and write a Chrome trace")
+    parser.add_argument("--framebuffer", default=None, metavar="PATH.npy",
+                        help="accumulate into this disk-backed .npy file instead of shared memory (tiles only); "
+                             "it doubles as a checkpoint")
+    parser.add_argument("--resume", action="store_true",
+                        help="continue the render checkpointed in --framebuffer; its scene and settings are used")
+    parser.add_argument("--add-samples", type=int, default=None, metavar="N",
+                        help="refine the render checkpointed in --framebuffer with N more samples per pixel")
+    parser.add_argument("--time-budget", type=float, default=None, metavar="SECONDS",
+                        help="progressive: render full-frame passes of --spp samples until the budget is spent")
+    parser.add_argument("--preview", action="store_true",
+                        help="progressive: rewrite --output after every pass")
+    args = parser.parse_args()
+    if args.scheduler == "rows" and (args.adaptive or args.sample_map or args.aovs or args.denoise):
+        parser.error("--adaptive, --sample-map, --aovs and --denoise need --scheduler tiles")
+    if args.framebuffer and (args.scheduler == "rows" or not args.framebuffer.endswith(".npy")):
+        parser.error("--framebuffer needs --scheduler tiles and a .npy path")
+    if (args.resume or args.add_samples) and not args.framebuffer:
+        parser.error("--resume and --add-samples need the --framebuffer of an earlier render")
+    if args.time_budget is not None and (args.scheduler == "rows" or args.adaptive or args.resume or args.add_samples):
+        parser.error("--time-budget needs --scheduler tiles and cannot be combined with --adaptive, --resume "
+                     "or --add-samples")
+    if args.preview and args.time_budget is None:
+        parser.error("--preview needs --time-budget")
+    if args.backend == "threads" and (args.scheduler == "rows" or args.profile):
+        parser.error("--backend threads needs --scheduler tiles and cannot be combined with --profile")
+    if args.mode == "jit":
+        if args.scheduler == "rows":
+            parser.error("--mode jit needs --scheduler tiles")
+        if not jit.AVAILABLE:
+            print("Numba is not available; --mode jit runs the scalar tracer.", file=sys.stderr)
+        elif args.sampler != "random":
+            print("--mode jit only supports the random sampler; running the scalar tracer.", file=sys.stderr)
+        else:
+            if args.profile:
+                print("--profile cannot see inside the compiled kernels; only task times are reported.",
+                      file=sys.stderr)
+            print(f"JIT kernels ready in {jit.warm_up():.2f}s")
+
+    resume_passes = None
+    if args.resume or args.add_samples:
+        # The checkpoint carries the scene and settings, so the random sphere field comes back unchanged.
+        state = load_checkpoint_state(args.framebuffer)
+        cam, world, settings, tile_size = state["cam"], state["world"], state["settings"], state["tile_size"]
+        resume_passes = state["passes"]
+        if args.add_samples:
+            if settings.adaptive:
+                parser.error("--add-samples cannot refine an adaptive render")
+            resume_passes = resume_passes + [(sum(n for _, n in resume_passes), args.add_samples)]
+        image_width, image_height = settings.image_width, settings.image_height
+        print(f"Resuming {args.framebuffer}: {image_width}x{image_height}, "
+              f"{sum(n for _, n in resume_passes)} samples per pixel")
+    elif args.scene:
+        world, camera_spec = load_scene(args.scene, args.accel, not args.no_scene_cache)
+        cam, aspect_ratio = scene_camera(camera_spec)
+    else:
+        aspect_ratio = 2.0
+        world = build_world(args.grid, SphereStore() if args.accel == "soa" else None)
+        if args.accel == "bvh":
+            world = BVH(world.objects)
+        cam = build_camera(aspect_ratio)
+
+    # Image settings.
+    if resume_passes is None:
+        image_width = args.width
+        image_height = int(image_width / aspect_ratio)
+
+    samples_per_pixel = args.spp
+    max_depth = args.max_depth
+
+    print("Rendering...")
+
+    profile = None
+    if args.profile:
+        profile = instrument.Profile()
+        instrument.enable()
+
+    start_time = time.time()  # Start timer
+    if args.scheduler == "tiles":
+        if resume_passes is None:
+            settings = RenderSettings(image_width, image_height, samples_per_pixel, max_depth, args.mode,
+                                      args.adaptive, args.min_spp, args.max_spp, args.noise_target, args.rr_depth,
+                                      args.sampler, aovs=args.aovs or args.denoise)
+            tile_size = args.tile_size
+        on_pass = None
+        if args.preview:
+            def on_pass(framebuffer, passes):
+                save_framebuffer_image(framebuffer, args.output)
+        framebuffer = render_tiles(cam, world, settings, tile_size, args.workers, profile, args.framebuffer,
+                                   resume_passes, args.time_budget, on_pass, args.backend)
+        end_time = time.time()  # End timer
+        if args.time_budget is not None:
+            print(f"\nProgressive: {framebuffer[:, :, FB_COUNT].mean():.1f} samples per pixel "
+                  f"in {end_time - start_time:.2f} of {args.time_budget:g} seconds")
+        # A resumed render only has AOVs if the original run recorded them.
+        save_framebuffer_image(framebuffer, args.output, denoised=args.denoise and settings.aovs)
+        if args.sample_map:
+            save_sample_map(framebuffer[:, :, FB_COUNT], args.sample_map)
+        if args.aovs and settings.aovs:
+            save_aovs(framebuffer, args.output)
+    else:
+        # Create image.
+        image = Image.new("RGB", (image_width, image_height))
+        if args.mode == "wavefront":
+            sampler = None if args.sampler == "random" else samplers.make_sampler(args.sampler, samples_per_pixel)
+            render_wavefront(image, cam, world, image_width, image_height, samples_per_pixel, max_depth, args.rr_depth,
+                             sampler, profile=profile)
+        else:
+            sampler = samplers.make_sampler(args.sampler, samples_per_pixel)
+            render_scanlines(image, cam, world, image_width, image_height, samples_per_pixel, max_depth, args.rr_depth,
+                             sampler, profile)
+        end_time = time.time()  # End timer
+        image.save(args.output)
     print(f"\nDone. Total render time: {end_time - start_time:.2f} seconds")
+    if profile is not None:
+        profile.finish()
+        print()
+        print(profile.summary())
+        profile.write_chrome_trace(args.profile)
 
 if __name__ == "__main__":
-    main()
+    # Run from the importable module, so pickled worlds (scene sidecars, checkpoints) always
+    # name RayTracer.* classes and load the same way in render_farm, render_service and here.
+    import RayTracer
+    RayTracer.main()
@@ -0,0 +1,97 @@
+import numpy as np
+
+# === VARIANCE-DRIVEN ADAPTIVE SAMPLING ===
+# Every pixel of a tile keeps a running mean and variance (Welford). After a
+# warm-up of min_spp samples, pixels whose confidence interval is already
+# below the noise target stop sampling, and the tile's remaining budget
+# (samples_per_pixel * pixel count) goes to the noisiest pixels first.
+
+# Two-sided 95% confidence interval.
+Z_95 = 1.96
+# Keeps the relative error of near-black pixels finite.
+BLACK_LEVEL = 1e-3
+
+def luminance(colors):
+    return colors @ np.array([0.2126, 0.7152, 0.0722])
+
+def occurrence_rank(pixels):
+    # For every entry, how many earlier entries name the same pixel.
+    order = np.argsort(pixels, kind="stable")
+    sorted_pixels = pixels[order]
+    first = np.r_[True, sorted_pixels[1:] != sorted_pixels[:-1]]
+    group_start = np.maximum.accumulate(np.where(first, np.arange(len(pixels)), 0))
+    rank = np.empty(len(pixels), dtype=np.int64)
+    rank[order] = np.arange(len(pixels)) - group_start
+    return rank
+
+class PixelStats:
+    # Welford running statistics: mean of every sample channel (colour first, then
+    # any AOVs) plus the variance of the colour's luminance.
+    def __init__(self, n_pixels, channels=3):
+        self.count = np.zeros(n_pixels, dtype=np.int64)
+        self.mean = np.zeros((n_pixels, channels))
+        self.lum_mean = np.zeros(n_pixels)
+        self.lum_m2 = np.zeros(n_pixels)
+
+    def update(self, pixels, samples):
+        # samples[k] belongs to pixels[k]; a pixel may appear several times, so the
+        # update is applied in rounds in which every pixel appears at most once.
+        lum = luminance(samples[:, :3])
+        rank = occurrence_rank(pixels)
+        for r in range(int(rank.max()) + 1 if len(pixels) else 0):
+            sel = rank == r
+            p = pixels[sel]
+            self.count[p] += 1
+            n = self.count[p]
+            delta = samples[sel] - self.mean[p]
+            self.mean[p] += delta / n[:, None]
+            lum_delta = lum[sel] - self.lum_mean[p]
+            self.lum_mean[p] += lum_delta / n
+            self.lum_m2[p] += lum_delta * (lum[sel] - self.lum_mean[p])
+
+    def relative_error(self):
+        # Half-width of the confidence interval of the mean, relative to the mean.
+        n = np.maximum(self.count, 2)
+        variance = self.lum_m2 / (n - 1)
+        half_width = Z_95 * np.sqrt(variance / n)
+        return half_width / np.maximum(self.lum_mean, BLACK_LEVEL)
+
+def render_tile_adaptive(sample_fn, x0, y0, x1, y1, samples_per_pixel, min_spp, max_spp, noise_target, batch=4,
+                         channels=3):
+    # sample_fn(i, j, index) returns an (n, channels) array with one sample per (i, j)
+    # entry, colour first; index is the entry's sample number within its pixel.
+    # Returns (summed samples (h, w, channels), sample counts (h, w)) for pixels [x0, x1) x [y0, y1).
+    w = x1 - x0
+    h = y1 - y0
+    n_pixels = w * h
+    min_spp = max(2, min(min_spp, max_spp))
+    budget = max(samples_per_pixel, min_spp) * n_pixels
+    stats = PixelStats(n_pixels, channels)
+
+    def sample(pixels):
+        # Entries of the same pixel get consecutive sample numbers after its current count.
+        index = stats.count[pixels] + occurrence_rank(pixels)
+        stats.update(pixels, sample_fn(x0 + pixels % w, y0 + pixels // w, index))
+
+    # Warm-up: every pixel gets min_spp samples.
+    sample(np.repeat(np.arange(n_pixels), min_spp))
+    used = min_spp * n_pixels
+
+    while used < budget:
+        error = stats.relative_error()
+        active = np.flatnonzero((stats.count < max_spp) & (error > noise_target))
+        if len(active) == 0:
+            break
+        # Noisiest pixels first, as many as the remaining budget allows.
+        active = active[np.argsort(-error[active], kind="stable")]
+        per_pixel = np.minimum(batch, max_spp - stats.count[active])
+        affordable = np.searchsorted(np.cumsum(per_pixel), budget - used, side="right")
+        if affordable == 0:
+            affordable = 1
+        active = active[:affordable]
+        per_pixel = per_pixel[:affordable]
+        sample(np.repeat(active, per_pixel))
+        used += int(per_pixel.sum())
+
+    sums = stats.mean * stats.count[:, None]
+    return sums.reshape(h, w, channels), stats.count.reshape(h, w)
@@ -0,0 +1,323 @@
+import math
+import os
+import time
+import numpy as np
+import shading
+
+try:
+    import numba
+except ImportError:
+    numba = None
+
+# === OPTIONAL JIT-COMPILED PATH TRACER ===
+# The scalar tracer's per-sample loop -- camera ray, Sphere.hit, BVH traversal,
+# scatter and Russian roulette -- written as plain float code over the packed
+# scene arrays and compiled with Numba. Compiled machine code is cached on disk
+# (__pycache__, or $NUMBA_CACHE_DIR), so only the first run pays for compilation;
+# warm_up() loads or compiles it before a render starts. Without Numba (or with
+# RAYTRACER_NO_JIT set) AVAILABLE is False and callers fall back to the scalar
+# tracer. Only the random sampler is supported: samples come from Numba's own
+# generator, seeded per call.
+
+AVAILABLE = numba is not None and not os.environ.get("RAYTRACER_NO_JIT")
+
+def njit(fn):
+    if numba is None:
+        return fn
+    return numba.njit(cache=True, nogil=True)(fn)
+
+LAMBERTIAN = shading.LAMBERTIAN
+METAL = shading.METAL
+DIELECTRIC = shading.DIELECTRIC
+
+# === PACKING ===
+def tree_depth(offsets, counts):
+    # Levels of a packed BVH. Both children of a node come after it, so one pass in
+    # node order sees every parent before its children.
+    depth = np.ones(len(counts), dtype=np.int64)
+    for node in range(len(counts)):
+        if not counts[node]:
+            depth[node + 1] = depth[offsets[node]] = depth[node] + 1
+    return int(depth.max())
+
+def pack(scene, bvh=None):
+    # Flattens a wavefront.PackedScene into the arrays the kernels take. Spheres must be in
+    # the BVH's object order when bvh is given; otherwise one leaf holds every sphere.
+    table = scene.materials
+    m = len(table.kinds)
+    albedo = np.ones((m, 3))
+    param = np.zeros(m)
+    for k in range(m):
+        kind, local = int(table.kinds[k]), int(table.local_ids[k])
+        if kind == LAMBERTIAN:
+            albedo[k] = table.lambertian_albedo[local]
+        elif kind == METAL:
+            albedo[k] = table.metal_albedo[local]
+            param[k] = table.metal_fuzz[local]
+        else:
+            param[k] = table.dielectric_ref_idx[local]
+    if bvh is not None and bvh.node_count:
+        bounds = np.array(bvh.node_bounds, dtype=np.float64).reshape(-1, 6)
+        offsets = np.array(bvh.node_offset, dtype=np.int64)
+        counts = np.array(bvh.node_count, dtype=np.int64)
+        axes = np.array(bvh.node_axis, dtype=np.int64)
+        depth = tree_depth(offsets, counts)
+    else:
+        r = np.abs(scene.radii)[:, None]
+        box = np.concatenate(((scene.centers - r).min(axis=0), (scene.centers + r).max(axis=0))) \
+            if len(scene.radii) else np.zeros(6)
+        bounds = box.reshape(1, 6)
+        offsets = np.zeros(1, dtype=np.int64)
+        counts = np.array([len(scene.radii)], dtype=np.int64)
+        axes = np.zeros(1, dtype=np.int64)
+        depth = 1
+    # The SAH build has no depth bound (coincident centroids can make a tree about n deep),
+    # so closest_hit sizes its stack from the tree. Visiting a node at level d leaves at most
+    # d - 1 pending siblings and pushes two children; interior nodes sit above the last
+    # level, so the stack never holds more entries than the tree has levels.
+    stack_size = depth
+    return (scene.centers, scene.radii, scene.material_ids, np.asarray(table.kinds, dtype=np.int64), albedo, param,
+            bounds, offsets, counts, axes, stack_size)
+
+def pack_camera(cam):
+    # origin, lower-left corner, horizontal, vertical, u, v, lens radius.
+    values = []
+    for vec in (cam.origin, cam.lower_left_corner, cam.horizontal, cam.vertical, cam.u, cam.v):
+        values.extend(vec.to_tuple())
+    values.append(cam.lens_radius)
+    return np.array(values, dtype=np.float64)
+
+def new_seed():
+    return int(np.random.default_rng().integers(1 << 32))
+
+# === INTERSECTION KERNELS ===
+@njit
+def sphere_hit(ox, oy, oz, dx, dy, dz, cx, cy, cz, radius, t_min, t_max):
+    # Sphere.hit: the nearest root in [t_min, t_max], or inf.
+    ocx, ocy, ocz = ox - cx, oy - cy, oz - cz
+    a = dx * dx + dy * dy + dz * dz
+    half_b = ocx * dx + ocy * dy + ocz * dz
+    c = ocx * ocx + ocy * ocy + ocz * ocz - radius * radius
+    discriminant = half_b * half_b - a * c
+    if discriminant < 0:
+        return math.inf
+    sqrtd = math.sqrt(discriminant)
+    root = (-half_b - sqrtd) / a
+    if root < t_min or root > t_max:
+        root = (-half_b + sqrtd) / a
+        if root < t_min or root > t_max:
+            return math.inf
+    return root
+
+@njit
+def closest_hit(scene, ox, oy, oz, dx, dy, dz, t_min, t_max):
+    # BVH.hit over the packed nodes; returns (sphere index, t), or (-1, t_max).
+    centers, radii, bounds, offsets, counts, axes = scene[0], scene[1], scene[6], scene[7], scene[8], scene[9]
+    stack_size = scene[10]
+    ix = 1.0 / dx if dx != 0 else 1e300
+    iy = 1.0 / dy if dy != 0 else 1e300
+    iz = 1.0 / dz if dz != 0 else 1e300
+    nx = 3 if ix < 0 else 0
+    ny = 4 if iy < 0 else 1
+    nz = 5 if iz < 0 else 2
+    negative = (ix < 0, iy < 0, iz < 0)
+    stack = np.empty(stack_size, dtype=np.int64)
+    stack[0] = 0
+    top = 1
+    best = -1
+    closest_so_far = t_max
+    while top > 0:
+        top -= 1
+        node = stack[top]
+        b = bounds[node]
+        t0 = (b[nx] - ox) * ix
+        t1 = (b[3 - nx] - ox) * ix
+        ty0 = (b[ny] - oy) * iy
+        ty1 = (b[5 - ny] - oy) * iy
+        t0 = max(t0, ty0, (b[nz] - oz) * iz, t_min)
+        t1 = min(t1, ty1, (b[7 - nz] - oz) * iz, closest_so_far)
+        if t0 > t1:
+            continue
+        count = counts[node]
+        if count:
+            first = offsets[node]
+            for k in range(first, first + count):
+                t = sphere_hit(ox, oy, oz, dx, dy, dz, centers[k, 0], centers[k, 1], centers[k, 2], radii[k],
+                               t_min, closest_so_far)
+                if t < closest_so_far:
+                    best = k
+                    closest_so_far = t
+        elif negative[axes[node]]:
+            # Far child first, so the near child is visited first.
+            stack[top] = node + 1
+            stack[top + 1] = offsets[node]
+            top += 2
+        else:
+            stack[top] = offsets[node]
+            stack[top + 1] = node + 1
+            top += 2
+    return best, closest_so_far
+
+# === SAMPLING AND SCATTERING ===
+@njit
+def uniform_sphere(u, v):
+    z = 1 - 2 * u
+    r = math.sqrt(max(0.0, 1 - z * z))
+    phi = 2 * math.pi * v
+    return r * math.cos(phi), r * math.sin(phi), z
+
+@njit
+def concentric_disk(u, v):
+    a = 2 * u - 1
+    b = 2 * v - 1
+    if a == 0 and b == 0:
+        return 0.0, 0.0
+    if abs(a) > abs(b):
+        r, phi = a, (math.pi / 4) * (b / a)
+    else:
+        r, phi = b, (math.pi / 2) - (math.pi / 4) * (a / b)
+    return r * math.cos(phi), r * math.sin(phi)
+
+@njit
+def camera_ray(camera, s, t):
+    # Camera.get_ray, as (origin, direction) components.
+    dx, dy = concentric_disk(np.random.random(), np.random.random())
+    dx *= camera[18]
+    dy *= camera[18]
+    offset_x = camera[12] * dx + camera[15] * dy
+    offset_y = camera[13] * dx + camera[16] * dy
+    offset_z = camera[14] * dx + camera[17] * dy
+    return (camera[0] + offset_x, camera[1] + offset_y, camera[2] + offset_z,
+            camera[3] + camera[6] * s + camera[9] * t - camera[0] - offset_x,
+            camera[4] + camera[7] * s + camera[10] * t - camera[1] - offset_y,
+            camera[5] + camera[8] * s + camera[11] * t - camera[2] - offset_z)
+
+@njit
+def trace_sample(scene, ox, oy, oz, dx, dy, dz, max_depth, rr_depth, aov):
+    # trace_path for one camera ray; the first hit's AOVs are written into aov.
+    centers, radii, material_ids, kinds, albedo, param = scene[0], scene[1], scene[2], scene[3], scene[4], scene[5]
+    tr, tg, tb = 1.0, 1.0, 1.0
+    for depth in range(max_depth):
+        index, t = closest_hit(scene, ox, oy, oz, dx, dy, dz, 0.001, math.inf)
+        length = math.sqrt(dx * dx + dy * dy + dz * dz)
+        if index < 0:
+            sky = 0.5 * (dy / length + 1.0)
+            sr, sg = 1.0 - 0.5 * sky, 1.0 - 0.3 * sky
+            if depth == 0:
+                aov[0], aov[1], aov[2] = sr, sg, 1.0
+                aov[3:] = 0.0
+            return tr * sr, tg * sg, tb
+        px, py, pz = ox + dx * t, oy + dy * t, oz + dz * t
+        radius = radii[index]
+        nx = (px - centers[index, 0]) / radius
+        ny = (py - centers[index, 1]) / radius
+        nz = (pz - centers[index, 2]) / radius
+        front_face = dx * nx + dy * ny + dz * nz < 0
+        if not front_face:
+            nx, ny, nz = -nx, -ny, -nz
+        m = material_ids[index]
+        kind = kinds[m]
+        if depth == 0:
+            aov[0], aov[1], aov[2] = albedo[m, 0], albedo[m, 1], albedo[m, 2]
+            aov[3], aov[4], aov[5], aov[6] = nx, ny, nz, t * length
+        if kind == LAMBERTIAN:
+            ux, uy, uz = uniform_sphere(np.random.random(), np.random.random())
+            sx, sy, sz = nx + ux, ny + uy, nz + uz
+            if abs(sx) < 1e-8 and abs(sy) < 1e-8 and abs(sz) < 1e-8:
+                sx, sy, sz = nx, ny, nz
+        elif kind == METAL:
+            ux, uy, uz = dx / length, dy / length, dz / length
+            cos = 2 * (ux * nx + uy * ny + uz * nz)
+            fx, fy, fz = uniform_sphere(np.random.random(), np.random.random())
+            fuzz = param[m] * np.random.random() ** (1 / 3)
+            sx, sy, sz = ux - nx * cos + fx * fuzz, uy - ny * cos + fy * fuzz, uz - nz * cos + fz * fuzz
+            if sx * nx + sy * ny + sz * nz <= 0:
+                return 0.0, 0.0, 0.0
+        else:
+            eta = 1.0 / param[m] if front_face else param[m]
+            ux, uy, uz = dx / length, dy / length, dz / length
+            cos_theta = min(-(ux * nx + uy * ny + uz * nz), 1.0)
+            sin_theta = math.sqrt(max(1.0 - cos_theta * cos_theta, 0.0))
+            r0 = (1 - eta) / (1 + eta)
+            r0 = r0 * r0
+            reflectance = r0 + (1 - r0) * (1 - cos_theta) ** 5
+            if eta * sin_theta > 1.0 or reflectance > np.random.random():
+                cos = 2 * (ux * nx + uy * ny + uz * nz)
+                sx, sy, sz = ux - nx * cos, uy - ny * cos, uz - nz * cos
+            else:
+                qx, qy, qz = (ux + nx * cos_theta) * eta, (uy + ny * cos_theta) * eta, (uz + nz * cos_theta) * eta
+                parallel = -math.sqrt(abs(1.0 - (qx * qx + qy * qy + qz * qz)))
+                sx, sy, sz = qx + nx * parallel, qy + ny * parallel, qz + nz * parallel
+        tr *= albedo[m, 0]
+        tg *= albedo[m, 1]
+        tb *= albedo[m, 2]
+        if rr_depth and depth + 1 >= rr_depth:
+            p = min(max(tr, tg, tb), 0.95)
+            if np.random.random() >= p:
+                return 0.0, 0.0, 0.0
+            tr /= p
+            tg /= p
+            tb /= p
+        ox, oy, oz, dx, dy, dz = px, py, pz, sx, sy, sz
+    return 0.0, 0.0, 0.0
+
+# === PER-PIXEL SAMPLE LOOPS ===
+@njit
+def render_tile(scene, camera, x0, y0, x1, y1, image_width, image_height, samples_per_pixel, max_depth, rr_depth,
+                channels, seed):
+    # Same result as RayTracer.render_tile_scalar: summed samples of [x0, x1) x [y0, y1), with
+    # the summed first-hit AOVs after the colour when channels > 3.
+    np.random.seed(seed)
+    accum = np.zeros((y1 - y0, x1 - x0, channels))
+    aov = np.zeros(7)
+    for j in range(y0, y1):
+        for i in range(x0, x1):
+            for _ in range(samples_per_pixel):
+                u = (i + np.random.random()) / (image_width - 1)
+                v = (j + np.random.random()) / (image_height - 1)
+                ox, oy, oz, dx, dy, dz = camera_ray(camera, u, v)
+                r, g, b = trace_sample(scene, ox, oy, oz, dx, dy, dz, max_depth, rr_depth, aov)
+                out = accum[j - y0, i - x0]
+                out[0] += r
+                out[1] += g
+                out[2] += b
+                if channels > 3:
+                    out[3:] += aov
+    return accum
+
+@njit
+def render_samples(scene, camera, i, j, image_width, image_height, max_depth, rr_depth, channels, seed):
+    # One sample per (i, j) entry, as an (n, channels) array (RayTracer.sample_pixels).
+    np.random.seed(seed)
+    out = np.zeros((len(i), channels))
+    aov = np.zeros(7)
+    for k in range(len(i)):
+        u = (i[k] + np.random.random()) / (image_width - 1)
+        v = (j[k] + np.random.random()) / (image_height - 1)
+        ox, oy, oz, dx, dy, dz = camera_ray(camera, u, v)
+        out[k, 0], out[k, 1], out[k, 2] = trace_sample(scene, ox, oy, oz, dx, dy, dz, max_depth, rr_depth, aov)
+        if channels > 3:
+            out[k, 3:] = aov
+    return out
+
+# === WARM-UP ===
+_warm = False
+
+def warm_up():
+    # Loads (or, on the first run, compiles and caches) every kernel by rendering one pixel of a
+    # one-sphere scene; returns the seconds it took. Later calls in the same process are free.
+    global _warm
+    if _warm or not AVAILABLE:
+        return 0.0
+    start = time.perf_counter()
+    table = shading.MaterialTable()
+    table.add_lambertian((0.5, 0.5, 0.5))
+    scene = (np.zeros((1, 3)), np.ones(1), np.zeros(1, dtype=np.int64), np.asarray(table.kinds, dtype=np.int64),
+             np.full((1, 3), 0.5), np.zeros(1), np.array([[-1.0, -1.0, -1.0, 1.0, 1.0, 1.0]]),
+             np.zeros(1, dtype=np.int64), np.ones(1, dtype=np.int64), np.zeros(1, dtype=np.int64), 1)
+    camera = np.zeros(19)
+    camera[5] = -1.0
+    render_tile(scene, camera, 0, 0, 1, 1, 2, 2, 1, 2, 0, 3 + 7, 0)
+    render_samples(scene, camera, np.zeros(1, dtype=np.int64), np.zeros(1, dtype=np.int64), 2, 2, 2, 0, 3 + 7, 0)
+    _warm = True
+    return time.perf_counter() - start
@@ -0,0 +1,321 @@
+import argparse
+import multiprocessing
+import os
+import pickle
+import secrets
+import threading
+import time
+from collections import deque
+from multiprocessing.connection import Client, Listener
+
+import numpy as np
+
+import RayTracer
+import samplers
+
+# === RENDER FARM ===
+# A coordinator pickles the scene, camera and settings once and serves work
+# units -- (tile, first sample, sample count) -- to worker processes over
+# multiprocessing.connection sockets (length-prefixed pickles, HMAC handshake
+# with a shared authkey). Workers may run on other hosts. Workers send back
+# summed samples and counts, which are added into one framebuffer, so several
+# passes of the same tile can come from different nodes. Units held by a
+# worker whose connection drops go back to the queue. Units that take far
+# longer than usual are handed to an idle worker as well; whichever copy
+# finishes first is kept and the other is discarded.
+#
+# Pickles are only safe between trusted machines: run the farm on a private
+# network and give every node the same secret --authkey. There is no default key;
+# `local` makes up a random one, since its workers are its own child processes.
+
+DEFAULT_PORT = 5050
+AUTHKEY_ENV = "RENDER_FARM_AUTHKEY"
+# Idle workers poll again after this many seconds while the last units finish.
+POLL_INTERVAL = 0.2
+# A unit counts as slow once it has run this many times the mean unit time...
+SLOW_FACTOR = 4.0
+# ...and at least this many seconds.
+MIN_SLOW_SECONDS = 5.0
+
+# === WORK QUEUE (coordinator side) ===
+class WorkUnit:
+    def __init__(self, unit_id, tile, first_sample, samples):
+        self.unit_id = unit_id
+        self.tile = tile
+        self.first_sample = first_sample
+        self.samples = samples
+        # worker id -> time the unit was handed to that worker.
+        self.holders = {}
+        self.done = False
+
+class WorkQueue:
+    def __init__(self, tiles, samples_per_pixel, pass_spp):
+        self.units = []
+        for first in range(0, samples_per_pixel, pass_spp):
+            n = min(pass_spp, samples_per_pixel - first)
+            for tile in tiles:
+                self.units.append(WorkUnit(len(self.units), tile, first, n))
+        self.pending = deque(self.units)
+        self.completed = 0
+        self.unit_seconds = 0.0
+        self.lock = threading.Lock()
+        self.finished = threading.Condition(self.lock)
+
+    def is_done(self):
+        return self.completed == len(self.units)
+
+    def next_unit(self, worker_id):
+        # Returns a unit for this worker, or None if it should poll again later.
+        with self.lock:
+            while self.pending:
+                unit = self.pending.popleft()
+                if not unit.done:
+                    unit.holders[worker_id] = time.time()
+                    return unit
+            return self._speculate(worker_id)
+
+    def _speculate(self, worker_id):
+        # Nothing is queued: duplicate the longest-running slow unit, if any.
+        now = time.time()
+        mean = self.unit_seconds / self.completed if self.completed else 0.0
+        limit = max(MIN_SLOW_SECONDS, SLOW_FACTOR * mean)
+        slowest, slowest_age = None, limit
+        for unit in self.units:
+            if unit.done or not unit.holders or worker_id in unit.holders:
+                continue
+            age = now - min(unit.holders.values())
+            if age > slowest_age:
+                slowest, slowest_age = unit, age
+        if slowest is not None:
+            slowest.holders[worker_id] = now
+        return slowest
+
+    def complete(self, worker_id, unit_id):
+        # Marks the unit finished; returns False if another worker beat this one to it.
+        with self.lock:
+            unit = self.units[unit_id]
+            started = unit.holders.pop(worker_id, None)
+            if unit.done:
+                return False
+            unit.done = True
+            unit.holders.clear()
+            self.completed += 1
+            if started is not None:
+                self.unit_seconds += time.time() - started
+            if self.is_done():
+                self.finished.notify_all()
+            return True
+
+    def release(self, worker_id):
+        # The worker is gone: requeue every unfinished unit only it was holding.
+        with self.lock:
+            for unit in self.units:
+                if worker_id in unit.holders:
+                    del unit.holders[worker_id]
+                    if not unit.done and not unit.holders:
+                        self.pending.appendleft(unit)
+
+# === COORDINATOR ===
+class Coordinator:
+    def __init__(self, cam, world, settings, tile_size=16, pass_spp=None, address=("127.0.0.1", DEFAULT_PORT),
+                 authkey=None):
+        if not authkey:
+            raise ValueError("the render farm needs an authkey")
+        if settings.adaptive:
+            raise ValueError("the render farm does not support adaptive sampling")
+        self.settings = settings
+        # The scene is serialised once and the same bytes are sent to every worker.
+        self.scene_blob = pickle.dumps((cam, world, settings), protocol=pickle.HIGHEST_PROTOCOL)
+        tiles = RayTracer.make_tiles(settings.image_width, settings.image_height, tile_size)
+        self.queue = WorkQueue(tiles, settings.samples_per_pixel, pass_spp or settings.samples_per_pixel)
+        self.framebuffer = np.zeros((settings.image_height, settings.image_width, RayTracer.FB_CHANNELS))
+        self.framebuffer_lock = threading.Lock()
+        self.listener = Listener(address, authkey=authkey.encode())
+        self.address = self.listener.address
+        self.next_worker_id = 0
+
+    def serve(self):
+        threading.Thread(target=self._accept_loop, daemon=True).start()
+
+    def _accept_loop(self):
+        while True:
+            try:
+                conn = self.listener.accept()
+            except multiprocessing.AuthenticationError:
+                continue
+            except OSError:
+                # The listener was closed after the last unit came in.
+                return
+            self.next_worker_id += 1
+            threading.Thread(target=self._handle_worker, args=(conn, self.next_worker_id), daemon=True).start()
+
+    def _handle_worker(self, conn, worker_id):
+        try:
+            conn.send_bytes(self.scene_blob)
+            message = conn.recv()
+            while True:
+                if message[0] == "result":
+                    _, unit_id, accum, counts = message
+                    # Claim and merge under one lock, so wait() never sees a finished unit unmerged.
+                    with self.framebuffer_lock:
+                        if self.queue.complete(worker_id, unit_id):
+                            x0, y0, x1, y1 = self.queue.units[unit_id].tile
+                            RayTracer.accumulate_tile(self.framebuffer, x0, y0, x1, y1, accum, counts)
+                if self.queue.is_done():
+                    conn.send(("done",))
+                    return
+                unit = self.queue.next_unit(worker_id)
+                if unit is None:
+                    conn.send(("wait", POLL_INTERVAL))
+                else:
+                    conn.send(("unit", unit.unit_id, unit.tile, unit.first_sample, unit.samples))
+                message = conn.recv()
+        except (EOFError, OSError):
+            pass
+        finally:
+            # A dead or disconnected worker gives its units back.
+            self.queue.release(worker_id)
+            conn.close()
+
+    def wait(self, progress=True):
+        # Blocks until every unit is merged; returns the framebuffer top row first (see RayTracer.FB_*).
+        start_time = time.time()
+        queue = self.queue
+        with queue.finished:
+            while not queue.is_done():
+                queue.finished.wait(0.5)
+                if progress:
+                    RayTracer.print_progress(queue.completed, len(queue.units), start_time)
+        self.listener.close()
+        with self.framebuffer_lock:
+            # Rows are accumulated bottom-up (j = 0 is the bottom of the image).
+            return self.framebuffer[::-1].copy()
+
+# === WORKER ===
+def connect(address, authkey, retry_seconds=10.0):
+    # Workers may start before the coordinator, so connection refusals are retried for a while.
+    deadline = time.time() + retry_seconds
+    while True:
+        try:
+            return Client(address, authkey=authkey.encode())
+        except ConnectionRefusedError:
+            if time.time() > deadline:
+                raise
+            time.sleep(POLL_INTERVAL)
+
+def run_worker(address, authkey, retry_seconds=10.0):
+    # Renders units until the coordinator says done; returns the number of units rendered.
+    conn = connect(address, authkey, retry_seconds)
+    rendered = 0
+    try:
+        cam, world, settings = pickle.loads(conn.recv_bytes())
+        st = RayTracer.init_tile_state(cam, world, settings)
+        conn.send(("ready",))
+        while True:
+            message = conn.recv()
+            if message[0] == "done":
+                return rendered
+            if message[0] == "wait":
+                time.sleep(message[1])
+                conn.send(("ready",))
+                continue
+            _, unit_id, (x0, y0, x1, y1), first_sample, samples = message
+            accum, counts = RayTracer.render_tile(st, x0, y0, x1, y1, first_sample, samples)
+            conn.send(("result", unit_id, accum, counts))
+            rendered += 1
+    except EOFError:
+        # The coordinator finished (or went away) while this worker was rendering.
+        return rendered
+    finally:
+        conn.close()
+
+def start_workers(address, authkey, processes):
+    workers = [multiprocessing.Process(target=run_worker, args=(address, authkey), daemon=True)
+               for _ in range(processes)]
+    for worker in workers:
+        worker.start()
+    return workers
+
+# === COMMAND LINE ===
+def add_render_arguments(parser):
+    parser.add_argument("--mode", choices=["scanline", "wavefront", "jit"], default="wavefront")
+    parser.add_argument("--width", type=int, default=400)
+    parser.add_argument("--spp", type=int, default=200, help="samples per pixel")
+    parser.add_argument("--pass-spp", type=int, default=None,
+                        help="samples per work unit; smaller values let several nodes share a tile (default: --spp)")
+    parser.add_argument("--max-depth", type=int, default=20)
+    parser.add_argument("--rr-depth", type=int, default=0)
+    parser.add_argument("--sampler", choices=sorted(samplers.SAMPLERS), default="random")
+    parser.add_argument("--accel", choices=["list", "bvh", "soa"], default="list")
+    parser.add_argument("--grid", type=int, default=11)
+    parser.add_argument("--tile-size", type=int, default=32)
+    parser.add_argument("--aovs", action="store_true")
+    parser.add_argument("--denoise", action="store_true")
+    parser.add_argument("--output", default="final_scene.png")
+
+def build_coordinator(args, address, authkey):
+    aspect_ratio = 2.0
+    image_width = args.width
+    image_height = int(image_width / aspect_ratio)
+    world = RayTracer.build_world(args.grid, RayTracer.SphereStore() if args.accel == "soa" else None)
+    if args.accel == "bvh":
+        world = RayTracer.BVH(world.objects)
+    cam = RayTracer.build_camera(aspect_ratio)
+    settings = RayTracer.RenderSettings(image_width, image_height, args.spp, args.max_depth, args.mode,
+                                        rr_depth=args.rr_depth, sampler=args.sampler,
+                                        aovs=args.aovs or args.denoise)
+    return Coordinator(cam, world, settings, args.tile_size, args.pass_spp, address, authkey)
+
+def finish(coordinator, args):
+    start_time = time.time()
+    framebuffer = coordinator.wait()
+    RayTracer.save_framebuffer_image(framebuffer, args.output, denoised=args.denoise)
+    if args.aovs:
+        RayTracer.save_aovs(framebuffer, args.output)
+    print(f"\nDone. Total render time: {time.time() - start_time:.2f} seconds")
+
+def main():
+    parser = argparse.ArgumentParser(description="Distributed tile rendering of the Project 1 scene.")
+    parser.add_argument("--authkey", default=os.environ.get(AUTHKEY_ENV),
+                        help=f"shared secret every node must use (default: ${AUTHKEY_ENV}); "
+                             "required for serve and work")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    serve = commands.add_parser("serve", help="run the coordinator and wait for workers")
+    serve.add_argument("--host", default="127.0.0.1",
+                       help="interface to listen on; use 0.0.0.0 or a LAN address for remote workers")
+    serve.add_argument("--port", type=int, default=DEFAULT_PORT)
+    add_render_arguments(serve)
+
+    work = commands.add_parser("work", help="run worker processes against a coordinator")
+    work.add_argument("--host", default="127.0.0.1")
+    work.add_argument("--port", type=int, default=DEFAULT_PORT)
+    work.add_argument("--processes", type=int, default=os.cpu_count() or 1)
+
+    local = commands.add_parser("local", help="coordinator plus localhost workers in one command")
+    local.add_argument("--port", type=int, default=0, help="0 picks a free port")
+    local.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    add_render_arguments(local)
+
+    args = parser.parse_args()
+    authkey = args.authkey
+    if not authkey:
+        if args.command != "local":
+            parser.error(f"{args.command} needs --authkey or ${AUTHKEY_ENV}")
+        authkey = secrets.token_hex(16)
+    if args.command == "work":
+        workers = start_workers((args.host, args.port), authkey, args.processes)
+        for worker in workers:
+            worker.join()
+        return
+
+    host = args.host if args.command == "serve" else "127.0.0.1"
+    coordinator = build_coordinator(args, (host, args.port), authkey)
+    coordinator.serve()
+    print(f"Coordinator listening on {coordinator.address[0]}:{coordinator.address[1]}")
+    if args.command == "local":
+        start_workers(coordinator.address, authkey, args.workers)
+    finish(coordinator, args)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,413 @@
+import argparse
+import asyncio
+import concurrent.futures
+import itertools
+import json
+import os
+import shutil
+import sys
+import time
+from collections import deque
+
+import numpy as np
+
+import RayTracer
+import jit
+import samplers
+from common import scene_file
+
+# === RENDER SERVICE ===
+# A long-lived asyncio server that renders scene files for clients on this
+# machine, so a render no longer pays for interpreter start-up, imports and a
+# fresh process pool. Clients send one JSON request per connection and read
+# JSON events back, one per line. Jobs share one warm process pool: tiles are
+# handed out a few at a time, highest priority job first (FIFO among equals),
+# so a new urgent job or a cancel takes effect within a batch. Every finished
+# image is kept in a cache directory under a hash of the scene file, its OBJ
+# models, RayTracer.py and the render parameters; an identical request is
+# answered from there, and one arriving while its twin is still rendering
+# joins that job instead of starting another. The cache is trimmed to a size
+# limit, least recently used images first.
+#
+# The server only listens on 127.0.0.1 and has no authentication. It never writes
+# outside its cache: a finished job reports the cached image's path and the client
+# copies it wherever it wants.
+
+DEFAULT_PORT = 5051
+DEFAULT_CACHE_DIR = ".render_cache"
+DEFAULT_CACHE_MB = 1024
+# Tiles per pool task: small, so priorities and cancels apply quickly.
+BATCH_TILES = 4
+# Jobs whose loaded scene a worker keeps around.
+WORKER_SCENES = 4
+# A job fails once its batches were in flight when this many pools broke.
+MAX_POOL_CRASHES = 2
+RENDER_DEFAULTS = dict(width=400, spp=64, seed=0, priority=0, mode="wavefront", accel="bvh",
+                       sampler="random", max_depth=20, rr_depth=0, tile_size=16)
+
+# === WORKER SIDE ===
+_job_states = {}
+
+def init_service_worker():
+    # Loads the cached JIT kernels once per process instead of once per job.
+    jit.warm_up()
+
+def worker_state(job):
+    # Tile state (see RayTracer.init_tile_state) for a job, built on first use in this worker.
+    st = _job_states.get(job["key"])
+    if st is None:
+        world, spec = RayTracer.load_scene(job["scene"], job["accel"])
+        cam, _ = RayTracer.scene_camera(spec)
+        settings = RayTracer.RenderSettings(job["width"], job["height"], job["spp"], job["max_depth"], job["mode"],
+                                            rr_depth=job["rr_depth"], sampler=job["sampler"],
+                                            sampler_seed=job["seed"])
+        st = dict(RayTracer.init_tile_state(cam, world, settings))
+        st["pixel_sampler"] = RayTracer.get_sampler()
+        if len(_job_states) >= WORKER_SCENES:
+            _job_states.pop(next(iter(_job_states)))
+        _job_states[job["key"]] = st
+    # The scalar tracer draws from a module-level sampler, which the last job may have replaced.
+    RayTracer.set_sampler(st["pixel_sampler"])
+    return st
+
+def render_job_tiles(job, tiles):
+    st = worker_state(job)
+    return [(tile,) + RayTracer.render_tile(st, *tile) for tile in tiles]
+
+# === JOBS (service side) ===
+class Job:
+    def __init__(self, job_id, spec, seq):
+        self.job_id = job_id
+        self.spec = spec
+        self.priority = spec["priority"]
+        self.seq = seq
+        tiles = RayTracer.make_tiles(spec["width"], spec["height"], spec["tile_size"])
+        self.pending = deque(tiles)
+        self.total = len(tiles)
+        self.completed = 0
+        self.framebuffer = np.zeros((spec["height"], spec["width"], RayTracer.FB_CHANNELS))
+        self.state = "running"
+        self.start_time = time.time()
+        # Generations of the pool that broke while running one of this job's batches.
+        self.crashes = set()
+        # One asyncio.Queue of events per client following the job.
+        self.listeners = []
+
+    def publish(self, event):
+        for listener in self.listeners:
+            listener.put_nowait(event)
+
+class RenderService:
+    def __init__(self, workers=None, cache_dir=DEFAULT_CACHE_DIR, cache_mb=DEFAULT_CACHE_MB):
+        self.workers = workers or os.cpu_count() or 1
+        self.cache_dir = cache_dir
+        self.cache_bytes = cache_mb * 1024 * 1024
+        os.makedirs(cache_dir, exist_ok=True)
+        self.pool = self.new_pool()
+        self.pool_generation = 0
+        self.jobs = {}
+        # Cache key -> running job, so identical requests share one render.
+        self.running = {}
+        self.job_ids = itertools.count(1)
+        self.seq = itertools.count()
+        self.in_flight = 0
+        self.wakeup = asyncio.Event()
+
+    def new_pool(self):
+        return concurrent.futures.ProcessPoolExecutor(max_workers=self.workers, initializer=init_service_worker)
+
+    def replace_pool(self, broken):
+        # Every batch in flight fails when a worker dies; only the first to notice swaps the pool.
+        if broken is self.pool:
+            broken.shutdown(wait=False, cancel_futures=True)
+            self.pool = self.new_pool()
+            self.pool_generation += 1
+
+    async def warm_up(self):
+        # Starts every pool process now rather than on the first job.
+        loop = asyncio.get_running_loop()
+        await asyncio.gather(*(loop.run_in_executor(self.pool, os.getpid) for _ in range(self.workers)))
+
+    def cache_path(self, key):
+        return os.path.join(self.cache_dir, key + ".png")
+
+    def trim_cache(self, keep):
+        # Deletes the least recently used images (oldest mtime; hits touch their file) until the
+        # cache fits in cache_bytes. keep, the image just handed to a client, always stays.
+        entries = []
+        for entry in os.scandir(self.cache_dir):
+            if entry.name.endswith(".png"):
+                stat = entry.stat()
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.cache_bytes:
+                break
+            if path == keep:
+                continue
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+
+    def job_spec(self, request):
+        # Validates a render request and fills in defaults, the image height and the cache key.
+        spec = dict(RENDER_DEFAULTS)
+        spec.update((k, request[k]) for k in RENDER_DEFAULTS if k in request)
+        spec["scene"] = os.path.abspath(request["scene"])
+        for name in ("width", "spp", "seed", "priority", "max_depth", "rr_depth", "tile_size"):
+            spec[name] = int(spec[name])
+        if spec["width"] < 2 or spec["spp"] < 1 or spec["tile_size"] < 1:
+            raise ValueError("width must be at least 2, spp and tile_size at least 1")
+        if spec["mode"] not in ("scanline", "wavefront", "jit"):
+            raise ValueError(f"unknown mode {spec['mode']!r}")
+        if spec["accel"] not in ("list", "bvh", "soa"):
+            raise ValueError(f"unknown accel {spec['accel']!r}")
+        if spec["sampler"] not in samplers.SAMPLERS:
+            raise ValueError(f"unknown sampler {spec['sampler']!r}")
+        scene = scene_file.read(spec["scene"])
+        _, aspect_ratio = RayTracer.scene_camera(scene["camera"])
+        spec["height"] = int(spec["width"] / aspect_ratio)
+        extra = [spec[k] for k in ("width", "spp", "seed", "mode", "accel", "sampler", "max_depth", "rr_depth")]
+        spec["key"] = scene_file.content_hash(spec["scene"], scene, "project1-service", extra,
+                                              [os.path.abspath(RayTracer.__file__)]).hex()[:32]
+        # Builds the scene's sidecar cache here, once, so the workers only read it.
+        RayTracer.load_scene(spec["scene"], spec["accel"])
+        return spec
+
+    async def submit(self, request, listener):
+        # Returns (job, spec, cached image path). A cached request gets no job; otherwise the events
+        # of the new or joined job go to listener.
+        spec = await asyncio.to_thread(self.job_spec, request)
+        cached = self.cache_path(spec["key"])
+        if os.path.exists(cached):
+            # Marks the image as recently used for trim_cache.
+            os.utime(cached)
+            return None, spec, cached
+        job = self.running.get(spec["key"])
+        if job is None:
+            job = Job(next(self.job_ids), spec, next(self.seq))
+            self.jobs[job.job_id] = job
+            self.running[spec["key"]] = job
+        job.priority = max(job.priority, spec["priority"])
+        job.listeners.append(listener)
+        self.wakeup.set()
+        return job, spec, None
+
+    def cancel(self, job_id):
+        # Drops the job's queued tiles; batches already running finish and are discarded.
+        job = self.jobs.get(job_id)
+        if job is None or job.state != "running":
+            return False
+        self.end(job, "cancelled", dict(event="cancelled", job=job_id))
+        return True
+
+    def end(self, job, state, event):
+        job.state = state
+        job.pending.clear()
+        job.framebuffer = None
+        del self.running[job.spec["key"]]
+        job.publish(event)
+
+    def next_job(self):
+        # Highest priority first; among equal priorities, the oldest job.
+        ready = [job for job in self.running.values() if job.pending]
+        return max(ready, key=lambda job: (job.priority, -job.seq), default=None)
+
+    async def dispatch(self):
+        # Keeps every worker busy plus one batch queued, so a new job's priority applies to the next free worker.
+        while True:
+            await self.wakeup.wait()
+            self.wakeup.clear()
+            while self.in_flight < self.workers + 1:
+                job = self.next_job()
+                if job is None:
+                    break
+                batch = [job.pending.popleft() for _ in range(min(BATCH_TILES, len(job.pending)))]
+                self.in_flight += 1
+                asyncio.ensure_future(self.run_batch(job, batch))
+
+    async def run_batch(self, job, batch):
+        loop = asyncio.get_running_loop()
+        pool, generation = self.pool, self.pool_generation
+        try:
+            results = await loop.run_in_executor(pool, render_job_tiles, job.spec, batch)
+            if job.state != "running":
+                return
+            for (x0, y0, x1, y1), accum, counts in results:
+                RayTracer.accumulate_tile(job.framebuffer, x0, y0, x1, y1, accum, counts)
+            job.completed += len(results)
+            job.publish(dict(event="progress", job=job.job_id, done=job.completed, total=job.total))
+            if job.completed == job.total:
+                await self.finish(job)
+        except concurrent.futures.process.BrokenProcessPool as error:
+            # A worker process died (killed, out of memory, a crash in native code), which breaks
+            # the whole pool. Jobs that only shared it get their tiles requeued on a fresh pool; a job
+            # that keeps being in flight when pools break is the likely cause and fails.
+            self.replace_pool(pool)
+            if job.state == "running":
+                job.crashes.add(generation)
+                if len(job.crashes) >= MAX_POOL_CRASHES:
+                    self.end(job, "failed", dict(event="error", job=job.job_id,
+                                                 message=f"{type(error).__name__}: {error}"))
+                else:
+                    job.pending.extendleft(reversed(batch))
+        except Exception as error:
+            if job.state == "running":
+                self.end(job, "failed", dict(event="error", job=job.job_id,
+                                             message=f"{type(error).__name__}: {error}"))
+        finally:
+            self.in_flight -= 1
+            self.wakeup.set()
+
+    async def finish(self, job):
+        # Rows are accumulated bottom-up (j = 0 is the bottom of the image).
+        image = self.cache_path(job.spec["key"])
+        await asyncio.to_thread(RayTracer.save_framebuffer_image, job.framebuffer[::-1], image)
+        await asyncio.to_thread(self.trim_cache, image)
+        if job.state != "running":
+            # Cancelled while the image was being written.
+            return
+        self.end(job, "done", dict(event="done", job=job.job_id, image=image, cached=False,
+                                   seconds=round(time.time() - job.start_time, 3)))
+
+    # === PROTOCOL ===
+    async def handle_client(self, reader, writer):
+        # One request per connection: {"op": "render" | "cancel" | "status", ...}.
+        try:
+            request = json.loads(await reader.readline())
+            if not isinstance(request, dict):
+                raise ValueError("a request must be a JSON object")
+            op = request.get("op")
+            if op == "render":
+                await self.serve_render(request, writer)
+            elif op == "cancel":
+                await send(writer, dict(event="cancel", job=request.get("job"),
+                                        cancelled=self.cancel(request.get("job"))))
+            elif op == "status":
+                jobs = [dict(job=job.job_id, state=job.state, priority=job.priority, done=job.completed,
+                             total=job.total, scene=job.spec["scene"]) for job in self.jobs.values()]
+                await send(writer, dict(event="status", jobs=jobs, workers=self.workers, in_flight=self.in_flight))
+            else:
+                await send(writer, dict(event="error", message=f"unknown op {op!r}"))
+        except ConnectionError:
+            # The client went away; a render it started keeps going and lands in the cache.
+            pass
+        except (ValueError, KeyError, TypeError, OSError) as error:
+            # A malformed request, e.g. null or a list where a number or path belongs.
+            await send(writer, dict(event="error", message=f"{type(error).__name__}: {error}"))
+        finally:
+            writer.close()
+
+    async def serve_render(self, request, writer):
+        listener = asyncio.Queue()
+        job, spec, cached = await self.submit(request, listener)
+        if cached is not None:
+            event = dict(event="done", job=None, image=cached, cached=True, seconds=0.0)
+        else:
+            await send(writer, dict(event="queued", job=job.job_id, key=spec["key"], total=job.total))
+            while True:
+                event = await listener.get()
+                if event["event"] != "progress":
+                    break
+                await send(writer, event)
+        await send(writer, event)
+
+async def send(writer, event):
+    writer.write((json.dumps(event) + "\n").encode())
+    await writer.drain()
+
+async def serve(args):
+    service = RenderService(args.workers, args.cache_dir, args.cache_mb)
+    await service.warm_up()
+    server = await asyncio.start_server(service.handle_client, "127.0.0.1", args.port)
+    dispatcher = asyncio.ensure_future(service.dispatch())
+    print(f"Render service listening on 127.0.0.1:{server.sockets[0].getsockname()[1]} "
+          f"with {service.workers} workers")
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        dispatcher.cancel()
+        service.pool.shutdown(cancel_futures=True)
+
+# === CLIENT ===
+async def request(port, message):
+    # Sends one request and yields the service's events until it closes the connection.
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    try:
+        await send(writer, message)
+        while line := await reader.readline():
+            yield json.loads(line)
+    finally:
+        writer.close()
+
+async def run_client(args):
+    if args.command == "render":
+        message = dict(op="render", scene=args.scene)
+        message.update((k, getattr(args, k)) for k in RENDER_DEFAULTS if getattr(args, k) is not None)
+    elif args.command == "cancel":
+        message = dict(op="cancel", job=args.job)
+    else:
+        message = dict(op="status")
+    start_time = time.time()
+    async for event in request(args.port, message):
+        if event["event"] == "progress":
+            RayTracer.print_progress(event["done"], event["total"], start_time)
+        elif event["event"] == "queued":
+            print(f"Job {event['job']} queued ({event['total']} tiles)")
+        elif event["event"] == "done":
+            # The service only reports where the image is cached; the copy is made with the client's own permissions.
+            shutil.copyfile(event["image"], args.output)
+            source = "from the cache" if event["cached"] else f"in {event['seconds']:.2f} seconds"
+            print(f"\nDone {source}: {args.output}")
+        elif event["event"] == "cancelled":
+            print(f"\nJob {event['job']} was cancelled")
+            sys.exit(1)
+        elif event["event"] == "error":
+            print(f"error: {event['message']}", file=sys.stderr)
+            sys.exit(1)
+        else:
+            print(json.dumps(event, indent=2))
+
+def main():
+    parser = argparse.ArgumentParser(description="Long-lived render service for Project 1 scene files.")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    serve_parser = commands.add_parser("serve", help="run the service")
+    serve_parser.add_argument("--workers", type=int, default=None, help="worker processes (default: all cores)")
+    serve_parser.add_argument("--cache-dir", default=DEFAULT_CACHE_DIR, help="where finished images are kept")
+    serve_parser.add_argument("--cache-mb", type=int, default=DEFAULT_CACHE_MB,
+                              help="size limit of the image cache; least recently used images go first")
+
+    render = commands.add_parser("render", help="submit a scene and follow its progress")
+    render.add_argument("--scene", required=True)
+    render.add_argument("--output", default="final_scene.png")
+    render.add_argument("--width", type=int)
+    render.add_argument("--spp", type=int)
+    render.add_argument("--seed", type=int, help="sampler seed (the random sampler ignores it)")
+    render.add_argument("--priority", type=int, help="higher runs first (default 0)")
+    render.add_argument("--mode", choices=["scanline", "wavefront", "jit"])
+    render.add_argument("--accel", choices=["list", "bvh", "soa"])
+    render.add_argument("--sampler", choices=sorted(samplers.SAMPLERS))
+    render.add_argument("--max-depth", type=int)
+    render.add_argument("--rr-depth", type=int)
+    render.add_argument("--tile-size", type=int)
+
+    cancel = commands.add_parser("cancel", help="cancel a running job")
+    cancel.add_argument("job", type=int)
+    commands.add_parser("status", help="list the service's jobs")
+
+    args = parser.parse_args()
+    if args.command == "serve":
+        try:
+            asyncio.run(serve(args))
+        except KeyboardInterrupt:
+            pass
+    else:
+        asyncio.run(run_client(args))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,321 @@
+import math, random
+import numpy as np
+
+# === SAMPLERS ===
+# A sampler hands out the random numbers of one pixel sample, dimension by
+# dimension: pixel jitter, lens position, then a few dimensions per bounce.
+# Every sample function takes (i, j, index, dimension) and works both on
+# Python ints (scalar renderer) and on uint64 NumPy arrays (wavefront
+# renderer); the integer hashing is masked to 32 bits so both agree.
+
+MASK32 = 0xFFFFFFFF
+TO_UNIT = 1.0 / 4294967296.0
+
+# === INTEGER HASHING ===
+def mix32(x):
+    # "lowbias32" integer finalizer.
+    x ^= x >> 16
+    x = (x * 0x7feb352d) & MASK32
+    x ^= x >> 15
+    x = (x * 0x846ca68b) & MASK32
+    x ^= x >> 16
+    return x
+
+def hash_combine(seed, value):
+    return mix32((seed ^ (value + 0x9e3779b9 + ((seed << 6) & MASK32) + (seed >> 2))) & MASK32)
+
+def reverse_bits32(x):
+    x = ((x >> 1) & 0x55555555) | ((x & 0x55555555) << 1)
+    x = ((x >> 2) & 0x33333333) | ((x & 0x33333333) << 2)
+    x = ((x >> 4) & 0x0F0F0F0F) | ((x & 0x0F0F0F0F) << 4)
+    x = ((x >> 8) & 0x00FF00FF) | ((x & 0x00FF00FF) << 8)
+    return ((x >> 16) | (x << 16)) & MASK32
+
+def laine_karras_permutation(x, seed):
+    x = (x + seed) & MASK32
+    x ^= (x * 0x6c50b47c) & MASK32
+    x ^= (x * 0xb82f1e52) & MASK32
+    x ^= (x * 0xc7afe638) & MASK32
+    x ^= (x * 0x8d22f6e6) & MASK32
+    return x
+
+def nested_uniform_scramble(x, seed):
+    # Hash-based Owen scrambling (Burley 2020).
+    return reverse_bits32(laine_karras_permutation(reverse_bits32(x), seed))
+
+def sobol_0(index):
+    return reverse_bits32(index & MASK32)
+
+def sobol_1(index):
+    # Second Sobol dimension (primitive polynomial x + 1).
+    r = 0
+    v = 1 << 31
+    for _ in range(32):
+        r ^= v * (index & 1)
+        index >>= 1
+        v ^= v >> 1
+    return r
+
+def _permute_round(i, p, w):
+    # One round of Kensler's hash-based permutation of [0, w].
+    i ^= p
+    i = (i * 0xe170893d) & MASK32
+    i ^= p >> 16
+    i ^= (i & w) >> 4
+    i ^= p >> 8
+    i = (i * 0x0929eb3f) & MASK32
+    i ^= p >> 23
+    i ^= (i & w) >> 1
+    i = (i * (1 | p >> 27)) & MASK32
+    i = (i * 0x6935fa69) & MASK32
+    i ^= (i & w) >> 11
+    i = (i * 0x74dcb303) & MASK32
+    i ^= (i & w) >> 2
+    i = (i * 0x9e501cc3) & MASK32
+    i ^= (i & w) >> 2
+    i = (i * 0xc860a3df) & MASK32
+    i &= w
+    i ^= i >> 5
+    return i
+
+def permute(i, l, p):
+    # Kensler's permutation of i in [0, l), keyed by p; cycle-walks values >= l.
+    w = (1 << max(int(l) - 1, 0).bit_length()) - 1
+    if isinstance(i, np.ndarray):
+        p = np.broadcast_to(p, i.shape)
+        i = _permute_round(i.copy(), p, w)
+        pending = np.flatnonzero(i >= l)
+        while len(pending):
+            i[pending] = _permute_round(i[pending], p[pending], w)
+            pending = pending[i[pending] >= l]
+        return (i + p) % l
+    i = _permute_round(i, p, w)
+    while i >= l:
+        i = _permute_round(i, p, w)
+    return (i + p) % l
+
+def pixel_seed(i, j, seed, dimension):
+    return hash_combine(hash_combine(hash_combine(seed, i), j), dimension)
+
+# === SAMPLE-SPACE MAPPINGS (rejection-free) ===
+def concentric_disk(u, v):
+    # Shirley-Chiu concentric map from [0,1)^2 to the unit disk.
+    a = 2 * u - 1
+    b = 2 * v - 1
+    if a == 0 and b == 0:
+        return 0.0, 0.0
+    if abs(a) > abs(b):
+        r, phi = a, (math.pi / 4) * (b / a)
+    else:
+        r, phi = b, (math.pi / 2) - (math.pi / 4) * (a / b)
+    return r * math.cos(phi), r * math.sin(phi)
+
+def concentric_disks(u, v):
+    a = 2 * u - 1
+    b = 2 * v - 1
+    horizontal = np.abs(a) > np.abs(b)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        r = np.where(horizontal, a, b)
+        phi = np.where(horizontal, (np.pi / 4) * (b / a), (np.pi / 2) - (np.pi / 4) * (a / b))
+    phi = np.where(r == 0, 0.0, phi)
+    return r * np.cos(phi), r * np.sin(phi)
+
+def uniform_sphere(u, v):
+    # Area-preserving map from [0,1)^2 to the unit sphere surface.
+    z = 1 - 2 * u
+    r = math.sqrt(max(0.0, 1 - z * z))
+    phi = 2 * math.pi * v
+    return r * math.cos(phi), r * math.sin(phi), z
+
+def uniform_spheres(u, v):
+    z = 1 - 2 * u
+    r = np.sqrt(np.maximum(0.0, 1 - z * z))
+    phi = 2 * np.pi * v
+    return np.stack((r * np.cos(phi), r * np.sin(phi), z), axis=-1)
+
+# === BLUE NOISE MASK ===
+BLUE_NOISE_SIZE = 64
+_blue_noise = None
+
+def void_and_cluster(size=BLUE_NOISE_SIZE, sigma=1.5, seed=0):
+    # Ulichney's void-and-cluster method on a torus; returns ranks in [0, 1).
+    rng = np.random.default_rng(seed)
+    n = size * size
+    d = np.minimum(np.arange(size), size - np.arange(size))
+    kernel = np.exp(-(d[:, None] ** 2 + d[None, :] ** 2) / (2 * sigma * sigma))
+    kernel_f = np.fft.rfft2(kernel)
+
+    def splat(y, x):
+        return np.roll(kernel, (y, x), axis=(0, 1))
+
+    # Initial binary pattern: relax random points until the tightest cluster is the largest void.
+    pattern = np.zeros((size, size), dtype=bool)
+    pattern.flat[rng.choice(n, n // 10, replace=False)] = True
+    energy = np.fft.irfft2(np.fft.rfft2(pattern.astype(np.float64)) * kernel_f, s=(size, size))
+    while True:
+        cluster = int(np.argmax(np.where(pattern, energy, -np.inf)))
+        pattern.flat[cluster] = False
+        energy -= splat(*divmod(cluster, size))
+        void = int(np.argmin(np.where(pattern, np.inf, energy)))
+        pattern.flat[void] = True
+        energy += splat(*divmod(void, size))
+        if void == cluster:
+            break
+
+    ranks = np.zeros(n)
+    ones = int(pattern.sum())
+    # Phase 1: rank the initial points by removing the tightest cluster each time.
+    work = pattern.copy()
+    work_energy = energy.copy()
+    for rank in range(ones - 1, -1, -1):
+        cluster = int(np.argmax(np.where(work, work_energy, -np.inf)))
+        work.flat[cluster] = False
+        work_energy -= splat(*divmod(cluster, size))
+        ranks[cluster] = rank
+    # Phase 2: fill the largest void each time until every cell is ranked.
+    for rank in range(ones, n):
+        void = int(np.argmin(np.where(pattern, np.inf, energy)))
+        pattern.flat[void] = True
+        energy += splat(*divmod(void, size))
+        ranks[void] = rank
+    return ((ranks + 0.5) / n).reshape(size, size)
+
+def blue_noise_mask():
+    global _blue_noise
+    if _blue_noise is None:
+        _blue_noise = void_and_cluster()
+    return _blue_noise
+
+# === SAMPLER CLASSES ===
+class Sampler:
+    def __init__(self, samples_per_pixel=1, seed=0):
+        self.samples_per_pixel = max(1, samples_per_pixel)
+        self.seed = seed & MASK32
+        self.i = self.j = self.index = self.dimension = 0
+
+    def start_pixel_sample(self, i, j, index, dimension=0):
+        # dimension > 0 skips dimensions already drawn elsewhere (e.g. batched camera rays).
+        self.i, self.j, self.index = i, j, index
+        self.dimension = dimension
+
+    def get_1d(self):
+        d = self.dimension
+        self.dimension += 1
+        return self.sample_1d(self.i, self.j, self.index, d)
+
+    def get_2d(self):
+        d = self.dimension
+        self.dimension += 2
+        return self.sample_2d(self.i, self.j, self.index, d)
+
+    # Subclasses implement these for both scalars and arrays.
+    def sample_1d(self, i, j, index, dimension):
+        raise NotImplementedError
+    def sample_2d(self, i, j, index, dimension):
+        raise NotImplementedError
+
+class RandomSampler(Sampler):
+    # Independent uniform numbers; the original behaviour.
+    def __init__(self, samples_per_pixel=1, seed=None):
+        super().__init__(samples_per_pixel, 0)
+        # seed may also be a SeedSequence; see spawn.
+        self.seed_sequence = seed if isinstance(seed, np.random.SeedSequence) else np.random.SeedSequence(seed)
+        self.rng = np.random.default_rng(self.seed_sequence)
+
+    def spawn(self, key):
+        # An independent sampler for one task (e.g. a scanline): pickled copies of one sampler
+        # share its rng state, so each task derives a stream of its own from the same entropy.
+        return RandomSampler(self.samples_per_pixel,
+                             np.random.SeedSequence(self.seed_sequence.entropy, spawn_key=(key,)))
+    def sample_1d(self, i, j, index, dimension):
+        if isinstance(index, np.ndarray):
+            return self.rng.random(index.shape)
+        return random.random()
+    def sample_2d(self, i, j, index, dimension):
+        if isinstance(index, np.ndarray):
+            return self.rng.random(index.shape), self.rng.random(index.shape)
+        return random.random(), random.random()
+
+class StratifiedSampler(Sampler):
+    # Correlated multi-jittered sampling (Kensler 2013): every dimension pair is
+    # stratified in 2D and in both 1D projections, with a fresh per-pixel,
+    # per-dimension permutation.
+    def __init__(self, samples_per_pixel=1, seed=0):
+        super().__init__(samples_per_pixel, seed)
+        n = self.samples_per_pixel
+        self.m = max(1, int(math.sqrt(n)))
+        self.n = (n + self.m - 1) // self.m
+
+    def sample_1d(self, i, j, index, dimension):
+        count = self.samples_per_pixel
+        p = pixel_seed(i, j, self.seed, dimension)
+        # Indices past samples_per_pixel (adaptive sampling) start a new stratification.
+        p = hash_combine(p, index // count)
+        s = permute(index % count, count, p)
+        jitter = hash_combine(p, index % count) * TO_UNIT
+        return (s + jitter) / count
+
+    def sample_2d(self, i, j, index, dimension):
+        count = self.samples_per_pixel
+        m, n = self.m, self.n
+        p = pixel_seed(i, j, self.seed, dimension)
+        p = hash_combine(p, index // count)
+        s = permute(index % count, count, (p * 0x51633e2d) & MASK32)
+        sx = permute(s % m, m, (p * 0x68bc21eb) & MASK32)
+        sy = permute(s // m, n, (p * 0x02e5be93) & MASK32)
+        jx = hash_combine((p * 0x967a889b) & MASK32, s) * TO_UNIT
+        jy = hash_combine((p * 0x368cc8b7) & MASK32, s) * TO_UNIT
+        x = (s % m + (sy + jx) / n) / m
+        y = (s // m + (sx + jy) / m) / n
+        return x, y
+
+class SobolSampler(Sampler):
+    # Owen-scrambled Sobol points with hash-based shuffling per dimension pair
+    # (Burley 2020, "Practical Hash-based Owen Scrambling").
+    def sample_1d(self, i, j, index, dimension):
+        p = pixel_seed(i, j, self.seed, dimension)
+        shuffled = nested_uniform_scramble(index & MASK32, p)
+        return nested_uniform_scramble(sobol_0(shuffled), hash_combine(p, 1)) * TO_UNIT
+
+    def sample_2d(self, i, j, index, dimension):
+        p = pixel_seed(i, j, self.seed, dimension)
+        shuffled = nested_uniform_scramble(index & MASK32, p)
+        x = nested_uniform_scramble(sobol_0(shuffled), hash_combine(p, 1))
+        y = nested_uniform_scramble(sobol_1(shuffled), hash_combine(p, 2))
+        return x * TO_UNIT, y * TO_UNIT
+
+class BlueNoiseSampler(Sampler):
+    # Sobol points within a pixel, Cranley-Patterson rotated by a blue-noise
+    # mask across pixels (Georgiev & Fajardo 2016), so the remaining error is
+    # spread at high frequencies where it is least visible.
+    def __init__(self, samples_per_pixel=1, seed=0):
+        super().__init__(samples_per_pixel, seed)
+        self.mask = blue_noise_mask()
+
+    def _offset(self, i, j, dimension):
+        # Each dimension reads the mask at its own toroidal shift.
+        h = hash_combine(self.seed, dimension)
+        x = (i + (h & 63)) % BLUE_NOISE_SIZE
+        y = (j + ((h >> 6) & 63)) % BLUE_NOISE_SIZE
+        return self.mask[y, x]
+
+    def sample_1d(self, i, j, index, dimension):
+        u = sobol_0(index & MASK32) * TO_UNIT + self._offset(i, j, dimension)
+        return u % 1.0
+
+    def sample_2d(self, i, j, index, dimension):
+        x = sobol_0(index & MASK32) * TO_UNIT + self._offset(i, j, dimension)
+        y = sobol_1(index & MASK32) * TO_UNIT + self._offset(i, j, dimension + 1)
+        return x % 1.0, y % 1.0
+
+SAMPLERS = {
+    "random": RandomSampler,
+    "stratified": StratifiedSampler,
+    "sobol": SobolSampler,
+    "bluenoise": BlueNoiseSampler,
+}
+
+def make_sampler(name, samples_per_pixel, seed=0):
+    if name == "random":
+        return RandomSampler(samples_per_pixel)
+    return SAMPLERS[name](samples_per_pixel, seed)
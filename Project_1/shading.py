@@ -0,0 +1,125 @@
+import numpy as np
+import samplers
+
+# === MATERIAL-SORTED BATCHED SHADING ===
+# Hits are grouped by material kind and every group is shaded by one
+# vectorized kernel, so the cost scales with the number of material kinds
+# rather than the number of hits. Material parameters live in per-kind
+# arrays; a global material id maps to (kind, index within that kind).
+
+LAMBERTIAN = 0
+METAL = 1
+DIELECTRIC = 2
+KIND_COUNT = 3
+
+class MaterialTable:
+    def __init__(self):
+        self.kinds = []
+        self.local_ids = []
+        self.lambertian_albedo = []
+        self.metal_albedo = []
+        self.metal_fuzz = []
+        self.dielectric_ref_idx = []
+
+    def _add(self, kind, count):
+        self.kinds.append(kind)
+        self.local_ids.append(count)
+        return len(self.kinds) - 1
+
+    def add_lambertian(self, albedo):
+        self.lambertian_albedo.append(albedo)
+        return self._add(LAMBERTIAN, len(self.lambertian_albedo) - 1)
+
+    def add_metal(self, albedo, fuzz):
+        self.metal_albedo.append(albedo)
+        self.metal_fuzz.append(fuzz)
+        return self._add(METAL, len(self.metal_albedo) - 1)
+
+    def add_dielectric(self, ref_idx):
+        self.dielectric_ref_idx.append(ref_idx)
+        return self._add(DIELECTRIC, len(self.dielectric_ref_idx) - 1)
+
+    def freeze(self):
+        # Converts the parameter lists to arrays once the table is complete.
+        self.kinds = np.asarray(self.kinds, dtype=np.int64)
+        self.local_ids = np.asarray(self.local_ids, dtype=np.int64)
+        self.lambertian_albedo = np.asarray(self.lambertian_albedo, dtype=np.float64).reshape(-1, 3)
+        self.metal_albedo = np.asarray(self.metal_albedo, dtype=np.float64).reshape(-1, 3)
+        self.metal_fuzz = np.asarray(self.metal_fuzz, dtype=np.float64)
+        self.dielectric_ref_idx = np.asarray(self.dielectric_ref_idx, dtype=np.float64)
+        return self
+
+# === VECTOR HELPERS ===
+def dot(a, b):
+    return np.einsum('ij,ij->i', a, b)
+
+def reflect(v, n):
+    return v - 2 * dot(v, n)[:, None] * n
+
+def schlick_reflectance(cosine, ref_idx):
+    r0 = (1 - ref_idx) / (1 + ref_idx)
+    r0 = r0 * r0
+    return r0 + (1 - r0) * (1 - cosine) ** 5
+
+# === SHADING KERNELS ===
+# Each kernel gets one material kind's hits and returns (directions, attenuation, alive).
+# samples holds four uniforms per hit: direction (2), fuzz radius, reflect/refract choice.
+def shade_lambertian(table, local_ids, directions, normals, front_face, samples):
+    # Albedo plus cosine-weighted sampling (normal + uniform unit vector).
+    d = normals + samplers.uniform_spheres(samples[:, 0], samples[:, 1])
+    # Catch degenerate scatter direction
+    degenerate = np.all(np.abs(d) < 1e-8, axis=1)
+    d[degenerate] = normals[degenerate]
+    return d, table.lambertian_albedo[local_ids], np.ones(len(d), dtype=bool)
+
+def shade_metal(table, local_ids, directions, normals, front_face, samples):
+    # Mirror reflection perturbed by a fuzz-scaled point in the unit ball.
+    fuzz = table.metal_fuzz[local_ids] * np.cbrt(samples[:, 2])
+    d = reflect(directions, normals) + samplers.uniform_spheres(samples[:, 0], samples[:, 1]) * fuzz[:, None]
+    return d, table.metal_albedo[local_ids], dot(d, normals) > 0
+
+def shade_dielectric(table, local_ids, directions, normals, front_face, samples):
+    # Schlick-weighted choice between reflection and refraction.
+    ir = table.dielectric_ref_idx[local_ids]
+    eta = np.where(front_face, 1.0 / ir, ir)
+    cos_theta = np.minimum(-dot(directions, normals), 1.0)
+    sin_theta = np.sqrt(np.maximum(1.0 - cos_theta * cos_theta, 0.0))
+    cannot_refract = eta * sin_theta > 1.0
+    reflects = cannot_refract | (schlick_reflectance(cos_theta, eta) > samples[:, 3])
+    r_out_perp = (directions + normals * cos_theta[:, None]) * eta[:, None]
+    r_out_parallel = -np.sqrt(np.abs(1.0 - dot(r_out_perp, r_out_perp)))[:, None] * normals
+    d = np.where(reflects[:, None], reflect(directions, normals), r_out_perp + r_out_parallel)
+    return d, np.ones((len(d), 3)), np.ones(len(d), dtype=bool)
+
+KERNELS = (shade_lambertian, shade_metal, shade_dielectric)
+
+def albedo(table, material_ids):
+    # Surface colour per hit, for the albedo AOV; dielectrics count as white.
+    out = np.ones((len(material_ids), 3))
+    kinds = table.kinds[material_ids]
+    local_ids = table.local_ids[material_ids]
+    mask = kinds == LAMBERTIAN
+    out[mask] = table.lambertian_albedo[local_ids[mask]]
+    mask = kinds == METAL
+    out[mask] = table.metal_albedo[local_ids[mask]]
+    return out
+
+def shade(table, directions, normals, front_face, material_ids, samples):
+    # Sort the hits by material kind, then run each kind's kernel once on its contiguous group.
+    n = len(directions)
+    new_dirs = np.empty((n, 3))
+    attenuation = np.empty((n, 3))
+    alive = np.empty(n, dtype=bool)
+    kinds = table.kinds[material_ids]
+    order = np.argsort(kinds, kind="stable")
+    bounds = np.searchsorted(kinds[order], np.arange(KIND_COUNT + 1))
+    for kind, kernel in enumerate(KERNELS):
+        group = order[bounds[kind]:bounds[kind + 1]]
+        if len(group) == 0:
+            continue
+        d, a, ok = kernel(table, table.local_ids[material_ids[group]], directions[group],
+                          normals[group], front_face[group], samples[group])
+        new_dirs[group] = d
+        attenuation[group] = a
+        alive[group] = ok
+    return new_dirs, attenuation, alive
@@ -0,0 +1,141 @@
+import multiprocessing
+import os
+import secrets
+import sys
+import threading
+from multiprocessing.connection import Client
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+import RayTracer
+import render_farm
+
+# === HELPERS ===
+# Every test runs a coordinator and its workers on localhost. The sobol sampler
+# derives each sample from its pixel and sample number, so a farm render can be
+# compared with the same passes rendered in one process.
+TILE_SIZE = 8
+SPP = 4
+PASS_SPP = 2
+
+@pytest.fixture(scope="module")
+def scene():
+    world = RayTracer.build_world(1)
+    cam = RayTracer.build_camera(2.0)
+    settings = RayTracer.RenderSettings(24, 12, SPP, 5, "scanline", sampler="sobol")
+    return cam, world, settings
+
+@pytest.fixture
+def authkey():
+    return secrets.token_hex(16)
+
+def start(scene, authkey):
+    coordinator = render_farm.Coordinator(*scene, TILE_SIZE, PASS_SPP, ("127.0.0.1", 0), authkey)
+    coordinator.serve()
+    return coordinator
+
+def start_thread_worker(coordinator, authkey):
+    thread = threading.Thread(target=render_farm.run_worker, args=(coordinator.address, authkey), daemon=True)
+    thread.start()
+    return thread
+
+def finish(coordinator, timeout=120):
+    # coordinator.wait() in a thread, so a farm that never finishes fails the test instead of hanging it.
+    result = []
+    thread = threading.Thread(target=lambda: result.append(coordinator.wait(progress=False)), daemon=True)
+    thread.start()
+    thread.join(timeout)
+    assert result, "the farm did not finish"
+    return result[0]
+
+def single_process(cam, world, settings):
+    # The farm's work units, rendered and merged one after another in this process.
+    st = RayTracer.init_tile_state(cam, world, settings)
+    framebuffer = np.zeros((settings.image_height, settings.image_width, RayTracer.FB_CHANNELS))
+    tiles = RayTracer.make_tiles(settings.image_width, settings.image_height, TILE_SIZE)
+    for unit in render_farm.WorkQueue(tiles, settings.samples_per_pixel, PASS_SPP).units:
+        accum, counts = RayTracer.render_tile(st, *unit.tile, unit.first_sample, unit.samples)
+        RayTracer.accumulate_tile(framebuffer, *unit.tile, accum, counts)
+    return framebuffer[::-1]
+
+def grab_unit(coordinator, authkey):
+    # A hand-driven worker that takes one unit and renders nothing; returns (connection, unit id).
+    conn = Client(coordinator.address, authkey=authkey.encode())
+    conn.recv_bytes()
+    conn.send(("ready",))
+    message = conn.recv()
+    assert message[0] == "unit"
+    return conn, message[1]
+
+# === ROUND TRIPS ===
+def test_localhost_workers_match_single_process_render(scene, authkey):
+    coordinator = start(scene, authkey)
+    workers = render_farm.start_workers(coordinator.address, authkey, 2)
+    framebuffer = finish(coordinator)
+    for worker in workers:
+        worker.join(30)
+        assert worker.exitcode == 0
+    assert np.all(framebuffer[:, :, RayTracer.FB_COUNT] == SPP)
+    np.testing.assert_allclose(framebuffer, single_process(*scene))
+
+def test_coordinator_requires_authkey(scene):
+    with pytest.raises(ValueError):
+        render_farm.Coordinator(*scene, TILE_SIZE, PASS_SPP, ("127.0.0.1", 0), None)
+
+def test_bad_authkey_is_rejected(scene, authkey):
+    coordinator = start(scene, authkey)
+    with pytest.raises(multiprocessing.AuthenticationError):
+        Client(coordinator.address, authkey=b"not the key")
+    # The coordinator keeps accepting workers that know the key.
+    start_thread_worker(coordinator, authkey)
+    framebuffer = finish(coordinator)
+    assert np.all(framebuffer[:, :, RayTracer.FB_COUNT] == SPP)
+
+# === FAILURES ===
+def test_units_of_a_disconnected_worker_are_requeued(scene, authkey, monkeypatch):
+    # No re-issue of slow units, so only the release can get the lost unit rendered.
+    monkeypatch.setattr(render_farm, "MIN_SLOW_SECONDS", float("inf"))
+    coordinator = start(scene, authkey)
+    conn, unit_id = grab_unit(coordinator, authkey)
+    conn.close()
+    start_thread_worker(coordinator, authkey)
+    framebuffer = finish(coordinator)
+    assert coordinator.queue.units[unit_id].done
+    np.testing.assert_allclose(framebuffer, single_process(*scene))
+
+def test_slow_unit_is_reissued_to_an_idle_worker(scene, authkey, monkeypatch):
+    monkeypatch.setattr(render_farm, "MIN_SLOW_SECONDS", 0.2)
+    coordinator = start(scene, authkey)
+    # This worker holds its unit and never answers; the farm finishes without it.
+    conn, unit_id = grab_unit(coordinator, authkey)
+    try:
+        start_thread_worker(coordinator, authkey)
+        framebuffer = finish(coordinator)
+        assert coordinator.queue.units[unit_id].done
+        np.testing.assert_allclose(framebuffer, single_process(*scene))
+    finally:
+        conn.close()
+
+# === WORK QUEUE ===
+def test_release_requeues_only_units_nobody_else_holds():
+    queue = render_farm.WorkQueue([(0, 0, 1, 1), (1, 0, 2, 1)], 1, 1)
+    first = queue.next_unit(1)
+    second = queue.next_unit(2)
+    second.holders[1] = second.holders[2]
+    queue.release(1)
+    assert list(queue.pending) == [first]
+    assert second.holders.keys() == {2}
+    assert queue.next_unit(3) is first
+
+def test_duplicate_result_of_a_reissued_unit_is_discarded(monkeypatch):
+    monkeypatch.setattr(render_farm, "MIN_SLOW_SECONDS", 0.0)
+    queue = render_farm.WorkQueue([(0, 0, 1, 1)], 1, 1)
+    unit = queue.next_unit(1)
+    unit.holders[1] -= 1.0
+    assert queue.next_unit(2) is unit
+    assert queue.next_unit(2) is None
+    assert queue.complete(2, unit.unit_id)
+    assert not queue.complete(1, unit.unit_id)
+    assert queue.is_done()
@@ -0,0 +1,214 @@
+import numpy as np
+import shading
+from common import instrument
+
+# === WAVEFRONT PATH TRACER ===
+# Every live path of a tile is kept in flat NumPy arrays (origin, direction,
+# throughput, pixel index). Each bounce runs one vectorized
+# intersect -> scatter -> compact pass, so dead paths are dropped between
+# bounces instead of unwinding a Python call stack per sample.
+
+# Upper bound on the number of (ray, sphere) pairs tested in one matrix pass.
+MAX_PAIRS = 1 << 22
+# Upper bound on the number of paths kept alive at once in a tile.
+MAX_PATHS = 1 << 16
+
+# With AOVs enabled, every sample carries 10 channels: colour (3), then the
+# first hit's albedo (3), shading normal (3) and distance (1).
+AOV_CHANNELS = 7
+
+SKY_TOP = np.array([0.5, 0.7, 1.0])
+SKY_BOTTOM = np.array([1.0, 1.0, 1.0])
+
+# === PACKED SCENE ===
+class PackedScene:
+    def __init__(self, centers, radii, material_ids, materials):
+        self.centers = np.ascontiguousarray(centers, dtype=np.float64).reshape(-1, 3)
+        self.radii = np.ascontiguousarray(radii, dtype=np.float64)
+        self.material_ids = np.ascontiguousarray(material_ids, dtype=np.int64)
+        # A frozen shading.MaterialTable, indexed by material id.
+        self.materials = materials
+        # |C|^2 - r^2 is constant per sphere, so it is hoisted out of the hot loop.
+        self.c_terms = np.einsum('ij,ij->i', self.centers, self.centers) - self.radii * self.radii
+
+# === VECTOR HELPERS ===
+def dot(a, b):
+    return np.einsum('ij,ij->i', a, b)
+
+def normalize(v):
+    return v / np.sqrt(dot(v, v))[:, None]
+
+# === SAMPLE DIMENSIONS ===
+# Path sample dimensions: 0-1 pixel jitter, 2-3 lens, then 4 per bounce
+# (scatter direction, fuzz radius, dielectric reflect/refract choice).
+CAMERA_DIMENSIONS = 4
+BOUNCE_DIMENSIONS = 4
+
+def draw_2d(sampler, rng, keys, dimension, n):
+    # Two sample dimensions per path; independent uniforms when there is no sampler.
+    if sampler is None:
+        return rng.random(n), rng.random(n)
+    i, j, index = keys
+    return sampler.sample_2d(i, j, index, dimension)
+
+def bounce_samples(sampler, rng, keys, depth, n):
+    dimension = CAMERA_DIMENSIONS + BOUNCE_DIMENSIONS * depth
+    u, v = draw_2d(sampler, rng, keys, dimension, n)
+    w, c = draw_2d(sampler, rng, keys, dimension + 2, n)
+    return np.stack((u, v, w, c), axis=1)
+
+# === INTERSECTION ===
+def intersect(scene, origins, directions, t_min, t_max):
+    # Directions must be unit length (a == 1 in the quadratic).
+    n = len(origins)
+    t_hit = np.full(n, np.inf)
+    index = np.full(n, -1, dtype=np.int64)
+    m = len(scene.radii)
+    if n == 0 or m == 0:
+        return t_hit, index
+    step = max(1, MAX_PAIRS // m)
+    centers_t = scene.centers.T
+    for s in range(0, n, step):
+        o = origins[s:s + step]
+        d = directions[s:s + step]
+        half_b = dot(o, d)[:, None] - d @ centers_t
+        c = dot(o, o)[:, None] - 2 * (o @ centers_t) + scene.c_terms
+        discriminant = half_b * half_b - c
+        sqrtd = np.sqrt(np.maximum(discriminant, 0.0))
+        # Find the nearest root in the acceptable range.
+        root = -half_b - sqrtd
+        far = (root < t_min) | (root > t_max)
+        root = np.where(far, -half_b + sqrtd, root)
+        valid = (discriminant >= 0) & (root >= t_min) & (root <= t_max)
+        root = np.where(valid, root, np.inf)
+        best = root.argmin(axis=1)
+        best_t = root[np.arange(len(best)), best]
+        hit = np.isfinite(best_t)
+        t_hit[s:s + step] = best_t
+        index[s:s + step] = np.where(hit, best, -1)
+    return t_hit, index
+
+# === CAMERA RAYS ===
+def camera_rays(cam, i, j, image_width, image_height, rng, sampler=None, keys=None):
+    n = len(i)
+    du, dv = draw_2d(sampler, rng, keys, 0, n)
+    lens_u, lens_v = draw_2d(sampler, rng, keys, 2, n)
+    origins, directions = cam.get_rays(i, j, du, dv, lens_u, lens_v, image_width, image_height)
+    return origins, normalize(directions)
+
+# === PATH TRACING ===
+def sky(directions):
+    t = 0.5 * (directions[:, 1] + 1.0)
+    return SKY_BOTTOM * (1.0 - t)[:, None] + SKY_TOP * t[:, None]
+
+def deposit(accum, pixels, values, offset=0):
+    # Adds values[k] into accum[pixels[k], offset:offset + values.shape[1]].
+    n = len(accum)
+    for k in range(values.shape[1]):
+        accum[:, offset + k] += np.bincount(pixels, weights=values[:, k], minlength=n)
+
+def deposit_first_hit(accum, pixels, albedo, normals, distance):
+    deposit(accum, pixels, np.column_stack((albedo, normals, distance)), offset=3)
+
+def path_keys(i, j, index):
+    # (i, j, sample index) of every path, as the uint64 arrays the samplers expect.
+    return (np.asarray(i, dtype=np.uint64), np.asarray(j, dtype=np.uint64), np.asarray(index, dtype=np.uint64))
+
+def trace_paths(scene, origins, directions, pixels, accum, max_depth, rng, rr_depth=0, sampler=None, keys=None):
+    # accum has 3 channels, or 3 + AOV_CHANNELS when first-hit AOVs are wanted.
+    aovs = accum.shape[1] > 3
+    throughput = np.ones((len(origins), 3))
+    for depth in range(max_depth):
+        if instrument.ENABLED:
+            instrument.count(f"rays at depth {depth}", len(origins))
+            instrument.count("ray-sphere tests", len(origins) * len(scene.radii))
+        t, index = intersect(scene, origins, directions, 0.001, np.inf)
+        miss = index < 0
+        if miss.any():
+            background = sky(directions[miss])
+            deposit(accum, pixels[miss], throughput[miss] * background)
+            if aovs and depth == 0:
+                # Misses see the sky: its colour is their albedo; normal and distance stay zero.
+                k = int(miss.sum())
+                deposit_first_hit(accum, pixels[miss], background, np.zeros((k, 3)), np.zeros(k))
+        # Compact: only paths that hit something keep bouncing.
+        hit = ~miss
+        if not hit.any():
+            return
+        origins, directions, throughput, pixels = origins[hit], directions[hit], throughput[hit], pixels[hit]
+        t, index = t[hit], index[hit]
+        if sampler is not None:
+            keys = tuple(k[hit] for k in keys)
+
+        points = origins + directions * t[:, None]
+        outward = (points - scene.centers[index]) / scene.radii[index][:, None]
+        front_face = dot(directions, outward) < 0
+        normals = np.where(front_face[:, None], outward, -outward)
+        material_ids = scene.material_ids[index]
+        if aovs and depth == 0:
+            deposit_first_hit(accum, pixels, shading.albedo(scene.materials, material_ids), normals, t)
+
+        samples = bounce_samples(sampler, rng, keys, depth, len(points))
+        new_dirs, attenuation, alive = shading.shade(scene.materials, directions, normals, front_face,
+                                                     material_ids, samples)
+        throughput = throughput * attenuation
+        if rr_depth and depth + 1 >= rr_depth:
+            # Russian roulette: survive with p = max throughput component, reweight by 1/p.
+            p = np.minimum(throughput.max(axis=1), 0.95)
+            survive = rng.random(len(p)) < p
+            alive &= survive
+            throughput[survive] /= p[survive][:, None]
+        if not alive.any():
+            return
+        origins = points[alive]
+        directions = normalize(new_dirs[alive])
+        throughput = throughput[alive]
+        pixels = pixels[alive]
+        if sampler is not None:
+            keys = tuple(k[alive] for k in keys)
+    # Paths still alive after max_depth bounces contribute no light.
+
+def render_samples(scene, cam, i, j, image_width, image_height, max_depth, rng=None, rr_depth=0,
+                   sampler=None, index=None, aovs=False):
+    # Radiance of one sample per (i, j) entry, as an (n, 3) array, or (n, 10) with AOVs.
+    # index holds each entry's sample number within its pixel (needed with a sampler).
+    if rng is None:
+        rng = np.random.default_rng()
+    out = np.zeros((len(i), 3 + AOV_CHANNELS if aovs else 3))
+    for s in range(0, len(i), MAX_PATHS):
+        e = min(s + MAX_PATHS, len(i))
+        keys = path_keys(i[s:e], j[s:e], index[s:e]) if sampler is not None else None
+        origins, directions = camera_rays(cam, i[s:e], j[s:e], image_width, image_height, rng, sampler, keys)
+        trace_paths(scene, origins, directions, np.arange(e - s), out[s:e], max_depth, rng, rr_depth, sampler, keys)
+    return out
+
+def render_tile(scene, cam, x0, y0, x1, y1, image_width, image_height, samples_per_pixel, max_depth, rng=None, rr_depth=0,
+                sampler=None, aovs=False, first_sample=0):
+    # Returns the summed (not averaged) radiance of pixels [x0, x1) x [y0, y1) as an (h, w, 3)
+    # array, or (h, w, 10) with the first-hit AOV sums appended. Sample numbers start at first_sample.
+    if rng is None:
+        rng = np.random.default_rng()
+    w = x1 - x0
+    h = y1 - y0
+    n_pixels = w * h
+    channels = 3 + AOV_CHANNELS if aovs else 3
+    accum = np.zeros((n_pixels, channels))
+    per_pass = max(1, min(samples_per_pixel, MAX_PATHS // max(n_pixels, 1)))
+    done = 0
+    while done < samples_per_pixel:
+        n_samples = min(per_pass, samples_per_pixel - done)
+        pixels = np.repeat(np.arange(n_pixels), n_samples)
+        i = x0 + pixels % w
+        j = y0 + pixels // w
+        keys = path_keys(i, j, first_sample + done + np.tile(np.arange(n_samples), n_pixels)) if sampler is not None else None
+        origins, directions = camera_rays(cam, i, j, image_width, image_height, rng, sampler, keys)
+        trace_paths(scene, origins, directions, pixels, accum, max_depth, rng, rr_depth, sampler, keys)
+        done += n_samples
+    return accum.reshape(h, w, channels)
+
+# === COLOR OUTPUT (with gamma correction) ===
+def to_rgb8(accum, samples_per_pixel):
+    # Same mapping as RayTracer.write_color, applied to a whole buffer.
+    # samples_per_pixel may also be a per-pixel (h, w, 1) array of sample counts.
+    rgb = np.sqrt(np.maximum(accum / samples_per_pixel, 0.0))
+    return (256 * np.clip(rgb, 0.0, 0.999)).astype(np.uint8)
@@ -0,0 +1,335 @@
+import argparse
+import importlib
+import json
+import multiprocessing
+import multiprocessing.pool
+import os
+import platform
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+# === CROSS-RENDERER BENCHMARK ===
+# Renders fixed scenes at several sizes through each renderer's own entry point
+# (render_scene, or Project_1's tile scheduler) and reports wall time, primary and
+# total rays per second and peak RSS per core count. Every case runs in a fresh
+# interpreter so its peak RSS is its own and module globals never leak between
+# renderers. Ray totals come from a separate single-process pass that wraps the
+# renderer's ray function with a counter, so the timed runs are not instrumented.
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# counted: module function called once per traced ray (primary, reflection and shadow); renderers
+# without one (the compiled kernels) get no total ray count.
+# parallel: whether the renderer can use more than one core.
+# jit: render with the Numba kernels, warmed up before the timed run.
+# backend: "threads" renders on a thread pool sharing one scene; the same renderer without the
+# -threads suffix is its process-pool twin (see compare_backends).
+RENDERERS = {
+    "assignment1": dict(directory="Assignment_1", module="RayTracer", counted="trace_ray", parallel=False),
+    "assignment2": dict(directory="Assignment_2", module="specular_reflections", counted="trace_ray", parallel=False),
+    "assignment3": dict(directory="Assignment_3", module="Light_reflections", counted="ClosestIntersection",
+                        parallel=False),
+    "inclass1": dict(directory="InClass_challenge_1", module="RayTracer", counted="ClosestIntersection",
+                     parallel=True),
+    "inclass1-threads": dict(directory="InClass_challenge_1", module="RayTracer", counted="ClosestIntersection",
+                             parallel=True, backend="threads"),
+    "inclass1-jit": dict(directory="InClass_challenge_1", module="RayTracer", counted=None, parallel=True,
+                         jit=True),
+    "project1-scanline": dict(directory="Project_1", module="RayTracer", mode="scanline", parallel=True),
+    "project1-wavefront": dict(directory="Project_1", module="RayTracer", mode="wavefront", parallel=True),
+    "project1-jit": dict(directory="Project_1", module="RayTracer", mode="jit", counted=None, parallel=True,
+                         jit=True),
+    "project1-scanline-threads": dict(directory="Project_1", module="RayTracer", mode="scanline", parallel=True,
+                                      backend="threads"),
+    "project1-wavefront-threads": dict(directory="Project_1", module="RayTracer", mode="wavefront", parallel=True,
+                                       backend="threads"),
+    "project1-jit-threads": dict(directory="Project_1", module="RayTracer", mode="jit", counted=None, parallel=True,
+                                 jit=True, backend="threads"),
+}
+
+# === CASE RUNNERS (executed in the child interpreter) ===
+class SerialPool:
+    # Stands in for multiprocessing.Pool during the counting pass, so every ray is traced in this process.
+    def __init__(self, initializer=None, initargs=()):
+        if initializer is not None:
+            initializer(*initargs)
+
+    def map(self, fn, iterable):
+        return [fn(x) for x in iterable]
+
+    def imap_unordered(self, fn, iterable):
+        return map(fn, iterable)
+
+    def apply_async(self, fn, args=(), callback=None, error_callback=None):
+        try:
+            result = fn(*args)
+        except Exception as error:
+            if error_callback is not None:
+                error_callback(error)
+            return
+        if callback is not None:
+            callback(result)
+
+    def close(self):
+        pass
+
+    def join(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        pass
+
+class PoolShim:
+    # Replaces a renderer's `mp` module alias so mp.Pool() and mp.pool.ThreadPool() get a fixed
+    # process or thread count.
+    def __init__(self, processes):
+        self.processes = processes
+        self.pool = self
+
+    def ThreadPool(self):
+        if self.processes is None:
+            return SerialPool()
+        return multiprocessing.pool.ThreadPool(self.processes)
+
+    def Pool(self, initializer=None, initargs=()):
+        if self.processes is None:
+            return SerialPool(initializer, initargs)
+        # Forked workers inherit the patched canvas size; spawned ones would re-import the defaults.
+        methods = multiprocessing.get_all_start_methods()
+        context = multiprocessing.get_context("fork" if "fork" in methods else None)
+        return context.Pool(self.processes, initializer, initargs)
+
+def count_calls(module, name):
+    counter = [0]
+    fn = getattr(module, name)
+
+    def counted(*args, **kwargs):
+        counter[0] += 1
+        return fn(*args, **kwargs)
+    setattr(module, name, counted)
+    return counter
+
+def run_canvas(module, renderer, case):
+    module.CANVAS_WIDTH = module.CANVAS_HEIGHT = case["size"]
+    if renderer["parallel"]:
+        module.mp = PoolShim(None if case["count"] else case["cores"])
+    counter = count_calls(module, renderer["counted"]) if case["count"] else None
+    options = {}
+    if "backend" in renderer:
+        options["backend"] = renderer["backend"]
+    if renderer.get("jit"):
+        options["use_jit"] = True
+        if module.jit.AVAILABLE:
+            # The compiled renderer runs on Numba threads rather than a process pool.
+            numba = module.jit.numba
+            numba.set_num_threads(min(case["cores"], numba.config.NUMBA_NUM_THREADS))
+        module.jit.warm_up()
+    start = time.perf_counter()
+    module.render_scene(**options)
+    wall = time.perf_counter() - start
+    return dict(width=case["size"], height=case["size"], primary_rays=case["size"] * case["size"],
+                total_rays=counter[0] if counter else None, wall_seconds=wall)
+
+def run_project1(module, renderer, case):
+    import numpy as np
+    import wavefront
+    width = case["size"]
+    height = width // 2
+    random.seed(case["seed"])
+    np.random.seed(case["seed"])
+    world = module.build_world(case["grid"])
+    cam = module.build_camera(width / height)
+    settings = module.RenderSettings(width, height, case["spp"], case["max_depth"], renderer["mode"])
+    primary = width * height * case["spp"]
+    if case["count"]:
+        # Tile-sized calls in this process, counting the rays handed to the intersector.
+        rays = [0]
+        if renderer["mode"] == "wavefront":
+            intersect = wavefront.intersect
+
+            def counted(scene, origins, *args):
+                rays[0] += len(origins)
+                return intersect(scene, origins, *args)
+            wavefront.intersect = counted
+        else:
+            hit = type(world).hit
+
+            def counted(self, *args):
+                rays[0] += 1
+                return hit(self, *args)
+            type(world).hit = counted
+        st = module.init_tile_state(cam, world, settings)
+        start = time.perf_counter()
+        for x0, y0, x1, y1 in module.make_tiles(width, height, case["tile_size"]):
+            module.render_tile(st, x0, y0, x1, y1)
+        wall = time.perf_counter() - start
+        return dict(width=width, height=height, primary_rays=primary, total_rays=rays[0], wall_seconds=wall)
+    if renderer.get("jit"):
+        module.jit.warm_up()
+    start = time.perf_counter()
+    module.render_tiles(cam, world, settings, case["tile_size"], case["cores"],
+                        backend=renderer.get("backend", "processes"))
+    wall = time.perf_counter() - start
+    return dict(width=width, height=height, primary_rays=primary, total_rays=None, wall_seconds=wall)
+
+def peak_rss_mb(who):
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS.
+    peak = resource.getrusage(who).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+def run_case(case):
+    renderer = RENDERERS[case["renderer"]]
+    sys.path.insert(0, os.path.join(REPO, renderer["directory"]))
+    module = importlib.import_module(renderer["module"])
+    with tempfile.TemporaryDirectory() as scratch:
+        # Renderers write their image to the working directory.
+        os.chdir(scratch)
+        if "mode" in renderer:
+            result = run_project1(module, renderer, case)
+        else:
+            result = run_canvas(module, renderer, case)
+        os.chdir(REPO)
+    result.update(peak_rss_mb=peak_rss_mb(resource.RUSAGE_SELF),
+                  peak_child_rss_mb=peak_rss_mb(resource.RUSAGE_CHILDREN))
+    return result
+
+# === DRIVER ===
+def spawn_case(case):
+    with tempfile.NamedTemporaryFile("r", suffix=".json") as out:
+        proc = subprocess.run([sys.executable, os.path.abspath(__file__), "--case", json.dumps(case),
+                               "--result-file", out.name],
+                              stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+        if proc.returncode != 0:
+            raise RuntimeError(f"{case['renderer']} at size {case['size']} failed:\n{proc.stderr}")
+        return json.load(out)
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], cwd=REPO, capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def run_benchmarks(args):
+    rows = []
+    for name in args.renderers:
+        renderer = RENDERERS[name]
+        cores = args.cores if renderer["parallel"] else [1]
+        for size in args.sizes:
+            base = dict(renderer=name, size=size, spp=args.spp, max_depth=args.max_depth, grid=args.grid,
+                        seed=args.seed, tile_size=args.tile_size)
+            total_rays = None
+            if not args.no_count and renderer.get("counted", True):
+                total_rays = spawn_case(dict(base, count=True, cores=1))["total_rays"]
+            for n in cores:
+                # Best of --repeat runs; peak RSS is the largest seen.
+                runs = [spawn_case(dict(base, count=False, cores=n)) for _ in range(args.repeat)]
+                best = min(runs, key=lambda r: r["wall_seconds"])
+                wall = best["wall_seconds"]
+                row = dict(renderer=name, width=best["width"], height=best["height"], cores=n,
+                           wall_seconds=wall, primary_rays=best["primary_rays"], total_rays=total_rays,
+                           primary_rays_per_sec=best["primary_rays"] / wall,
+                           total_rays_per_sec=total_rays / wall if total_rays is not None else None,
+                           peak_rss_mb=max(r["peak_rss_mb"] for r in runs),
+                           peak_child_rss_mb=max(r["peak_child_rss_mb"] for r in runs))
+                if "mode" in renderer:
+                    row.update(spp=args.spp, max_depth=args.max_depth, grid=args.grid)
+                rows.append(row)
+                print_row(row)
+    return rows
+
+def row_key(row):
+    return row["renderer"], row["width"], row["height"], row["cores"]
+
+def print_row(row, baseline=None):
+    total = row["total_rays_per_sec"]
+    line = (f"{row['renderer']:<26} {row['width']:>5}x{row['height']:<5} {row['cores']:>3} cores "
+            f"{row['wall_seconds']:9.3f}s {row['primary_rays_per_sec']:12,.0f} prim/s "
+            f"{total if total is not None else float('nan'):12,.0f} rays/s "
+            f"{row['peak_rss_mb']:8.1f} MB (+{row['peak_child_rss_mb']:.1f} MB children)")
+    if baseline is not None:
+        change = baseline["wall_seconds"] / row["wall_seconds"] - 1
+        line += f"  {change:+.1%} vs baseline" + ("  REGRESSION" if change < -REGRESSION_THRESHOLD else "")
+    print(line, flush=True)
+
+def compare_backends(rows):
+    # Wall time of every -threads case against its process-pool twin at the same size and core count.
+    by_key = {row_key(r): r for r in rows}
+    lines = []
+    for row in rows:
+        name = row["renderer"]
+        if not name.endswith("-threads"):
+            continue
+        twin = by_key.get((name[:-len("-threads")],) + row_key(row)[1:])
+        if twin is not None:
+            lines.append(f"{name:<26} {row['width']:>5}x{row['height']:<5} {row['cores']:>3} cores "
+                         f"{row['wall_seconds']:9.3f}s vs {twin['wall_seconds']:9.3f}s processes  "
+                         f"{twin['wall_seconds'] / row['wall_seconds']:5.2f}x")
+    if lines:
+        print("\nThread backend against the process pool:")
+        print("\n".join(lines))
+
+# A case is flagged when it is this much slower than the baseline file.
+REGRESSION_THRESHOLD = 0.10
+
+def compare(rows, baseline_path):
+    with open(baseline_path) as f:
+        baseline = {row_key(r): r for r in json.load(f)["results"]}
+    print(f"\nCompared with {baseline_path}:")
+    regressions = 0
+    for row in rows:
+        old = baseline.get(row_key(row))
+        if old is None:
+            continue
+        print_row(row, old)
+        regressions += old["wall_seconds"] / row["wall_seconds"] - 1 < -REGRESSION_THRESHOLD
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark every Python renderer in the repository.")
+    parser.add_argument("--renderers", nargs="+", choices=sorted(RENDERERS), default=sorted(RENDERERS))
+    parser.add_argument("--sizes", nargs="+", type=int, default=[64, 128],
+                        help="image widths (canvas renderers are square, Project_1 is width x width/2)")
+    parser.add_argument("--cores", nargs="+", type=int, default=sorted({1, os.cpu_count() or 1}),
+                        help="process or thread counts to time the parallel renderers with")
+    parser.add_argument("--repeat", type=int, default=1, help="time every case this many times and keep the best")
+    parser.add_argument("--spp", type=int, default=4, help="Project_1 samples per pixel")
+    parser.add_argument("--max-depth", type=int, default=8, help="Project_1 maximum bounces")
+    parser.add_argument("--grid", type=int, default=11, help="Project_1 random sphere field size")
+    parser.add_argument("--seed", type=int, default=415, help="seed for Project_1's random scene")
+    parser.add_argument("--tile-size", type=int, default=16)
+    parser.add_argument("--no-count", action="store_true", help="skip the ray counting pass (no total rays/sec)")
+    parser.add_argument("--output", default="benchmark_results.json")
+    parser.add_argument("--baseline", default=None, help="earlier results file to compare wall times against")
+    parser.add_argument("--case", help=argparse.SUPPRESS)
+    parser.add_argument("--result-file", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.case:
+        result = run_case(json.loads(args.case))
+        with open(args.result_file, "w") as f:
+            json.dump(result, f)
+        return
+
+    rows = run_benchmarks(args)
+    compare_backends(rows)
+    # False on a free-threaded (no-GIL) build running without the GIL.
+    gil_enabled = sys._is_gil_enabled() if hasattr(sys, "_is_gil_enabled") else True
+    report = dict(commit=git_commit(), timestamp=time.strftime("%Y-%m-%dT%H:%M:%S"),
+                  python=platform.python_version(), gil_enabled=gil_enabled, platform=platform.platform(),
+                  cpu_count=os.cpu_count(), results=rows)
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"\nWrote {args.output}")
+    if args.baseline and compare(rows, args.baseline):
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
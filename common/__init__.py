@@ -0,0 +1,5 @@
+# === SHARED MODULES ===
+# Code used by more than one renderer: scene_file (scene files and their sidecar
+# cache), instrument (the opt-in --profile counters and timers) and png_stream
+# (band-at-a-time PNG output). Each renderer puts the repository root on sys.path
+# and imports what it needs from this package.
@@ -0,0 +1,185 @@
+import json
+import os
+import pickle
+import re
+import time
+from collections import defaultdict
+
+# === OPT-IN INSTRUMENTATION ===
+# Stage timers and counters are installed by wrapping the registered functions
+# when enable() is called, so a disabled run executes the original, unwrapped
+# code. The few counters that live inside hot loops are guarded by a single
+# `if instrument.ENABLED` check. Pool tasks are run through task(), which
+# returns the worker's counters with the result; a Profile in the parent merges
+# them per worker and exports a summary table or Chrome trace-event JSON
+# (chrome://tracing, ui.perfetto.dev).
+
+ENABLED = False
+counters = defaultdict(int)
+stage_seconds = defaultdict(float)
+stage_calls = defaultdict(int)
+
+# (owner, attribute, stage, counter, weight) for every function to wrap.
+_targets = []
+# (owner, attribute, original) for every function wrapped by enable().
+_patched = []
+
+def register(owner, name, stage=None, counter=None, weight=None):
+    # Times owner.name as `stage` and/or adds weight(*args) (default 1) to `counter` on every call.
+    _targets.append((owner, name, stage, counter, weight))
+
+def _wrap(fn, stage, counter, weight):
+    perf_counter = time.perf_counter
+    if stage is None:
+        def counted(*args, **kwargs):
+            counters[counter] += weight(*args) if weight else 1
+            return fn(*args, **kwargs)
+        return counted
+
+    def timed(*args, **kwargs):
+        if counter is not None:
+            counters[counter] += weight(*args) if weight else 1
+        start = perf_counter()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            stage_seconds[stage] += perf_counter() - start
+            stage_calls[stage] += 1
+    return timed
+
+def enable():
+    global ENABLED
+    if ENABLED:
+        return
+    ENABLED = True
+    for owner, name, stage, counter, weight in _targets:
+        original = getattr(owner, name)
+        _patched.append((owner, name, original))
+        setattr(owner, name, _wrap(original, stage, counter, weight))
+
+def disable():
+    global ENABLED
+    ENABLED = False
+    while _patched:
+        owner, name, original = _patched.pop()
+        setattr(owner, name, original)
+
+def reset():
+    counters.clear()
+    stage_seconds.clear()
+    stage_calls.clear()
+
+def count(name, n=1):
+    counters[name] += n
+
+def snapshot():
+    return dict(counters=dict(counters), stage_seconds=dict(stage_seconds), stage_calls=dict(stage_calls))
+
+# === POOL TASKS ===
+def task(fn, *args):
+    # Runs fn(*args) instrumented in a pool worker and returns (result, record), where the
+    # record holds this task's counters, its wall-clock span and the size of its pickled result.
+    enable()
+    reset()
+    start = time.time()
+    result = fn(*args)
+    end = time.time()
+    pickle_start = time.perf_counter()
+    result_bytes = len(pickle.dumps(result, protocol=pickle.HIGHEST_PROTOCOL))
+    record = snapshot()
+    record.update(pid=os.getpid(), name=fn.__name__, start=start, end=end, result_bytes=result_bytes,
+                  pickle_seconds=time.perf_counter() - pickle_start)
+    return result, record
+
+# === AGGREGATION AND EXPORT ===
+def natural_key(item):
+    # Sorts "rays at depth 10" after "rays at depth 9".
+    return [int(part) if part.isdigit() else part for part in re.split(r"(\d+)", item[0])]
+
+class Profile:
+    def __init__(self):
+        self.records = []
+        self.start = time.time()
+        self.end = None
+
+    def add(self, result, record):
+        # Called in the parent as each task comes back; returns the task's own result.
+        record["received"] = time.time()
+        self.records.append(record)
+        return result
+
+    def finish(self):
+        # Also folds in whatever ran in this process (e.g. a serial render).
+        self.end = time.time()
+        if counters or stage_seconds:
+            local = snapshot()
+            local.update(pid=os.getpid(), name="main", start=self.start, end=self.end, result_bytes=0,
+                         pickle_seconds=0.0, received=self.end)
+            self.records.append(local)
+
+    def totals(self):
+        total = dict(counters=defaultdict(int), stage_seconds=defaultdict(float), stage_calls=defaultdict(int))
+        for record in self.records:
+            for key in ("counters", "stage_seconds", "stage_calls"):
+                for name, value in record[key].items():
+                    total[key][name] += value
+            if record["name"] != "main":
+                total["stage_seconds"]["pool transfer"] += max(record["received"] - record["end"], 0.0)
+                total["stage_calls"]["pool transfer"] += 1
+                total["stage_seconds"]["result pickling"] += record["pickle_seconds"]
+                total["stage_calls"]["result pickling"] += 1
+                total["counters"]["result bytes"] += record["result_bytes"]
+        return total
+
+    def per_worker(self):
+        workers = defaultdict(lambda: dict(tasks=0, busy_seconds=0.0, counters=defaultdict(int)))
+        for record in self.records:
+            worker = workers[record["pid"]]
+            worker["tasks"] += 1
+            worker["busy_seconds"] += record["end"] - record["start"]
+            for name, value in record["counters"].items():
+                worker["counters"][name] += value
+        return workers
+
+    def summary(self):
+        wall = (self.end or time.time()) - self.start
+        total = self.totals()
+        lines = [f"Wall time: {wall:.3f}s", "",
+                 f"{'Stage':<24} {'Calls':>12} {'Total s':>10} {'Mean us':>10} {'% wall':>8}"]
+        for stage, seconds in sorted(total["stage_seconds"].items(), key=lambda item: -item[1]):
+            calls = total["stage_calls"][stage]
+            lines.append(f"{stage:<24} {calls:>12,} {seconds:>10.3f} {1e6 * seconds / max(calls, 1):>10.2f} "
+                         f"{100 * seconds / max(wall, 1e-9):>7.1f}%")
+        lines += ["", f"{'Counter':<24} {'Count':>16}"]
+        for name, value in sorted(total["counters"].items(), key=natural_key):
+            lines.append(f"{name:<24} {value:>16,}")
+        lines += ["", f"{'Worker':<10} {'Tasks':>8} {'Busy s':>10} {'Counters'}"]
+        for pid, worker in sorted(self.per_worker().items()):
+            counts = sorted(worker["counters"].items(), key=natural_key)
+            listed = ", ".join(f"{name}={value:,}" for name, value in counts)
+            lines.append(f"{pid:<10} {worker['tasks']:>8} {worker['busy_seconds']:>10.3f} {listed}")
+        return "\n".join(lines)
+
+    def chrome_trace(self):
+        # One complete ("X") event per task on its worker's track, one per pool transfer on the
+        # parent's track, and the per-task counters and stage times as event args.
+        parent = os.getpid()
+        events = [dict(name="process_name", ph="M", pid=parent, args=dict(name="main"))]
+        for pid in sorted(self.per_worker()):
+            if pid != parent:
+                events.append(dict(name="process_name", ph="M", pid=pid, args=dict(name=f"worker {pid}")))
+        for record in self.records:
+            events.append(dict(name=record["name"], cat="task", ph="X", pid=record["pid"], tid=0,
+                               ts=1e6 * (record["start"] - self.start), dur=1e6 * (record["end"] - record["start"]),
+                               args=dict(counters=record["counters"], stage_seconds=record["stage_seconds"],
+                                         result_bytes=record["result_bytes"])))
+            if record["name"] != "main":
+                events.append(dict(name="pool transfer", cat="transfer", ph="X", pid=parent, tid=1,
+                                   ts=1e6 * (record["end"] - self.start),
+                                   dur=1e6 * max(record["received"] - record["end"], 0.0),
+                                   args=dict(result_bytes=record["result_bytes"])))
+        return dict(traceEvents=events, displayTimeUnit="ms")
+
+    def write_chrome_trace(self, path):
+        with open(path, "w") as f:
+            json.dump(self.chrome_trace(), f)
@@ -0,0 +1,78 @@
+import os
+import struct
+import zlib
+import numpy as np
+
+# === STREAMING PNG OUTPUT ===
+# Writes an 8-bit RGB PNG a band of rows at a time, top row first. Rows are
+# deflated as they arrive and every band ends in a zlib sync flush, written
+# out as its own IDAT chunk. Memory use therefore does not grow with the image
+# size, and a crash leaves a truncated PNG that still decodes up to the last
+# finished band (e.g. Pillow with ImageFile.LOAD_TRUNCATED_IMAGES). The image
+# is written to <path>.partial and renamed to <path> once the last row is in.
+
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+# Rows per IDAT chunk; a crash loses at most this many finished rows.
+BAND_ROWS = 16
+
+class PNGStreamWriter:
+    def __init__(self, path, width, height, band_rows=BAND_ROWS, level=6):
+        self.path = path
+        self.partial = path + ".partial"
+        self.width = width
+        self.height = height
+        self.band_rows = band_rows
+        self.rows_written = 0
+        self.pending = []
+        self.compressor = zlib.compressobj(level)
+        self.file = open(self.partial, "wb")
+        self.file.write(PNG_SIGNATURE)
+        # 8-bit samples, colour type 2 (RGB), deflate, adaptive filtering, no interlace.
+        self._chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0))
+
+    def _chunk(self, kind, data):
+        self.file.write(struct.pack(">I", len(data)) + kind + data)
+        self.file.write(struct.pack(">I", zlib.crc32(data, zlib.crc32(kind)) & 0xFFFFFFFF))
+
+    def write_rows(self, rows):
+        # rows: (n, width, 3) uint8, continuing from the last row written.
+        rows = np.asarray(rows, dtype=np.uint8).reshape(-1, self.width * 3)
+        if self.rows_written + len(rows) > self.height:
+            raise ValueError(f"{self.path}: more than {self.height} rows written")
+        self.rows_written += len(rows)
+        # Sub filter: each byte minus the same channel of the pixel to its left.
+        filtered = np.empty((len(rows), 1 + self.width * 3), dtype=np.uint8)
+        filtered[:, 0] = 1
+        filtered[:, 1:4] = rows[:, :3]
+        np.subtract(rows[:, 3:], rows[:, :-3], out=filtered[:, 4:])
+        self.pending.append(filtered.tobytes())
+        if sum(len(p) for p in self.pending) >= self.band_rows * filtered.shape[1]:
+            self.flush()
+
+    def flush(self):
+        # Pushes the pending rows to disk as a complete, decodable IDAT chunk.
+        data = self.compressor.compress(b"".join(self.pending)) + self.compressor.flush(zlib.Z_SYNC_FLUSH)
+        self.pending = []
+        if data:
+            self._chunk(b"IDAT", data)
+        self.file.flush()
+
+    def close(self):
+        if self.rows_written != self.height:
+            raise ValueError(f"{self.path}: {self.rows_written} of {self.height} rows written")
+        self._chunk(b"IDAT", self.compressor.compress(b"".join(self.pending)) + self.compressor.flush())
+        self.pending = []
+        self._chunk(b"IEND", b"")
+        self.file.close()
+        os.replace(self.partial, self.path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            # Keep what was rendered: flush the finished rows and leave <path>.partial behind.
+            self.flush()
+            self.file.close()
@@ -0,0 +1,196 @@
+import hashlib
+import json
+import os
+import pickle
+import random
+import struct
+import sys
+
+# === DECLARATIVE SCENE FILES ===
+# A scene is a JSON file with a camera, named materials, lights and objects
+# (spheres, cylinders, OBJ references and seeded random sphere fields). Every
+# renderer in the repository loads it with load() and maps the plain dicts onto
+# its own classes, ignoring what it cannot draw. Expensive results derived from
+# a scene -- parsed OBJ geometry, built acceleration structures -- are stored
+# by cached() in a binary sidecar next to the scene file, keyed by a hash of
+# the scene, every referenced OBJ file and the renderer's source.
+
+FORMAT_VERSION = 1
+CACHE_MAGIC = b"SCNCACHE"
+CACHE_SUFFIX = ".scenecache"
+
+# Whitted defaults for materials that only give path-tracing parameters.
+DEFAULT_SPECULAR = -1
+DEFAULT_REFLECTIVE = 0.0
+
+# === LOADING ===
+def read(path):
+    # The scene JSON as written, with objects not yet expanded.
+    with open(path) as f:
+        scene = json.load(f)
+    version = scene.get("version", FORMAT_VERSION)
+    if version != FORMAT_VERSION:
+        raise ValueError(f"{path}: unsupported scene format version {version}")
+    scene.setdefault("objects", [])
+    scene.setdefault("lights", [])
+    scene.setdefault("camera", {})
+    return scene
+
+def load(path):
+    # Returns the scene with named materials resolved, OBJ paths made absolute
+    # and random sphere fields expanded into plain spheres.
+    return expand(read(path), path)
+
+def expand(scene, path):
+    base = os.path.dirname(os.path.abspath(path))
+    materials = scene.get("materials", {})
+    objects = []
+    for obj in scene["objects"]:
+        kind = obj.get("type")
+        if kind == "random_spheres":
+            objects.extend(random_spheres(obj.get("grid", 11), obj.get("seed", 0)))
+            continue
+        if kind not in ("sphere", "cylinder", "obj"):
+            raise ValueError(f"{path}: unknown object type {kind!r}")
+        obj = dict(obj, material=resolve_material(materials, obj.get("material"), path))
+        if kind == "obj":
+            obj["path"] = os.path.join(base, obj["path"])
+        objects.append(obj)
+    return dict(scene, objects=objects)
+
+def resolve_material(materials, material, path):
+    # Objects name a material from the "materials" table or give one inline.
+    if material is None:
+        return {"type": "lambertian", "albedo": [0.5, 0.5, 0.5]}
+    if isinstance(material, str):
+        if material not in materials:
+            raise ValueError(f"{path}: unknown material {material!r}")
+        return materials[material]
+    return material
+
+def random_spheres(grid, seed):
+    # The Project_1 sphere field (small spheres on a 2*grid x 2*grid lattice), drawn from a seeded generator.
+    rng = random.Random(seed)
+
+    def color(lo=0.0, hi=1.0):
+        return [rng.uniform(lo, hi) for _ in range(3)]
+    spheres = []
+    for a in range(-grid, grid):
+        for b in range(-grid, grid):
+            choose_mat = rng.uniform(0, 1)
+            center = [a + 0.9 * rng.uniform(0, 1), 0.2, b + 0.9 * rng.uniform(0, 1)]
+            if (center[0] - 4) ** 2 + center[2] ** 2 <= 0.81:
+                continue
+            if choose_mat < 0.8:
+                albedo = [x * y for x, y in zip(color(), color())]
+                material = {"type": "lambertian", "albedo": albedo}
+            elif choose_mat < 0.95:
+                albedo = color(0.5, 1)
+                material = {"type": "metal", "albedo": albedo, "fuzz": rng.uniform(0, 0.5)}
+            else:
+                material = {"type": "dielectric", "ref_idx": 1.5}
+            spheres.append({"type": "sphere", "center": center, "radius": 0.2, "material": material})
+    return spheres
+
+def supported(scene, kinds, renderer):
+    # The scene's objects that this renderer can draw; the others are reported once per type and skipped.
+    skipped = sorted({obj["type"] for obj in scene["objects"] if obj["type"] not in kinds})
+    for kind in skipped:
+        print(f"warning: {renderer} cannot draw {kind} objects; skipping them", file=sys.stderr)
+    return [obj for obj in scene["objects"] if obj["type"] in kinds]
+
+# === CAMERA AND MATERIAL VIEWS ===
+def whitted_view(scene, canvas_width, canvas_height, background):
+    # Canvas and viewport settings for the Whitted-style renderers, falling back to the
+    # renderer's own defaults: (canvas width, canvas height, viewport width, viewport height,
+    # projection plane distance, background colour, camera position). These renderers
+    # always look down +z from the camera position.
+    camera = scene["camera"]
+    canvas = scene.get("canvas", {})
+    viewport = camera.get("viewport", [1, 1])
+    position = camera.get("position", camera.get("lookfrom", [0, 0, 0]))
+    return (canvas.get("width", canvas_width), canvas.get("height", canvas_height), viewport[0], viewport[1],
+            camera.get("projection_plane_d", 1), tuple(scene.get("background", background)), position)
+
+def whitted_material(material):
+    # (color 0-255, specular exponent, reflectivity) for the Whitted-style renderers.
+    if "color" in material:
+        color = tuple(int(c) for c in material["color"])
+    else:
+        color = tuple(min(255, int(255 * c)) for c in material.get("albedo", [1.0, 1.0, 1.0]))
+    return color, material.get("specular", DEFAULT_SPECULAR), material.get("reflective", DEFAULT_REFLECTIVE)
+
+def path_material(material):
+    # (type, parameters) for the path tracer; Whitted-only materials become diffuse.
+    kind = material.get("type")
+    if kind == "metal":
+        return "metal", dict(albedo=material["albedo"], fuzz=material.get("fuzz", 0.0))
+    if kind == "dielectric":
+        return "dielectric", dict(ref_idx=material["ref_idx"])
+    if "albedo" in material:
+        return "lambertian", dict(albedo=material["albedo"])
+    return "lambertian", dict(albedo=[c / 255 for c in material.get("color", [128, 128, 128])])
+
+# === CONTENT HASH AND SIDECAR CACHE ===
+def content_hash(path, scene, tag, extra=(), sources=()):
+    # Hash of the scene text, every referenced OBJ file, the renderer tag, extra
+    # build parameters and the given source files, so any change forces a rebuild.
+    base = os.path.dirname(os.path.abspath(path))
+    digest = hashlib.sha256()
+    digest.update(f"{FORMAT_VERSION}:{tag}:{json.dumps(list(extra))}".encode())
+    with open(path, "rb") as f:
+        digest.update(f.read())
+    models = [os.path.join(base, obj["path"]) for obj in scene["objects"] if obj.get("type") == "obj"]
+    for filename in models + list(sources):
+        with open(filename, "rb") as f:
+            digest.update(hashlib.sha256(f.read()).digest())
+    return digest.digest()
+
+def cache_path(path, tag):
+    return f"{path}.{tag}{CACHE_SUFFIX}"
+
+def read_cache(filename, key):
+    # Returns the cached payload, or None if the sidecar is missing, stale or unreadable.
+    try:
+        with open(filename, "rb") as f:
+            header = f.read(len(CACHE_MAGIC) + 32 + 8)
+            if len(header) != len(CACHE_MAGIC) + 40 or header[:len(CACHE_MAGIC)] != CACHE_MAGIC:
+                return None
+            if header[len(CACHE_MAGIC):len(CACHE_MAGIC) + 32] != key:
+                return None
+            (size,) = struct.unpack("<Q", header[-8:])
+            data = f.read(size)
+            if len(data) != size:
+                return None
+            return pickle.loads(data)
+    except (OSError, pickle.UnpicklingError, EOFError, AttributeError, ImportError):
+        return None
+
+def write_cache(filename, key, payload):
+    # Layout: magic, 32-byte key, payload length (little-endian u64), pickled payload.
+    # Written to a temporary file first so a crash never leaves a torn sidecar.
+    data = pickle.dumps(payload, protocol=pickle.HIGHEST_PROTOCOL)
+    tmp = f"{filename}.{os.getpid()}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(CACHE_MAGIC + key + struct.pack("<Q", len(data)))
+        f.write(data)
+    os.replace(tmp, filename)
+
+def cached(path, tag, build, extra=(), sources=(), use_cache=True):
+    # Returns (scene, build(expanded scene)), reusing the sidecar when its key still matches.
+    # On a cache hit the objects are never expanded, so the returned scene is only meant
+    # for the camera, lights and settings; build() must derive everything it needs from objects.
+    scene = read(path)
+    if not use_cache:
+        return scene, build(expand(scene, path))
+    key = content_hash(path, scene, tag, extra, sources)
+    filename = cache_path(path, tag)
+    payload = read_cache(filename, key)
+    if payload is None:
+        payload = build(expand(scene, path))
+        try:
+            write_cache(filename, key, payload)
+        except OSError:
+            # A read-only scene directory only costs the rebuild next time.
+            pass
+    return scene, payload